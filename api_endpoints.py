@@ -1,15 +1,36 @@
 import asyncio
+import json
 import os
-import re
-from fastapi import FastAPI, HTTPException, Response, Body
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from fastapi import FastAPI, HTTPException, Request, Response, Body, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Optional
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Callable, List, Optional
 from pydantic import BaseModel, ValidationError
-import pdfkit
-import markdown as md
 
+from pdf_renderer import pdf_renderer
+from executors import ExecutorSaturated, WorkloadExecutor, llm_executor, search_executor
+from singleflight import prefetch, start_prefetching
+from deadline import DeadlineExceeded, REQUEST_DEADLINE, request_budget, start_deadline, timed_out_stages, within_deadline
+from ranking import PARETO_PRUNING, RANKING_MODE, prune_flights, prune_hotels, rank_flights, rank_hotels
+from jobs import JOB_DEADLINE, JOB_RETRY_AFTER, JobQueueFull, job_queue
+from fare_calendar import build_fare_calendar, calendar_dates, fill_fare_calendar
+from metrics import (
+    PROMETHEUS_CONTENT_TYPE,
+    render_metrics,
+    request_latency,
+    server_timing_header,
+    start_request_timings,
+    timed
+)
 from common import (
     AIResponse, 
+    BatchSearchRequest,
+    FareCalendar,
+    FareCalendarRequest,
+    FlightInfo,
     FlightRequest, 
     HotelRequest,
     HotelsGrouped, 
@@ -26,14 +47,78 @@ from common import (
     search_flights, 
     search_google_hotels, 
     search_booking_hotels, 
+    search_hedged_hotels,
+    hotel_hedge_stats,
+    serpapi_breaker,
+    apify_breaker,
+    llm_breaker,
     strip_code_fence,
-    plan_trip_agent
+    plan_trip_agent,
+    search_cache,
+    search_singleflight,
+    llm_cache,
+    llm_cache_bypass,
+    get_apify_client,
+    close_apify_client,
+    get_serpapi_client,
+    close_serpapi_client,
+    load_llm,
+    preload_dependencies,
+    APIFY_API_KEY,
+    SERP_API_KEY,
+    HOTEL_SEARCH_CONCURRENCY,
+    STARTUP_WARMUP,
+    TRIP_PLAN_STREAMING,
+    BATCH_MAX_TRIPS,
+    BATCH_SEARCH_CONCURRENCY
 )
 
 # ==============================================
 # 🚀 Initialize FastAPI
 # ==============================================
-app = FastAPI(title="Travel Planning API", version="1.1.0")
+async def warm_up():
+    """
+    Startup warm-up, run in the background so the server accepts requests right away:
+    import the lazily loaded dependencies on the pools that use them, then build the LLM,
+    the Apify client and the PDF workers. Failures are logged; the first request retries.
+    """
+    start = time.perf_counter()
+    steps = {
+        "llm": load_llm(),
+        "dependencies": search_executor.run(preload_dependencies),
+        "pdf": pdf_renderer.warm_up()
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Warm-up of {step} failed: {str(result)}")
+    if APIFY_API_KEY:
+        try:
+            await get_apify_client()
+        except Exception as e:
+            logger.warning(f"Warm-up of the Apify client failed: {str(e)}")
+    logger.info(f"Warm-up finished in {time.perf_counter() - start:.2f}s")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared upstream clients live for the whole application so connections are reused
+    if SERP_API_KEY:
+        get_serpapi_client()
+    warm_up_task = asyncio.create_task(warm_up()) if STARTUP_WARMUP else None
+    job_queue.start()
+    yield
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    await job_queue.stop()
+    await close_apify_client()
+    await close_serpapi_client()
+    pdf_renderer.shutdown()
+    search_executor.shutdown()
+    llm_executor.shutdown()
+
+
+app = FastAPI(title="Travel Planning API", version="1.1.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -43,33 +128,143 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def llm_cache_control(request: Request, call_next):
+    """Per-request opt-out of the LLM response cache via `Cache-Control: no-cache`."""
+    if "no-cache" in request.headers.get("cache-control", "").lower():
+        llm_cache_bypass.set(True)
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    """Per-request time budget: REQUEST_DEADLINE seconds, or less via `X-Request-Deadline`."""
+    start_deadline(request_budget(request.headers.get("x-request-deadline")))
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Record request latency and attach a per-stage Server-Timing header to the response."""
+    timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    request_latency.observe(
+        elapsed,
+        method=request.method,
+        path=getattr(route, "path", "unmatched"),
+        status=response.status_code
+    )
+    # Streaming responses have already started, so their header only covers stages done before the first byte
+    response.headers["Server-Timing"] = server_timing_header(timings, total=elapsed)
+    return response
+
+# ==============================================
+# 📡 Stage Events (used by streaming endpoints)
+# ==============================================
+# Set by a streaming endpoint for the duration of one pipeline run; tasks created
+# by the pipeline inherit it. When unset, emit_event is a no-op.
+_event_sink: ContextVar[Optional[Callable[[str, dict], None]]] = ContextVar("event_sink", default=None)
+
+
+# ==============================================
+# 🚦 Admission Control
+# ==============================================
+def admission(*pools: WorkloadExecutor):
+    """
+    Route dependency: answer 503 with Retry-After right away when a workload pool the route
+    needs already has a full queue, instead of letting the request wait behind it.
+    Only applies to HTTP requests; jobs and internal calls queue as usual.
+    """
+    async def check():
+        for pool in pools:
+            try:
+                pool.check_admission()
+            except ExecutorSaturated as e:
+                raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return Depends(check)
+
+
+SEARCH_ADMISSION = admission(search_executor)
+LLM_ADMISSION = admission(llm_executor)
+SEARCH_AND_LLM_ADMISSION = admission(search_executor, llm_executor)
+PDF_ADMISSION = admission(pdf_renderer.executor)
+
+
+def emit_event(event: str, data: dict):
+    """Publish a pipeline stage result to the current event sink, if any."""
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event, data)
+
+
+def to_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
 # ==============================================
 # 🚀 API Endpoints
 # ==============================================
-@app.post("/search_flights/", response_model=AIResponse)
-async def get_flight_recommendations(flight_request: FlightRequest):
-    """Search flights and get AI recommendation."""
+async def find_flights(flight_request: FlightRequest) -> List[FlightInfo]:
+    """Search flights; raises HTTPException when the search fails or finds nothing."""
     try:
-        # Search for flights
-        flights = await search_flights(flight_request)
+        with timed("flight_search"):
+            flights = await within_deadline("flight_search", search_flights(flight_request))
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="Flight search timed out")
 
-        # Handle errors
-        if isinstance(flights, dict) and "error" in flights:
-            raise HTTPException(status_code=400, detail=flights["error"])
+    # Handle errors
+    if isinstance(flights, dict) and "error" in flights:
+        raise HTTPException(status_code=400, detail=flights["error"])
+
+    if not flights:
+        raise HTTPException(status_code=404, detail="No flights found")
 
-        if not flights:
-            raise HTTPException(status_code=404, detail="No flights found")
+    if PARETO_PRUNING:
+        flights = prune_flights(flights)
 
-        # Format flight data for AI
-        flights_text = format_travel_data("flights", flights)
+    emit_event("flights", {"flights": [flight.model_dump() for flight in flights]})
+    return flights
 
-        # Get AI recommendation
-        ai_recommendation = await get_ai_recommendation("flights", flights_text)
+
+async def recommend_flights(flights: List[FlightInfo]) -> str:
+    """AI recommendation for the flights; in RANKING_MODE=score it explains the top-ranked combination."""
+    # Format flight data for AI
+    flights_text = format_travel_data("flights", flights)
+
+    # Get AI recommendation
+    with timed("flight_recommendation"):
+        if RANKING_MODE == "score":
+            dep_idx, ret_idx = rank_flights(flights)
+            recommendation = get_ai_recommendation(
+                "flights", flights_text, selected=f"Departure Flight {dep_idx + 1} with Return Flight {ret_idx + 1}"
+            )
+        else:
+            recommendation = get_ai_recommendation("flights", flights_text)
+        try:
+            ai_recommendation = await within_deadline("flight_recommendation", recommendation)
+        except DeadlineExceeded:
+            ai_recommendation = "Flight recommendation timed out."
+    emit_event("flight_recommendation", {"recommendation": ai_recommendation})
+    return ai_recommendation
+
+
+@app.post("/search_flights/", response_model=AIResponse, dependencies=[SEARCH_AND_LLM_ADMISSION])
+async def get_flight_recommendations(flight_request: FlightRequest):
+    """Search flights and get AI recommendation."""
+    try:
+        flights = await find_flights(flight_request)
+        ai_recommendation = await recommend_flights(flights)
 
         # Return response
         return AIResponse(
             flights=flights,
-            ai_flight_recommendation=ai_recommendation
+            ai_flight_recommendation=ai_recommendation,
+            timed_out_stages=timed_out_stages()
         )
     except HTTPException:
         # Re-raise HTTP exceptions to preserve status codes
@@ -79,54 +274,159 @@ async def get_flight_recommendations(flight_request: FlightRequest):
         raise HTTPException(status_code=500, detail=f"Flight search error: {str(e)}")
 
 
-@app.post("/search_hotels/", response_model=AIResponse)
+@app.post("/fare_calendar/", response_model=FareCalendar, dependencies=[SEARCH_ADMISSION])
+async def get_fare_calendar(req: FareCalendarRequest):
+    """
+    Cheapest round-trip price for every outbound/return date pair within ±N days of the
+    requested dates (no AI recommendation). Cells already in the search cache cost nothing.
+    """
+    calendar_dates(req)
+    try:
+        with timed("fare_calendar"):
+            cells = [cell async for cell in fill_fare_calendar(req)]
+        return build_fare_calendar(req, cells)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Fare calendar error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Fare calendar error: {str(e)}")
+
+
+@app.post("/fare_calendar/stream", dependencies=[SEARCH_ADMISSION])
+async def fare_calendar_stream(req: FareCalendarRequest):
+    """
+    Streaming variant of /fare_calendar/ (Server-Sent Events): one `cell` event per
+    date pair as soon as it is filled (cached cells first, cheapest first), then `done`
+    with the full FareCalendar, or `error`.
+    """
+    calendar_dates(req)
+
+    async def event_stream():
+        cells = []
+        try:
+            async for cell in fill_fare_calendar(req):
+                cells.append(cell)
+                yield to_sse("cell", cell.model_dump())
+            yield to_sse("done", build_fare_calendar(req, cells).model_dump())
+        except Exception as e:
+            logger.exception(f"Fare calendar stream error: {str(e)}")
+            yield to_sse("error", {"status_code": 500, "detail": str(e)})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+def hotel_search_function(hotel_provider: str):
+    """Hotel search for the configured HOTEL_PROVIDER ("google", "booking" or "hedged")."""
+    if hotel_provider == "hedged":
+        return search_hedged_hotels
+    return search_google_hotels if hotel_provider == "google" else search_booking_hotels
+
+
+def start_hotel_pipelines(hotel_request: List[HotelRequest]):
+    """
+    Start one search task and one recommendation task per location. Each location's AI
+    recommendation starts as soon as its own search is done; only the provider searches
+    are throttled (HOTEL_SEARCH_CONCURRENCY). Returns [(search_task, recommendation_task)].
+    """
+    hotel_provider = os.getenv("HOTEL_PROVIDER", "booking").lower()
+    search_hotels = hotel_search_function(hotel_provider)
+    semaphore = asyncio.Semaphore(HOTEL_SEARCH_CONCURRENCY.get(hotel_provider, 1))
+
+    async def fetch(req):
+        async with semaphore:
+            with timed("hotel_search"):
+                return await search_hotels(req)
+
+    async def search(idx, req):
+        try:
+            hotels = await within_deadline("hotel_search", fetch(req))
+        except DeadlineExceeded:
+            raise HTTPException(status_code=504, detail=f"Hotel search timed out for {req.location}")
+
+        # Handle errors
+        if isinstance(hotels, dict) and "error" in hotels:
+            raise HTTPException(status_code=400, detail=hotels["error"])
+        if not hotels:
+            raise HTTPException(status_code=404, detail="No hotels found")
+
+        if PARETO_PRUNING:
+            hotels = prune_hotels(hotels)
+
+        emit_event("hotels", {
+            "index": idx,
+            "location": req.location,
+            "check_in_date": req.check_in_date,
+            "check_out_date": req.check_out_date,
+            "hotels": [hotel.model_dump() for hotel in hotels]
+        })
+        return hotels
+
+    async def recommend(idx, req, search_task):
+        hotels = await search_task
+        hotels_text = format_travel_data("hotels", hotels)
+        with timed("hotel_recommendation"):
+            if RANKING_MODE == "score":
+                recommendation = get_ai_recommendation(
+                    "hotels", hotels_text, selected=f"Hotel {rank_hotels(hotels) + 1}"
+                )
+            else:
+                recommendation = get_ai_recommendation("hotels", hotels_text)
+            try:
+                ai_recommendation = await within_deadline("hotel_recommendation", recommendation)
+            except DeadlineExceeded:
+                ai_recommendation = "Hotel recommendation timed out."
+        emit_event("hotel_recommendation", {"index": idx, "location": req.location, "recommendation": ai_recommendation})
+        return ai_recommendation
+
+    pipelines = []
+    for idx, req in enumerate(hotel_request):
+        search_task = asyncio.create_task(search(idx, req))
+        pipelines.append((search_task, asyncio.create_task(recommend(idx, req, search_task))))
+    return pipelines
+
+
+def cancel_hotel_pipelines(pipelines):
+    for search_task, recommendation_task in pipelines:
+        search_task.cancel()
+        recommendation_task.cancel()
+
+
+def group_hotels(hotel_request: List[HotelRequest], hotel_lists) -> List[HotelsGrouped]:
+    return [
+        HotelsGrouped(
+            location=req.location,
+            check_in_date=req.check_in_date,
+            check_out_date=req.check_out_date,
+            hotels=hotels
+        ) for req, hotels in zip(hotel_request, hotel_lists)
+    ]
+
+
+@app.post("/search_hotels/", response_model=AIResponse, dependencies=[SEARCH_AND_LLM_ADMISSION])
 async def get_hotel_recommendations(hotel_request: Optional[List[HotelRequest]] = Body(default=None)):
     """Search hotels and get AI recommendation."""
     try:
         if not hotel_request or len(hotel_request) == 0:
             raise HTTPException(status_code=400, detail="No hotel requests provided")
-        # Run hotel searches for each location
-        hotel_provider = os.getenv("HOTEL_PROVIDER", "booking").lower()
-        semaphore = asyncio.Semaphore(1)  # Limit to 1 concurrent search
-
-        async def search_one(req):
-            async with semaphore:
-                if hotel_provider == "google":
-                    return await search_google_hotels(req)
-                else:
-                    return await search_booking_hotels(req)
 
-        # Launch all searches, but only 1 run at a time
-        hotels_results = await asyncio.gather(*(search_one(req) for req in hotel_request))
+        pipelines = start_hotel_pipelines(hotel_request)
+        try:
+            ai_hotel_recommendations = list(await asyncio.gather(*(reco for _, reco in pipelines)))
+        except Exception:
+            cancel_hotel_pipelines(pipelines)
+            raise
 
-        if not hotels_results:
-            raise HTTPException(status_code=404, detail="No hotels found")
-        
-        # Format hotel data for AI and get recommendations for each location
-        ai_hotel_recommendations = []
-        all_hotels = []
-        hotels_grouped = []
-        for idx, hotels in enumerate(hotels_results):
-            # Handle errors
-            if isinstance(hotels, dict) and "error" in hotels:
-                raise HTTPException(status_code=400, detail=hotels["error"])
-            if not hotels:
-                raise HTTPException(status_code=404, detail="No hotels found")
-            hotels_grouped.append(HotelsGrouped(
-                location=hotel_request[idx].location,
-                check_in_date=hotel_request[idx].check_in_date,
-                check_out_date=hotel_request[idx].check_out_date,
-                hotels=hotels
-            ))
-            all_hotels.extend(hotels)
-            hotels_text = format_travel_data("hotels", hotels)
-            ai_hotel_recommendations.append(await get_ai_recommendation("hotels", hotels_text))
+        hotels_grouped = group_hotels(hotel_request, [search.result() for search, _ in pipelines])
 
         # Return response
         return AIResponse(
-            hotels=all_hotels,
+            hotels=[hotel for group in hotels_grouped for hotel in group.hotels],
             hotels_grouped=hotels_grouped,
-            ai_hotel_recommendations=ai_hotel_recommendations
+            ai_hotel_recommendations=ai_hotel_recommendations,
+            timed_out_stages=timed_out_stages()
         )
     except HTTPException:
         # Re-raise HTTP exceptions to preserve status codes
@@ -136,7 +436,133 @@ async def get_hotel_recommendations(hotel_request: Optional[List[HotelRequest]]
         raise HTTPException(status_code=500, detail=f"Hotel search error: {str(e)}")
 
 
-@app.post("/complete_search/", response_model=AIResponse)
+async def build_itinerary(flight_request, flights, dep_idx, ret_idx, hotels_grouped, hotel_indices,
+                          special_instructions=None, day_plan=None):
+    """Generate the itinerary from the selected departure/return flight and one selected hotel per location."""
+    # Select the recommended departure and return flight
+    selected_flight = None
+    selected_return_flight = None
+    if flights and 0 <= dep_idx < len(flights):
+        selected_flight = flights[dep_idx]
+        if selected_flight.return_flights and 0 <= ret_idx < len(selected_flight.return_flights):
+            selected_return_flight = selected_flight.return_flights[ret_idx]
+    if selected_flight:
+        flight_info = [selected_flight]
+        if selected_return_flight:
+            # Replace return_flights with only the selected one for formatting
+            flight_info[0] = flight_info[0].model_copy(update={"return_flights": [selected_return_flight]})
+        selected_flights_text = format_selected_travel_data("flights", flight_info)
+    else:
+        selected_flights_text = format_travel_data("flights", flights[:1])
+
+    # Collect the recommended hotel of each group as (hotel, check_in, check_out, location)
+    recommended_hotels = []
+    for hotels_group, hotel_idx in zip(hotels_grouped, hotel_indices):
+        if not hotels_group.hotels:
+            continue
+        recommended_hotels.append({
+            "hotel": hotels_group.hotels[hotel_idx if 0 <= hotel_idx < len(hotels_group.hotels) else 0],
+            "check_in": hotels_group.check_in_date,
+            "check_out": hotels_group.check_out_date,
+            "location": hotels_group.location
+        })
+
+    selected_hotels_text = format_selected_travel_data("hotels", recommended_hotels)
+
+    # Generate itinerary using only the recommended options
+    itinerary = ""
+    if selected_flight and recommended_hotels:
+        try:
+            with timed("itinerary"):
+                itinerary = await within_deadline("itinerary", generate_itinerary(
+                    destination=flight_request.destination,
+                    flights_text=selected_flights_text,
+                    hotels_text=selected_hotels_text,
+                    check_in_date=flight_request.outbound_date,
+                    check_out_date=flight_request.return_date,
+                    special_instructions=special_instructions,
+                    day_plan=day_plan
+                ))
+        except DeadlineExceeded:
+            return ""
+        emit_event("itinerary", {"itinerary": itinerary})
+    return itinerary
+
+
+async def recommend_flights_after(flight_search: asyncio.Task) -> str:
+    return await recommend_flights(await flight_search)
+
+
+async def ranked_travel_search(flight_request, hotel_request, special_instructions=None, day_plan=None):
+    """
+    RANKING_MODE=score: the scoring engine picks the flight and hotels as soon as the
+    searches return, so the itinerary is generated in parallel with the AI recommendations
+    instead of after them.
+    """
+    flight_search = asyncio.create_task(find_flights(flight_request))
+    flight_recommendation = asyncio.create_task(recommend_flights_after(flight_search))
+    hotel_pipelines = start_hotel_pipelines(hotel_request)
+
+    try:
+        flights, *hotel_lists = await asyncio.gather(
+            flight_search, *(search for search, _ in hotel_pipelines), return_exceptions=True
+        )
+        if isinstance(flights, Exception):
+            logger.error(f"Flight search failed: {str(flights)}")
+            flights = []
+        hotel_error = next((h for h in hotel_lists if isinstance(h, Exception)), None)
+        if hotel_error is not None:
+            # Same as the LLM path: one failed location drops all hotel results
+            logger.error(f"Hotel search failed: {str(hotel_error)}")
+            cancel_hotel_pipelines(hotel_pipelines)
+            hotels_grouped = []
+        else:
+            hotels_grouped = group_hotels(hotel_request, hotel_lists)
+
+        dep_idx, ret_idx = rank_flights(flights)
+        hotel_indices = [rank_hotels(group.hotels) for group in hotels_grouped]
+        itinerary, flight_reco, *hotel_recos = await asyncio.gather(
+            build_itinerary(flight_request, flights, dep_idx, ret_idx, hotels_grouped, hotel_indices,
+                            special_instructions=special_instructions, day_plan=day_plan),
+            flight_recommendation,
+            *(reco for _, reco in hotel_pipelines),
+            return_exceptions=True
+        )
+    except BaseException:
+        flight_search.cancel()
+        flight_recommendation.cancel()
+        cancel_hotel_pipelines(hotel_pipelines)
+        raise
+
+    if isinstance(itinerary, Exception):
+        raise itinerary
+    if isinstance(flight_reco, Exception):
+        flight_reco = "Could not retrieve flights." if not flights else "Unable to generate flights recommendation due to an error."
+    hotel_recos = [
+        "Unable to generate hotels recommendation due to an error." if isinstance(reco, BaseException) else reco
+        for reco in hotel_recos
+    ] if hotels_grouped else []
+    return AIResponse(
+        flights=flights,
+        hotels=[hotel for group in hotels_grouped for hotel in group.hotels],
+        hotels_grouped=hotels_grouped,
+        ai_flight_recommendation=flight_reco,
+        ai_hotel_recommendations=hotel_recos,
+        itinerary=itinerary,
+        timed_out_stages=timed_out_stages()
+    )
+
+
+def default_hotel_request(flight_request: FlightRequest) -> List[HotelRequest]:
+    """One hotel search at the flight destination for the whole stay."""
+    return [HotelRequest(
+        location=flight_request.destination,
+        check_in_date=flight_request.outbound_date,
+        check_out_date=flight_request.return_date
+    )]
+
+
+@app.post("/complete_search/", response_model=AIResponse, dependencies=[SEARCH_AND_LLM_ADMISSION])
 async def complete_travel_search(
     flight_request: FlightRequest,
     hotel_request: Optional[List[HotelRequest]] = Body(default=None),
@@ -150,11 +576,10 @@ async def complete_travel_search(
     try:
         # If hotel request is not provided, create one from flight request
         if not hotel_request:
-            hotel_request = [HotelRequest(
-                location=flight_request.destination,
-                check_in_date=flight_request.outbound_date,
-                check_out_date=flight_request.return_date
-            )]
+            hotel_request = default_hotel_request(flight_request)
+
+        if RANKING_MODE == "score":
+            return await ranked_travel_search(flight_request, hotel_request, special_instructions, day_plan)
 
         # Run flight and hotel searches concurrently
         flight_task = asyncio.create_task(get_flight_recommendations(flight_request))
@@ -172,60 +597,17 @@ async def complete_travel_search(
             logger.error(f"Hotel search failed: {str(hotel_results)}")
             hotel_results = AIResponse(hotels=[], ai_hotel_recommendation="Could not retrieve hotels.")
 
-        # --- NEW: Use only recommended flight/hotel for itinerary ---
+        # Use only the AI-recommended flight/hotels for the itinerary
         dep_idx, ret_idx = extract_recommended_flight_indices(flight_results.ai_flight_recommendation)
-
-        # Select the recommended departure and return flight
-        selected_flight = None
-        selected_return_flight = None
-        if flight_results.flights and 0 <= dep_idx < len(flight_results.flights):
-            selected_flight = flight_results.flights[dep_idx]
-            if selected_flight.return_flights and 0 <= ret_idx < len(selected_flight.return_flights):
-                selected_return_flight = selected_flight.return_flights[ret_idx]
-        if selected_flight:
-            flight_info = [selected_flight]
-            if selected_return_flight:
-                # Replace return_flights with only the selected one for formatting
-                flight_info[0] = flight_info[0].model_copy(update={"return_flights": [selected_return_flight]})
-            selected_flights_text = format_selected_travel_data("flights", flight_info)
-        else:
-            selected_flights_text = format_travel_data("flights", flight_results.flights[:1])
-
-        # --- NEW: Collect all recommended hotels from each group ---
-        # Instead of just a flat list, build a list of (hotel, check_in, check_out)
-        recommended_hotels = []
-        for idx, hotels_group in enumerate(hotel_results.hotels_grouped or []):
-            ai_reco = hotel_results.ai_hotel_recommendations[idx] if hotel_results.ai_hotel_recommendations and idx < len(hotel_results.ai_hotel_recommendations) else ""
-            hotel_idx = extract_recommended_hotel_index(ai_reco)
-            if hotels_group.hotels and 0 <= hotel_idx < len(hotels_group.hotels):
-                recommended_hotels.append({
-                    "hotel": hotels_group.hotels[hotel_idx],
-                    "check_in": hotels_group.check_in_date,
-                    "check_out": hotels_group.check_out_date,
-                    "location": hotels_group.location
-                })
-            elif hotels_group.hotels:
-                recommended_hotels.append({
-                    "hotel": hotels_group.hotels[0],
-                    "check_in": hotels_group.check_in_date,
-                    "check_out": hotels_group.check_out_date,
-                    "location": hotels_group.location
-                })
-
-        selected_hotels_text = format_selected_travel_data("hotels", recommended_hotels)
-
-        # Generate itinerary using only the recommended options
-        itinerary = ""
-        if selected_flight and recommended_hotels:
-            itinerary = await generate_itinerary(
-                destination=flight_request.destination,
-                flights_text=selected_flights_text,
-                hotels_text=selected_hotels_text,
-                check_in_date=flight_request.outbound_date,
-                check_out_date=flight_request.return_date,
-                special_instructions=special_instructions,
-                day_plan=day_plan
-            )
+        ai_hotel_recommendations = hotel_results.ai_hotel_recommendations or []
+        hotel_indices = [
+            extract_recommended_hotel_index(ai_hotel_recommendations[idx] if idx < len(ai_hotel_recommendations) else "")
+            for idx in range(len(hotel_results.hotels_grouped or []))
+        ]
+        itinerary = await build_itinerary(
+            flight_request, flight_results.flights, dep_idx, ret_idx, hotel_results.hotels_grouped or [], hotel_indices,
+            special_instructions=special_instructions, day_plan=day_plan
+        )
 
         # Combine results
         return AIResponse(
@@ -234,24 +616,26 @@ async def complete_travel_search(
             hotels_grouped=hotel_results.hotels_grouped,
             ai_flight_recommendation=flight_results.ai_flight_recommendation,
             ai_hotel_recommendations=hotel_results.ai_hotel_recommendations,
-            itinerary=itinerary
+            itinerary=itinerary,
+            timed_out_stages=timed_out_stages()
         )
     except Exception as e:
         logger.exception(f"Complete travel search error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Travel search error: {str(e)}")
 
 
-@app.post("/generate_itinerary/", response_model=AIResponse)
+@app.post("/generate_itinerary/", response_model=AIResponse, dependencies=[LLM_ADMISSION])
 async def get_itinerary(itinerary_request: ItineraryRequest):
     """Generate an itinerary based on provided flight and hotel information."""
     try:
-        itinerary = await generate_itinerary(
-            destination=itinerary_request.destination,
-            flights_text=itinerary_request.flights,
-            hotels_text=itinerary_request.hotels,
-            check_in_date=itinerary_request.check_in_date,
-            check_out_date=itinerary_request.check_out_date
-        )
+        with timed("itinerary"):
+            itinerary = await generate_itinerary(
+                destination=itinerary_request.destination,
+                flights_text=itinerary_request.flights,
+                hotels_text=itinerary_request.hotels,
+                check_in_date=itinerary_request.check_in_date,
+                check_out_date=itinerary_request.check_out_date
+            )
 
         itinerary = strip_code_fence(itinerary)
 
@@ -268,38 +652,20 @@ class MarkdownToPdfRequest(BaseModel):
     markdown: str
     title: str = "Travel Itinerary"
 
-@app.post("/generate_pdf/")
-def generate_pdf(req: MarkdownToPdfRequest):
-    html_content = md.markdown(req.markdown, extensions=["extra", "smarty"])
-    html_content = re.sub(
-        r'([\U0001F300-\U0001FAFF\U00002600-\U000026FF\U00002700-\U000027BF\U0001F1E6-\U0001F1FF])',
-        r'<span class="emoji">\1</span>',
-        html_content
-    )
-    html_full = f"""
-    <html>
-    <head>
-      <meta charset="utf-8">
-      <title>{req.title}</title>
-      <link href="https://fonts.googleapis.com/css2?family=Noto+Emoji:wght@400" rel="stylesheet">
-      <style>
-        body {{ background: #fff; color: #222; font-family: Arial, sans-serif; margin: 2em; }}
-        /* Only apply Noto Emoji to emoji characters */
-        .emoji {{ font-family: 'Noto Emoji', Arial, sans-serif !important; }}
-      </style>
-    </head>
-    <body>{html_content}</body>
-    </html>
-    """
-    wkhtmltopdf_path = os.path.join(os.path.dirname(__file__), 'wkhtmltox', 'wkhtmltopdf.exe')
-    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
-    pdf = pdfkit.from_string(html_full, False, configuration=config)
+@app.post("/generate_pdf/", dependencies=[PDF_ADMISSION])
+async def generate_pdf(req: MarkdownToPdfRequest):
+    """Render itinerary markdown to PDF on the bounded PDF worker pool (cached per markdown + title)."""
+    try:
+        pdf = await pdf_renderer.render(req.markdown, req.title)
+    except Exception as e:
+        logger.exception(f"PDF generation error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"PDF generation error: {str(e)}")
     return Response(pdf, media_type="application/pdf", headers={
         "Content-Disposition": f"attachment; filename={req.title.replace(' ', '_')}.pdf"
     })
 
 
-@app.post("/plan_trip/", response_model=PlanTripResponse)
+@app.post("/plan_trip/", response_model=PlanTripResponse, dependencies=[LLM_ADMISSION])
 async def plan_trip(req: PlanTripRequest):
     """Generate an itinerary based on provided flight and hotel information."""
     try:
@@ -311,15 +677,29 @@ async def plan_trip(req: PlanTripRequest):
         raise HTTPException(status_code=500, detail=f"Plan trip error: {str(e)}")
 
 
-@app.post("/ai_travel_plan/", response_model=AIResponse)
+@app.post("/ai_travel_plan/", response_model=AIResponse, dependencies=[SEARCH_AND_LLM_ADMISSION])
 async def ai_travel_plan(req: PlanTripRequest):
     """
     One-stop endpoint: User provides city names, dates, instructions.
     Returns full AIResponse (flights, hotels, recommendations, itinerary).
     """
+    # Searches started while the plan is still streaming; step 3 reuses them
+    prefetched = start_prefetching() if TRIP_PLAN_STREAMING else None
+    hotel_provider = os.getenv("HOTEL_PROVIDER", "booking").lower()
+    hotel_semaphore = asyncio.Semaphore(HOTEL_SEARCH_CONCURRENCY.get(hotel_provider, 1))
+
+    def start_search(kind, value):
+        if kind == "flight":
+            prefetch(search_flights, FlightRequest(**value))
+        elif kind == "hotel_area":
+            prefetch(hotel_search_function(hotel_provider), HotelRequest(**value), semaphore=hotel_semaphore)
+
     try:
         # Step 1: Use AI agent to generate structured trip plan
-        trip_plan = await plan_trip_agent(req)
+        with timed("trip_plan"):
+            trip_plan = await within_deadline(
+                "trip_plan", plan_trip_agent(req, on_partial=start_search if prefetched is not None else None)
+            )
 
         # Step 1.5: Validate trip_plan as PlanTripResponse and check all fields
         try:
@@ -340,6 +720,7 @@ async def ai_travel_plan(req: PlanTripRequest):
 
         # Sort hotel_areas by check_in_date
         validated_trip.hotel_areas.sort(key=lambda x: x.get("check_in_date", ""))
+        emit_event("trip_plan", validated_trip.model_dump())
 
         # Step 2: Build FlightRequest and HotelRequest(s) for complete_search
         flight_req = FlightRequest(
@@ -366,7 +747,259 @@ async def ai_travel_plan(req: PlanTripRequest):
         )
 
         return ai_response
+    except DeadlineExceeded:
+        raise HTTPException(status_code=504, detail="AI Travel Plan timed out while planning the trip")
     except Exception as e:
         logger.exception(f"AI Travel Plan error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI Travel Plan error: {str(e)}")
+    finally:
+        # Speculative searches the final plan did not use (or a failed plan) are stopped
+        for task in (prefetched or {}).values():
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()
+
+
+@app.post("/ai_travel_plan/stream", dependencies=[SEARCH_AND_LLM_ADMISSION])
+async def ai_travel_plan_stream(req: PlanTripRequest):
+    """
+    Streaming variant of /ai_travel_plan/ (Server-Sent Events).
+    Emits `trip_plan`, `flights`, `hotels` (per location), `flight_recommendation`,
+    `hotel_recommendation` (per location) and `itinerary` events as each stage
+    completes, then `done` with the full AIResponse, or `error` with a detail message.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_pipeline():
+        _event_sink.set(lambda event, data: queue.put_nowait((event, data)))
+        try:
+            result = await ai_travel_plan(req)
+            queue.put_nowait(("done", result.model_dump()))
+        except HTTPException as e:
+            queue.put_nowait(("error", {"status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.exception(f"AI Travel Plan stream error: {str(e)}")
+            queue.put_nowait(("error", {"status_code": 500, "detail": str(e)}))
+
+    async def event_stream():
+        # The pipeline runs in its own task so its context (and event sink) is isolated
+        pipeline = asyncio.create_task(run_pipeline())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield to_sse(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            # Client went away (or we finished): stop any remaining work
+            pipeline.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+# ==============================================
+# 📦 Batch Quotes
+# ==============================================
+def prefetch_trip_searches(trips, semaphore: asyncio.Semaphore):
+    """
+    Start every distinct flight and hotel search of the batch once, limited by `semaphore`.
+    Trips with the same route and dates (or hotel location and stay) share one search.
+    Returns the number of distinct (flight, hotel) searches and each trip's search tasks.
+    """
+    search_hotels = hotel_search_function(os.getenv("HOTEL_PROVIDER", "booking").lower())
+    flight_searches, hotel_searches, trip_searches = set(), set(), []
+    for trip in trips:
+        flight = prefetch(search_flights, trip.flight_request, semaphore)
+        hotels = [
+            prefetch(search_hotels, req, semaphore)
+            for req in trip.hotel_request or default_hotel_request(trip.flight_request)
+        ]
+        flight_searches.add(flight)
+        hotel_searches.update(hotels)
+        trip_searches.append([flight, *hotels])
+    return len(flight_searches), len(hotel_searches), trip_searches
+
+
+@app.post("/batch_search/", dependencies=[SEARCH_AND_LLM_ADMISSION])
+async def batch_travel_search(batch: BatchSearchRequest):
+    """
+    /complete_search/ for many trips at once (Server-Sent Events).
+    Identical flight and hotel searches across trips run once, and at most
+    BATCH_SEARCH_CONCURRENCY searches run at a time. Emits `batch` with the number of
+    distinct searches, then `trip` ({index, result}) or `trip_error` ({index, status_code,
+    detail}) per trip as it finishes, then `done` with the counts (or `error`). A trip
+    with timed-out stages counts as partial.
+    """
+    if not batch.trips:
+        raise HTTPException(status_code=400, detail="No trips provided")
+    if len(batch.trips) > BATCH_MAX_TRIPS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_TRIPS} trips per batch")
+
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def run_trip(index, trip, searches):
+        # Every trip gets its own budget, started once its searches got through the batch's
+        # concurrency limit, so time queued behind other trips is not charged to it
+        await asyncio.wait(searches)
+        start_deadline(REQUEST_DEADLINE)
+        try:
+            result = await complete_travel_search(
+                flight_request=trip.flight_request,
+                hotel_request=trip.hotel_request,
+                special_instructions=trip.special_instructions,
+                day_plan=trip.day_plan
+            )
+            queue.put_nowait(("trip", {"index": index, "result": result.model_dump()}))
+            return "partial" if result.timed_out_stages else "succeeded"
+        except HTTPException as e:
+            queue.put_nowait(("trip_error", {"index": index, "status_code": e.status_code, "detail": e.detail}))
+        except Exception as e:
+            logger.exception(f"Batch trip {index} error: {str(e)}")
+            queue.put_nowait(("trip_error", {"index": index, "status_code": 500, "detail": str(e)}))
+        return "failed"
+
+    async def run_batch():
+        prefetched = start_prefetching()
+        try:
+            flight_searches, hotel_searches, trip_searches = prefetch_trip_searches(
+                batch.trips, asyncio.Semaphore(BATCH_SEARCH_CONCURRENCY)
+            )
+            queue.put_nowait(("batch", {
+                "trips": len(batch.trips),
+                "flight_searches": flight_searches,
+                "hotel_searches": hotel_searches
+            }))
+            outcomes = await asyncio.gather(*(
+                run_trip(i, trip, searches) for i, (trip, searches) in enumerate(zip(batch.trips, trip_searches))
+            ))
+            queue.put_nowait(("done", {
+                "trips": len(batch.trips),
+                **{outcome: outcomes.count(outcome) for outcome in ("succeeded", "partial", "failed")}
+            }))
+        except Exception as e:
+            logger.exception(f"Batch search error: {str(e)}")
+            queue.put_nowait(("error", {"status_code": 500, "detail": str(e)}))
+        finally:
+            for task in prefetched.values():
+                task.cancel()
+
+    async def event_stream():
+        # The batch runs in its own task so its prefetched searches are only visible to its trips
+        runner = asyncio.create_task(run_batch())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield to_sse(event, data)
+                if event in ("done", "error"):
+                    break
+        finally:
+            # Client went away (or we finished): stop any remaining work
+            runner.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+# ==============================================
+# 🧵 Background Jobs
+# ==============================================
+def submit_job(kind: str, pipeline: Callable):
+    """Queue `pipeline()` as a background job whose stage events are kept as partial results."""
+    async def run(job):
+        _event_sink.set(job.record_event)
+        # The budget of the submitting request does not carry over to the queued job
+        start_deadline(JOB_DEADLINE)
+        return await pipeline()
+
+    try:
+        job = job_queue.submit(kind, run)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(JOB_RETRY_AFTER)})
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+
+@app.post("/jobs/ai_travel_plan/", status_code=202)
+async def submit_ai_travel_plan_job(req: PlanTripRequest):
+    """Queue /ai_travel_plan/ as a background job and return its id immediately."""
+    return submit_job("ai_travel_plan", lambda: ai_travel_plan(req))
+
+
+@app.post("/jobs/complete_search/", status_code=202)
+async def submit_complete_search_job(
+    flight_request: FlightRequest,
+    hotel_request: Optional[List[HotelRequest]] = Body(default=None),
+    special_instructions: Optional[str] = Body(default=None),
+    day_plan: Optional[list] = Body(default=None)
+):
+    """Queue /complete_search/ as a background job and return its id immediately."""
+    return submit_job("complete_search", lambda: complete_travel_search(
+        flight_request=flight_request,
+        hotel_request=hotel_request,
+        special_instructions=special_instructions,
+        day_plan=day_plan
+    ))
+
+
+@app.get("/jobs/")
+async def job_stats():
+    """Job queue counters (queued, running, retained, rejected, ...)."""
+    return job_queue.get_stats()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, since: int = 0):
+    """
+    Job status with the stage events recorded so far (same events as the streaming endpoint)
+    and, once finished, the result or error. Pass `since=<next_event>` to only get new events.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict(since=since)
+
+
+@app.get("/jobs/{job_id}/result", response_model=AIResponse)
+async def get_job_result(job_id: str):
+    """The job's final AIResponse; 202 while it is still queued or running, the job's error status if it failed."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error["status_code"], detail=job.error["detail"])
+    if not job.finished:
+        return JSONResponse(
+            status_code=202,
+            content={"job_id": job.id, "status": job.status},
+            headers={"Retry-After": str(JOB_RETRY_AFTER)}
+        )
+    return job.result
+
+
+@app.get("/cache_stats/")
+async def cache_stats():
+    """Hit/miss counters for the search and LLM caches and single-flight coalescing."""
+    return {
+        "search": search_cache.get_stats(),
+        "llm": llm_cache.get_stats(),
+        "singleflight": search_singleflight.get_stats(),
+        "hotel_hedging": dict(hotel_hedge_stats),
+        "breakers": {breaker.name: breaker.get_stats() for breaker in (serpapi_breaker, apify_breaker, llm_breaker)}
+    }
+
+
+@app.get("/executors/")
+async def executor_stats():
+    """Queue depth, running tasks, wait times and rejections of the search, LLM and PDF worker pools."""
+    return {pool.name: pool.get_stats() for pool in (search_executor, llm_executor, pdf_renderer.executor)}
+
 
+@app.get("/metrics")
+async def metrics():
+    """Per-stage and per-route latency histograms in Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -0,0 +1,139 @@
+"""
+Benchmark: per-call ApifyClientAsync vs the shared, pooled client.
+
+Runs `_fetch_apify_booking_search` against a local stand-in for the Apify API
+(actor run -> wait for finish -> dataset items). Each new TCP connection to the
+stand-in server pays an artificial setup delay to model the TLS handshake a
+real api.apify.com connection costs.
+
+Usage:
+    python benchmarks/bench_apify_client.py [--iterations 20] [--handshake-ms 30]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("APIFY_API_KEY", "benchmark-token")
+os.environ["SEARCH_CACHE_ENABLED"] = "false"
+
+from apify_client import ApifyClientAsync  # noqa: E402
+import common  # noqa: E402
+
+HOTEL_ITEMS = [
+    {"name": f"Hotel {i}", "address": f"{i} Beach Road", "price": 4000 + i * 10, "rating": 8.5, "url": "https://example.com"}
+    for i in range(5)
+]
+
+
+class StandInApifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    handshake_delay = 0.0
+    connections = 0
+
+    def setup(self):
+        # Called once per TCP connection: model the TLS handshake cost here
+        type(self).connections += 1
+        time.sleep(self.handshake_delay)
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        # POST /v2/acts/<actor>/runs -> started run
+        self._send_json({"data": {"id": "run1", "status": "RUNNING", "defaultDatasetId": "ds1"}})
+
+    def do_GET(self):
+        if "/datasets/" in self.path:
+            self._send_json(HOTEL_ITEMS, headers={
+                "x-apify-pagination-total": str(len(HOTEL_ITEMS)),
+                "x-apify-pagination-offset": "0",
+                "x-apify-pagination-count": str(len(HOTEL_ITEMS)),
+                "x-apify-pagination-limit": "1000",
+                "x-apify-pagination-desc": "",
+            })
+        else:
+            # GET /v2/actor-runs/<id>?waitForFinish=... -> finished run
+            self._send_json({"data": {"id": "run1", "status": "SUCCEEDED", "defaultDatasetId": "ds1"}})
+
+
+PARAMS = {"search": "Goa", "checkIn": "2025-01-10", "checkOut": "2025-01-12"}
+
+
+async def run_per_call(api_url, iterations):
+    """Old behaviour: a fresh client (and connection pool) for every search call."""
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        clients = [ApifyClientAsync("benchmark-token", api_url=api_url) for _ in range(2)]
+        await asyncio.gather(*(common._fetch_apify_booking_search(PARAMS, client) for client in clients))
+        timings.append(time.perf_counter() - start)
+        for client in clients:
+            await client.http_client.httpx_async_client.aclose()
+    return timings
+
+
+async def run_shared(api_url, iterations):
+    """New behaviour: one application-scoped client with a keep-alive pool."""
+    client = await common.create_apify_client(api_url=api_url)
+    timings = []
+    try:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            await asyncio.gather(*(common._fetch_apify_booking_search(PARAMS, client) for _ in range(2)))
+            timings.append(time.perf_counter() - start)
+    finally:
+        await client.http_client.httpx_async_client.aclose()
+    return timings
+
+
+def report(name, timings, connections):
+    print(
+        f"{name:<10} mean={statistics.mean(timings) * 1000:7.1f} ms  "
+        f"p50={statistics.median(timings) * 1000:7.1f} ms  "
+        f"max={max(timings) * 1000:7.1f} ms  connections={connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20, help="search_booking_hotels-sized batches (2 calls each)")
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="simulated per-connection setup cost")
+    args = parser.parse_args()
+
+    StandInApifyHandler.handshake_delay = args.handshake_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInApifyHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    print(f"{args.iterations} iterations x 2 Apify searches, {args.handshake_ms:.0f} ms simulated handshake\n")
+    try:
+        for name, runner in (("per-call", run_per_call), ("shared", run_shared)):
+            StandInApifyHandler.connections = 0
+            timings = asyncio.run(runner(api_url, args.iterations))
+            report(name, timings, StandInApifyHandler.connections)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
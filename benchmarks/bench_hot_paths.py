@@ -0,0 +1,210 @@
+"""
+Micro-benchmarks for the pure hot-path functions in common.py.
+
+Covers the SerpAPI flight conversion (build_flight_info / build_return_flight),
+the Booking.com dedupe + conversion (merge_booking_hotels), the LLM prompt
+formatters (format_travel_data, format_selected_travel_data) and the
+recommendation parsers (extract_recommended_*, strip_code_fence), plus the
+Pareto-front pruning in ranking.py (prune_flights, prune_hotels).
+
+Fixtures are synthetic and deterministic, in three sizes:
+    small   5 departures x 3 returns,    10 hotels
+    medium  50 departures x 5 returns,  100 hotels
+    large   300 departures x 10 returns, 1000 hotels
+
+For each function and size it reports ops/sec (best of --repeat timeit runs),
+the peak memory of a single call and the blocks still held by its result
+(tracemalloc), then compares ops/sec with the stored baseline.
+
+Usage:
+    python benchmarks/bench_hot_paths.py                  # compare with baseline
+    python benchmarks/bench_hot_paths.py --save-baseline  # record a new baseline
+    python benchmarks/bench_hot_paths.py --fail-on-regression --threshold 0.2
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import common  # noqa: E402
+import ranking  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_hot_paths.json")
+
+SIZES = {
+    "small": {"departures": 5, "returns": 3, "hotels": 10},
+    "medium": {"departures": 50, "returns": 5, "hotels": 100},
+    "large": {"departures": 300, "returns": 10, "hotels": 1000},
+}
+
+AIRPORTS = [("DEL", "Indira Gandhi International Airport"), ("BOM", "Chhatrapati Shivaji International Airport"),
+            ("GOI", "Dabolim Airport"), ("BLR", "Kempegowda International Airport")]
+
+RECOMMENDATION_TEXT = (
+    "Both options are good value, but the second departure has the shortest total duration.\n\n" * 20
+    + "Recommended Departure Flight: 2\nRecommended Return Flight: 3\nRecommended Hotel: 4\n"
+)
+
+
+def make_leg(i, j, origin, destination):
+    return {
+        "departure_airport": {"name": origin[1], "id": origin[0], "time": f"2025-01-10 {6 + j:02d}:{i % 60:02d}"},
+        "arrival_airport": {"name": destination[1], "id": destination[0], "time": f"2025-01-10 {8 + j:02d}:{i % 60:02d}"},
+        "airline": f"Airline {i % 7}",
+        "airline_logo": f"https://www.gstatic.com/flights/airline_logos/70px/A{i % 7}.png",
+        "travel_class": "Economy",
+        "flight_number": f"A{i % 7} {100 + i}",
+        "duration": 90 + (i * 7) % 120,
+    }
+
+
+def make_option(i, stops, reverse=False):
+    route = AIRPORTS[:stops + 2]
+    if reverse:
+        route = route[::-1]
+    option = {
+        "flights": [make_leg(i, j, route[j], route[j + 1]) for j in range(stops + 1)],
+        "layovers": [
+            {"name": route[j + 1][1], "id": route[j + 1][0], "duration": 45 + i % 90, "overnight": False}
+            for j in range(stops)
+        ],
+        "price": 4000 + (i * 37) % 9000,
+        "total_duration": 150 + (i * 13) % 400,
+    }
+    return option
+
+
+def make_fixtures(departures, returns, hotels):
+    raw_departures = [make_option(i, i % 3) for i in range(departures)]
+    raw_returns = [[make_option(i * 31 + k, k % 3, reverse=True) for k in range(returns)] for i in range(departures)]
+    # Two overlapping Booking.com result lists, like the Hostels + all-property searches
+    raw_hotels = [
+        {"name": f"Hotel {i}", "address": f"{i} Beach Road, Calangute", "price": 9000 + (i * 53) % 20000,
+         "rating": 7.5 + (i % 25) / 10, "url": f"https://www.booking.com/hotel/in/h{i}.html"}
+        for i in range(hotels)
+    ]
+    hotel_lists = [raw_hotels[:hotels // 4], raw_hotels]
+    flights = [
+        common.build_flight_info(dep, "2025-01-15", [common.build_return_flight(r) for r in rets])
+        for dep, rets in zip(raw_departures, raw_returns)
+    ]
+    hotel_infos = common.merge_booking_hotels(hotel_lists, 3)
+    selected_hotels = [
+        {"hotel": h, "check_in": "2025-01-10", "check_out": "2025-01-13", "location": "Calangute"}
+        for h in hotel_infos[:3]
+    ]
+    return {
+        "raw_departures": raw_departures,
+        "raw_returns": raw_returns,
+        "hotel_lists": hotel_lists,
+        "flights": flights,
+        "hotels": hotel_infos,
+        "selected_hotels": selected_hotels,
+        "itinerary": "```markdown\n" + "## Day 1\n- Beach walk 🌊\n" * max(1, hotels // 10) + "```",
+    }
+
+
+def cases(fx):
+    return {
+        "build_flight_info": lambda: [
+            common.build_flight_info(dep, "2025-01-15", [common.build_return_flight(r) for r in rets])
+            for dep, rets in zip(fx["raw_departures"], fx["raw_returns"])
+        ],
+        "merge_booking_hotels": lambda: common.merge_booking_hotels(fx["hotel_lists"], 3),
+        "format_travel_data[flights]": lambda: common.format_travel_data("flights", fx["flights"]),
+        "format_travel_data[hotels]": lambda: common.format_travel_data("hotels", fx["hotels"]),
+        "format_selected[flights]": lambda: common.format_selected_travel_data("flights", fx["flights"][:1]),
+        "format_selected[hotels]": lambda: common.format_selected_travel_data("hotels", fx["selected_hotels"]),
+        "extract_recommended": lambda: (
+            common.extract_recommended_flight_indices(RECOMMENDATION_TEXT),
+            common.extract_recommended_hotel_index(RECOMMENDATION_TEXT),
+        ),
+        "strip_code_fence": lambda: common.strip_code_fence(fx["itinerary"]),
+        "prune_flights": lambda: ranking.prune_flights(fx["flights"]),
+        "prune_hotels": lambda: ranking.prune_hotels(fx["hotels"]),
+    }
+
+
+def ops_per_sec(fn, repeat):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return number / best
+
+
+def allocations(fn):
+    tracemalloc.start()
+    try:
+        result = fn()  # noqa: F841 - keep the result alive so its blocks are counted
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    return peak, blocks
+
+
+def run(repeat):
+    results = {}
+    for size, dims in SIZES.items():
+        fx = make_fixtures(**dims)
+        for name, fn in cases(fx).items():
+            peak, blocks = allocations(fn)
+            results[f"{name}/{size}"] = {
+                "ops_per_sec": round(ops_per_sec(fn, repeat), 2),
+                "peak_bytes": peak,
+                "blocks": blocks,
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="timeit repeats; the best run is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed ops/sec drop vs baseline (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    results = run(args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    print(f"{'benchmark':<38}{'ops/sec':>12}{'baseline':>12}{'change':>9}{'peak KiB':>11}{'blocks':>9}")
+    for key, r in results.items():
+        base = baseline.get(key, {}).get("ops_per_sec")
+        change = ""
+        if base:
+            delta = r["ops_per_sec"] / base - 1
+            change = f"{delta:+.0%}"
+            if delta < -args.threshold:
+                regressions.append(key)
+                change += " !"
+        print(
+            f"{key:<38}{r['ops_per_sec']:>12,.0f}{base or 0:>12,.0f}{change:>9}"
+            f"{r['peak_bytes'] / 1024:>11.1f}{r['blocks']:>9}"
+        )
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold:.0%}: "
+              f"{', '.join(regressions)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: CrewAI Agent/Task/Crew path vs the direct LLM path (LLM_EXECUTION_MODE).
+
+Runs get_ai_recommendation (flights + hotels), generate_itinerary and
+plan_trip_agent in both modes with the LLM cache disabled.
+
+Offline (default): the LLM is replaced by a recorder that answers instantly, so
+wall time is pure framework overhead and the prompt size is exactly what each
+path would send (tokens estimated at ~4 characters per token).
+
+Live (--live): uses the real initialize_llm() model (needs GOOGLE_API_KEY) and
+reports end-to-end wall time plus the token usage reported by the LLM.
+
+Usage:
+    python benchmarks/bench_llm_paths.py [--iterations 20] [--live]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+
+from crewai.llms.base_llm import BaseLLM  # noqa: E402
+import common  # noqa: E402
+from common import FlightInfo, HotelInfo, PlanTripRequest  # noqa: E402
+
+TRIP_JSON = (
+    '{"origin": "DEL", "destination": "GOI", "outbound_date": "2025-01-10", "return_date": "2025-01-15", '
+    '"hotel_areas": [{"location": "Calangute", "check_in_date": "2025-01-10", "check_out_date": "2025-01-15"}], '
+    '"day_plan": [{"date": "2025-01-11", "activities": ["Beach"]}]}'
+)
+
+
+class RecordingLLM(BaseLLM):
+    """Offline stand-in: records the messages it receives and answers immediately."""
+
+    def __init__(self):
+        super().__init__(model="recording")
+        self.messages = []
+
+    def call(self, messages, *args, **kwargs):
+        self.messages.append(messages)
+        return TRIP_JSON
+
+    def supports_function_calling(self):
+        return False
+
+    def get_context_window_size(self):
+        return 1_000_000
+
+
+def sample_inputs():
+    flights = [
+        FlightInfo(
+            airline=f"Air {i}", price=5000 + i * 250, duration=150 + i * 10, stops="Nonstop",
+            departure="Indira Gandhi International Airport (DEL) at 2025-01-10 08:00",
+            arrival="Dabolim Airport (GOI) at 2025-01-10 10:30", travel_class="Economy",
+            return_date="2025-01-15", airline_logo="",
+            return_flights=[{
+                "airline": f"Air {i}", "price": 9000 + j * 300, "duration": 155, "stops": "Nonstop",
+                "departure": "Dabolim Airport (GOI) at 2025-01-15 18:00",
+                "arrival": "Indira Gandhi International Airport (DEL) at 2025-01-15 20:35",
+                "travel_class": "Economy"
+            } for j in range(3)]
+        ) for i in range(5)
+    ]
+    hotels = [
+        HotelInfo(name=f"Sea View {i}", price=3000 + i * 400, rating=8.0 + i / 10, location="Calangute, Goa", link="https://example.com")
+        for i in range(8)
+    ]
+    return common.format_travel_data("flights", flights), common.format_travel_data("hotels", hotels)
+
+
+def ai_calls():
+    flights_text, hotels_text = sample_inputs()
+    trip = PlanTripRequest(source_city="Delhi", destination_city="Goa", from_date="2025-01-10", return_date="2025-01-15")
+    return {
+        "flight recommendation": lambda: common.get_ai_recommendation("flights", flights_text, use_cache=False),
+        "hotel recommendation": lambda: common.get_ai_recommendation("hotels", hotels_text, use_cache=False),
+        "itinerary": lambda: common.generate_itinerary(
+            "Goa", flights_text[:400], hotels_text[:400], "2025-01-10", "2025-01-15", use_cache=False
+        ),
+        "trip plan": lambda: common.plan_trip_agent(trip, use_cache=False),
+    }
+
+
+def prompt_chars(messages):
+    if isinstance(messages, str):
+        return len(messages)
+    return sum(len(str(m.get("content", ""))) for m in messages)
+
+
+async def measure(call, iterations, llm, live):
+    timings = []
+    tokens = []
+    for _ in range(iterations):
+        if not live:
+            llm.messages.clear()
+        usage_before = llm.get_token_usage_summary().total_tokens if live else 0
+        start = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - start)
+        if live:
+            tokens.append(llm.get_token_usage_summary().total_tokens - usage_before)
+        else:
+            tokens.append(sum(prompt_chars(m) for m in llm.messages) // 4)
+    return timings, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--live", action="store_true", help="call the real Gemini model")
+    args = parser.parse_args()
+
+    llm = common.initialize_llm() if args.live else RecordingLLM()
+    label = "tokens" if args.live else "~prompt tokens"
+    print(f"{'live' if args.live else 'offline'} run, {args.iterations} iterations per function\n")
+    print(f"{'function':<24}{'mode':<8}{'mean ms':>10}{'p50 ms':>10}{label:>18}")
+
+    with patch.object(common, "initialize_llm", lambda: llm):
+        for name, call in ai_calls().items():
+            for mode in ("crew", "direct"):
+                with patch.object(common, "LLM_EXECUTION_MODE", mode):
+                    timings, tokens = asyncio.run(measure(call, args.iterations, llm, args.live))
+                print(
+                    f"{name:<24}{mode:<8}{statistics.mean(timings) * 1000:>10.2f}"
+                    f"{statistics.median(timings) * 1000:>10.2f}{statistics.mean(tokens):>18.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
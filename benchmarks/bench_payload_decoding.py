@@ -0,0 +1,247 @@
+"""
+CPU time and peak memory per search request of the raw payload conversion.
+
+Compares the single-pass decoder in common.py (build_flight_info /
+build_return_flight / decode_*_hotel) against the previous conversion kept
+below as `legacy_*`, which re-read the raw airport objects for every field and
+kept return_flights as unvalidated dicts (LegacyFlightInfo). The decoder
+validates every return option against ReturnFlightInfo, so its extra time is
+the price of typed return flights.
+
+One "request" converts everything a search request receives:
+    flights  the google_flights response plus one return response per departure
+    google   a google_hotels response
+    booking  the two Apify Booking.com result lists
+
+Payloads are the synthetic large fixtures of bench_hot_paths.py (300
+departures x 10 returns, 1000 hotels) unless captured ones are given:
+    --flights FILE   saved google_flights response (used for the return searches too)
+    --hotels FILE    saved google_hotels response
+    --booking FILE   saved Apify Booking.com dataset items (JSON list)
+
+Usage:
+    python benchmarks/bench_payload_decoding.py [--repeat 5] [--flights f.json] [--hotels h.json] [--booking b.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import common  # noqa: E402
+from typing import Optional  # noqa: E402
+from common import FlightInfo, HotelInfo  # noqa: E402
+from bench_hot_paths import SIZES, make_fixtures  # noqa: E402
+
+
+# ==============================================
+# 🐢 Previous conversion (reference)
+# ==============================================
+class LegacyFlightInfo(FlightInfo):
+    return_flights: Optional[list] = []
+
+
+def legacy_leg(leg):
+    return {
+        "departure_airport": f"{leg.get('departure_airport', {}).get('name', 'Unknown')} ({leg.get('departure_airport', {}).get('id', '???')})",
+        "departure_time": leg.get('departure_airport', {}).get('time', 'N/A'),
+        "arrival_airport": f"{leg.get('arrival_airport', {}).get('name', 'Unknown')} ({leg.get('arrival_airport', {}).get('id', '???')})",
+        "arrival_time": leg.get('arrival_airport', {}).get('time', 'N/A'),
+        "airline": leg.get("airline", "Unknown Airline"),
+        "airline_logo": leg.get("airline_logo", ""),
+        "travel_class": leg.get("travel_class", "Economy"),
+        "flight_number": leg.get("flight_number", ""),
+        "duration": int(leg.get("duration", 0))
+    }
+
+
+def legacy_layovers(option):
+    return [
+        {
+            "airport": lay.get("name", ""),
+            "airport_id": lay.get("id", ""),
+            "duration": int(lay.get("duration", 0)),
+            "overnight": lay.get("overnight", False)
+        } for lay in option.get("layovers", [])
+    ]
+
+
+def legacy_endpoints(option):
+    first, last = option["flights"][0], option["flights"][-1]
+    departure = (f"{first.get('departure_airport', {}).get('name', 'Unknown')} ({first.get('departure_airport', {}).get('id', '???')})"
+                 f" at {first.get('departure_airport', {}).get('time', 'N/A')}")
+    arrival = (f"{last.get('arrival_airport', {}).get('name', 'Unknown')} ({last.get('arrival_airport', {}).get('id', '???')})"
+               f" at {last.get('arrival_airport', {}).get('time', 'N/A')}")
+    return departure, arrival
+
+
+def legacy_return_flight(ret_flight):
+    departure, arrival = legacy_endpoints(ret_flight)
+    return {
+        "airline": ret_flight["flights"][0].get("airline", "Unknown Airline"),
+        "price": int(ret_flight.get("price", 0)),
+        "duration": int(ret_flight.get("total_duration", 0)),
+        "stops": "Nonstop" if len(ret_flight["flights"]) == 1 else f"{len(ret_flight['flights']) - 1} stop(s)",
+        "departure": departure,
+        "arrival": arrival,
+        "travel_class": ret_flight["flights"][0].get("travel_class", "Economy"),
+        "airline_logo": ret_flight["flights"][0].get("airline_logo", ""),
+        "legs": [legacy_leg(leg) for leg in ret_flight["flights"]],
+        "layovers": legacy_layovers(ret_flight)
+    }
+
+
+def legacy_flight_info(flight, return_date, return_flights):
+    departure, arrival = legacy_endpoints(flight)
+    first_leg = flight["flights"][0]
+    return LegacyFlightInfo(
+        airline=first_leg.get("airline", "Unknown Airline"),
+        price=int(flight.get("price", 0)),
+        duration=int(flight.get("total_duration", 0)),
+        stops="Nonstop" if len(flight["flights"]) == 1 else f"{len(flight['flights']) - 1} stop(s)",
+        departure=departure,
+        arrival=arrival,
+        travel_class=first_leg.get("travel_class", "Economy"),
+        return_date=return_date,
+        airline_logo=first_leg.get("airline_logo", ""),
+        legs=[legacy_leg(leg) for leg in flight["flights"]],
+        layovers=legacy_layovers(flight),
+        return_flights=return_flights
+    )
+
+
+def legacy_google_hotel(hotel):
+    return HotelInfo(
+        name=hotel.get("name", "Unknown Hotel"),
+        price=float(hotel.get("rate_per_night", {}).get("extracted_lowest", 0.0)),
+        rating=float(hotel.get("overall_rating", 0.0)),
+        location=hotel.get("location", "N/A"),
+        link=hotel.get("link", "N/A")
+    )
+
+
+def legacy_booking_hotels(result_lists, nights):
+    seen = set()
+    hotels = []
+    for results in result_lists:
+        for hotel in results:
+            key = (hotel.get("name", ""), hotel.get("address", ""))
+            if key in seen:
+                continue
+            seen.add(key)
+            hotels.append(HotelInfo(
+                name=hotel.get("name", "Unknown Hotel"),
+                price=round(float(hotel.get("price", 0.0)) / nights),
+                rating=float(hotel.get("rating", 0.0)),
+                location=hotel.get("address", "N/A"),
+                link=hotel.get("url", "N/A")
+            ))
+    return hotels
+
+
+# ==============================================
+# 📦 Payloads
+# ==============================================
+def load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def make_payloads(args):
+    fx = make_fixtures(**SIZES["large"])
+    if args.flights:
+        response = load_json(args.flights)
+        departures = [flight for flight in response.get("best_flights", []) if flight.get("flights")]
+        return_options = response.get("best_flights", []) or response.get("other_flights", [])
+        returns = [return_options for _ in departures]
+    else:
+        departures, returns = fx["raw_departures"], fx["raw_returns"]
+
+    if args.hotels:
+        properties = load_json(args.hotels).get("properties", [])
+    else:
+        properties = [
+            {"name": h["name"], "rate_per_night": {"extracted_lowest": h["price"] / 3}, "overall_rating": h["rating"] / 2,
+             "location": h["address"], "link": h["url"]}
+            for h in fx["hotel_lists"][1]
+        ]
+
+    if args.booking:
+        items = load_json(args.booking)
+        booking = [items[:len(items) // 4], items]
+    else:
+        booking = fx["hotel_lists"]
+    return departures, returns, properties, booking
+
+
+def cases(departures, returns, properties, booking):
+    return {
+        "flights": (
+            lambda: [
+                legacy_flight_info(dep, "2025-01-15", [legacy_return_flight(r) for r in rets])
+                for dep, rets in zip(departures, returns)
+            ],
+            lambda: [
+                common.build_flight_info(dep, "2025-01-15", [common.build_return_flight(r) for r in rets])
+                for dep, rets in zip(departures, returns)
+            ],
+        ),
+        "google": (
+            lambda: [legacy_google_hotel(hotel) for hotel in properties],
+            lambda: [common.decode_google_hotel(hotel) for hotel in properties],
+        ),
+        "booking": (
+            lambda: legacy_booking_hotels(booking, 3),
+            lambda: common.merge_booking_hotels(booking, 3),
+        ),
+    }
+
+
+def cpu_ms(fn, repeat):
+    """Best CPU time of `repeat` calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        fn()
+        best = min(best, time.process_time() - start)
+    return best * 1000
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    try:
+        result = fn()  # noqa: F841 - the result is part of what a request holds
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per conversion; the best CPU time is kept")
+    parser.add_argument("--flights", help="captured google_flights response (JSON)")
+    parser.add_argument("--hotels", help="captured google_hotels response (JSON)")
+    parser.add_argument("--booking", help="captured Apify Booking.com dataset items (JSON list)")
+    args = parser.parse_args()
+
+    payloads = make_payloads(args)
+    departures, returns, properties, booking = payloads
+    options = sum(1 + len(rets) for rets in returns)
+    print(f"Payload: {len(departures)} departures, {options} flight options, "
+          f"{len(properties)} google hotels, {sum(map(len, booking))} booking results\n")
+
+    print(f"{'request':<10}{'legacy ms':>11}{'decoder ms':>12}{'speedup':>9}{'legacy KiB':>12}{'decoder KiB':>13}")
+    for name, (legacy, decoder) in cases(*payloads).items():
+        legacy_ms, decoder_ms = cpu_ms(legacy, args.repeat), cpu_ms(decoder, args.repeat)
+        print(
+            f"{name:<10}{legacy_ms:>11.1f}{decoder_ms:>12.1f}{legacy_ms / decoder_ms:>8.1f}x"
+            f"{peak_kib(legacy):>12,.0f}{peak_kib(decoder):>13,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
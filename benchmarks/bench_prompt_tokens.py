@@ -0,0 +1,69 @@
+"""
+Token report: prompt size of the flight/hotel data in each prompt encoding.
+
+Formats the deterministic small/medium/large fixtures from bench_hot_paths.py
+(departures x returns, hotels) as markdown and compact, unlimited and with a
+token budget / top-K, and reports characters and tokens per variant.
+
+Tokens are estimated at ~4 characters per token (common.estimate_tokens).
+With --live they are counted by the Gemini tokenizer (needs GOOGLE_API_KEY).
+
+Usage:
+    python benchmarks/bench_prompt_tokens.py [--budget 1500] [--top-k 5] [--live]
+"""
+import os
+import sys
+import argparse
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import common  # noqa: E402
+from bench_hot_paths import SIZES, make_fixtures  # noqa: E402
+
+
+def gemini_counter():
+    import google.generativeai as genai
+    genai.configure(api_key=common.GEMINI_API_KEY)
+    model = genai.GenerativeModel(common.LLM_MODEL.split("/", 1)[-1])
+    return lambda text: model.count_tokens(text).total_tokens
+
+
+def variants(budget, top_k):
+    return [
+        ("markdown", {"style": "markdown", "token_budget": 0, "max_options": 0}),
+        ("compact", {"style": "compact", "token_budget": 0, "max_options": 0}),
+        (f"markdown top-{top_k}", {"style": "markdown", "token_budget": 0, "max_options": top_k}),
+        (f"compact top-{top_k}", {"style": "compact", "token_budget": 0, "max_options": top_k}),
+        (f"markdown budget {budget}", {"style": "markdown", "token_budget": budget, "max_options": 0}),
+        (f"compact budget {budget}", {"style": "compact", "token_budget": budget, "max_options": 0}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=1500, help="token budget per flight/hotel list")
+    parser.add_argument("--top-k", type=int, default=5, help="max departures, returns per departure and hotels")
+    parser.add_argument("--live", action="store_true", help="count tokens with the Gemini tokenizer")
+    args = parser.parse_args()
+
+    count = gemini_counter() if args.live else common.estimate_tokens
+    label = "tokens" if args.live else "~tokens"
+    print(f"{'fixture':<10}{'data':<9}{'encoding':<24}{'options':>9}{'chars':>10}{label:>10}{'vs md':>8}")
+    for size, dims in SIZES.items():
+        fx = make_fixtures(**dims)
+        for data_type, data in (("flights", fx["flights"]), ("hotels", fx["hotels"])):
+            baseline = None
+            for name, kwargs in variants(args.budget, args.top_k):
+                text = common.format_travel_data(data_type, data, **kwargs)
+                tokens = count(text)
+                baseline = baseline or tokens
+                options = sum(1 for line in text.splitlines() if line[:1].isdigit() or line.startswith("**"))
+                print(
+                    f"{size:<10}{data_type:<9}{name:<24}{options:>9}{len(text):>10,}{tokens:>10,}"
+                    f"{tokens / baseline:>8.0%}"
+                )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmark: SerpAPI searches in threads vs the native pooled async client.
+
+Runs waves of concurrent google_flights searches (like the return-flight
+fan-out of one flight search) against a local stand-in for the SerpAPI JSON
+endpoint that answers after --latency-ms. Each new TCP connection pays an
+artificial setup delay to model the TLS handshake to serpapi.com.
+
+    threaded  previous behaviour: requests.get (what GoogleSearch.get_dict()
+              does) in asyncio.to_thread, a new connection per search, limited
+              by the default executor's thread count
+    native    common._google_search on the shared httpx keep-alive pool
+
+Usage:
+    python benchmarks/bench_serpapi_client.py [--waves 5] [--concurrency 64] [--latency-ms 100] [--handshake-ms 30]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ["SEARCH_CACHE_ENABLED"] = "false"
+
+import common  # noqa: E402
+
+RESPONSE = json.dumps({
+    "best_flights": [{"price": 4000 + i, "total_duration": 130, "flights": [{"airline": "Air"}]} for i in range(20)]
+}).encode("utf-8")
+
+
+class StandInSerpApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    handshake_delay = 0.0
+    latency = 0.0
+    connections = 0
+
+    def setup(self):
+        # Called once per TCP connection: model the TLS handshake cost here
+        type(self).connections += 1
+        time.sleep(self.handshake_delay)
+        super().setup()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+
+class StandInServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops SYNs when a wave opens many connections at once (1s retransmits)
+    request_queue_size = 1024
+
+
+def params(i):
+    return {"engine": "google_flights", "departure_id": "DEL", "arrival_id": "BOM", "departure_token": str(i)}
+
+
+async def run_threaded(url, waves, concurrency):
+    def search(p):
+        return json.loads(requests.get(url, {**p, "output": "json"}, timeout=60).text)
+
+    timings = []
+    for _ in range(waves):
+        start = time.perf_counter()
+        await asyncio.gather(*(asyncio.to_thread(search, params(i)) for i in range(concurrency)))
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run_native(url, waves, concurrency):
+    timings = []
+    try:
+        for _ in range(waves):
+            start = time.perf_counter()
+            await asyncio.gather(*(common._google_search(params(i)) for i in range(concurrency)))
+            timings.append(time.perf_counter() - start)
+    finally:
+        await common.close_serpapi_client()
+    return timings
+
+
+def report(name, timings, concurrency, connections):
+    print(
+        f"{name:<10} mean={statistics.mean(timings) * 1000:7.1f} ms  "
+        f"p50={statistics.median(timings) * 1000:7.1f} ms  "
+        f"max={max(timings) * 1000:7.1f} ms  "
+        f"{concurrency / statistics.mean(timings):7.1f} searches/s  connections={connections}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--waves", type=int, default=5, help="batches of concurrent searches")
+    parser.add_argument("--concurrency", type=int, default=64, help="searches started at once per wave")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="simulated SerpAPI response time")
+    parser.add_argument("--handshake-ms", type=float, default=30.0, help="simulated per-connection setup cost")
+    args = parser.parse_args()
+
+    StandInSerpApiHandler.handshake_delay = args.handshake_ms / 1000
+    StandInSerpApiHandler.latency = args.latency_ms / 1000
+    server = StandInServer(("127.0.0.1", 0), StandInSerpApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/search"
+    common.SERPAPI_URL = url
+    common.SERPAPI_MAX_CONNECTIONS = max(common.SERPAPI_MAX_CONNECTIONS, args.concurrency)
+
+    print(f"{args.waves} waves x {args.concurrency} concurrent searches, {args.latency_ms:.0f} ms latency, "
+          f"{args.handshake_ms:.0f} ms simulated handshake, {min(32, (os.cpu_count() or 1) + 4)} executor threads\n")
+    try:
+        for name, runner in (("threaded", run_threaded), ("native", run_native)):
+            StandInSerpApiHandler.connections = 0
+            timings = asyncio.run(runner(url, args.waves, args.concurrency))
+            report(name, timings, args.concurrency, StandInSerpApiHandler.connections)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark: cold start of the API with eager vs lazy heavy imports.
+
+Each run starts a fresh interpreter (python -X importtime) that imports the app,
+enters its lifespan and serves one request (GET /cache_stats/) through the
+in-process test client. Reported per mode (median of --runs):
+
+    import times   cumulative import time of the app modules and heavy dependencies
+    app import     time to import api_endpoints (including the eager imports)
+    first request  wall time from process spawn to the first response
+    all loaded     wall time from spawn until the heavy dependencies are imported
+                   (lazy: by the first request that needs them, right after the
+                   first response; lazy+warmup: by the background warm-up)
+
+    eager          previous behaviour: crewai, apify_client, pdfkit and markdown
+                   imported up front, before the app (what importing common did)
+    lazy           heavy dependencies imported on first use, no warm-up
+    lazy+warmup    lazy, plus the background lifespan warm-up (STARTUP_WARMUP=true)
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MODULES = ["fastapi", "httpx", "common", "pdf_renderer", "api_endpoints", "crewai", "apify_client", "pdfkit", "markdown"]
+HEAVY_MODULES = ["crewai", "apify_client", "pdfkit", "markdown"]
+# Imported by the startup warm-up (markdown is only imported by the first render)
+WARMED_UP_MODULES = ["crewai", "apify_client", "pdfkit"]
+
+CHILD = """
+import sys, json, time
+spawned, eager = float(sys.argv[1]), sys.argv[2] == "eager"
+start = time.perf_counter()
+if eager:
+    for name in {heavy!r}:
+        __import__(name)
+from api_endpoints import app
+from fastapi.testclient import TestClient
+imported = time.perf_counter()
+with TestClient(app) as client:
+    client.get("/cache_stats/")
+    first_response = time.time()
+    if sys.argv[2] == "lazy+warmup":
+        while not all(name in sys.modules for name in {warmed_up!r}) and time.time() - first_response < 120:
+            time.sleep(0.01)
+    # Waits for imports still running on the warm-up's threads, or imports them now
+    for name in {heavy!r}:
+        __import__(name)
+    loaded = time.time()
+print(json.dumps({{
+    "app_import": imported - start, "first_request": first_response - spawned, "all_loaded": loaded - spawned
+}}))
+""".format(heavy=HEAVY_MODULES, warmed_up=WARMED_UP_MODULES)
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Cumulative import time (seconds) of MODULES from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] in MODULES and parts[2] not in times:
+            times[parts[2]] = int(parts[1]) / 1e6
+    return times
+
+
+def run_once(mode: str) -> dict:
+    env = {**os.environ, "STARTUP_WARMUP": "true" if mode == "lazy+warmup" else "false"}
+    spawned = time.time()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD, str(spawned), mode],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return {**json.loads(result.stdout.strip().splitlines()[-1]), **parse_importtime(result.stderr)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per mode")
+    args = parser.parse_args()
+
+    modes = ["eager", "lazy", "lazy+warmup"]
+    medians = {}
+    for mode in modes:
+        runs = [run_once(mode) for _ in range(args.runs)]
+        keys = {key for run in runs for key in run}
+        medians[mode] = {key: statistics.median(run.get(key, 0.0) for run in runs) for key in keys}
+
+    print(f"median of {args.runs} runs, seconds\n")
+    print(f"{'':<16}" + "".join(f"{mode:>14}" for mode in modes))
+    print("import times")
+    for name in MODULES:
+        print(f"  {name:<14}" + "".join(
+            f"{medians[mode][name]:>14.3f}" if name in medians[mode] else f"{'deferred':>14}" for mode in modes
+        ))
+    for key, label in (("app_import", "app import"), ("first_request", "first request"), ("all_loaded", "all loaded")):
+        print(f"{label:<16}" + "".join(f"{medians[mode][key]:>14.3f}" for mode in modes))
+
+
+if __name__ == "__main__":
+    main()
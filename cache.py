@@ -0,0 +1,233 @@
+import os
+import time
+import json
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================
+# 🗄️ Two-tier TTL Cache (memory LRU + SQLite)
+# ==============================================
+class TTLCache:
+    """
+    Two-tier TTL cache for JSON-serializable values.
+    - Tier 1: bounded in-memory LRU (per process)
+    - Tier 2: persistent SQLite file (shared across restarts/workers)
+    Entries older than their namespace TTL but younger than TTL + stale_ttl are
+    served stale while a background refresh repopulates them. Entries up to
+    fallback_ttl seconds older still are only served when a fetch fails (see get_or_fetch).
+    """
+
+    def __init__(self, path=None, max_entries=512, ttls=None, default_ttl=900, stale_ttl=0,
+                 enabled=True, table="cache", max_disk_entries=None, fallback_ttl=0, executor=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.fallback_ttl = fallback_ttl
+        self.enabled = enabled
+        self.table = table
+        # WorkloadExecutor for the SQLite tier; None = the loop's default executor
+        self.executor = executor
+        self._memory = OrderedDict()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._refreshing = set()
+        self._background_tasks = set()
+        self._writes = 0
+        self.stats = {}
+
+    # ---------- keys & stats ----------
+    @staticmethod
+    def make_key(namespace, params):
+        """Stable key from namespace + params (api_key is never part of the key)."""
+        if isinstance(params, dict):
+            params = {k: v for k, v in params.items() if k != "api_key"}
+        payload = json.dumps(params, sort_keys=True, default=str)
+        return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+    def ttl_for(self, namespace):
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _count(self, namespace, counter):
+        ns_stats = self.stats.setdefault(
+            namespace, {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "fallback_hits": 0, "misses": 0}
+        )
+        ns_stats[counter] += 1
+
+    def get_stats(self):
+        """Return hit/miss counters per namespace plus totals."""
+        totals = {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "fallback_hits": 0, "misses": 0}
+        for ns_stats in self.stats.values():
+            for counter, value in ns_stats.items():
+                totals[counter] += value
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._memory),
+            "totals": totals,
+            "namespaces": {ns: dict(values) for ns, values in self.stats.items()}
+        }
+
+    # ---------- memory tier ----------
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        return entry
+
+    def _memory_set(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    # ---------- disk tier ----------
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+        return self._db
+
+    def _disk_get(self, key):
+        with self._db_lock:
+            row = self._connect().execute(
+                f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_set(self, key, value, stored_at):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), stored_at)
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                # Periodically drop entries that can no longer be served (even stale)
+                max_age = max([self.default_ttl, *self.ttls.values()]) + self.stale_ttl + self.fallback_ttl
+                db.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - max_age,))
+            if self.max_disk_entries and self._writes % 10 == 0:
+                # Evict the oldest entries beyond the disk size bound
+                db.execute(
+                    f"DELETE FROM {self.table} WHERE key NOT IN "
+                    f"(SELECT key FROM {self.table} ORDER BY stored_at DESC LIMIT ?)",
+                    (self.max_disk_entries,)
+                )
+            db.commit()
+
+    def _in_thread(self, fn, *args):
+        if self.executor is not None:
+            return self.executor.run(fn, *args)
+        return asyncio.to_thread(fn, *args)
+
+    # ---------- public API ----------
+    async def get(self, key):
+        """Return (value, age_seconds, tier) from memory, then disk; None if absent."""
+        entry = self._memory_get(key)
+        tier = "memory_hits"
+        if entry is None and self.path:
+            try:
+                entry = await self._in_thread(self._disk_get, key)
+            except Exception as e:
+                logger.warning(f"Cache disk read error: {str(e)}")
+                entry = None
+            if entry is not None:
+                self._memory_set(key, entry)
+                tier = "disk_hits"
+        if entry is None:
+            return None
+        value, stored_at = entry
+        return value, time.time() - stored_at, tier
+
+    async def set(self, key, value):
+        stored_at = time.time()
+        self._memory_set(key, (value, stored_at))
+        if self.path:
+            try:
+                await self._in_thread(self._disk_set, key, value, stored_at)
+            except Exception as e:
+                logger.warning(f"Cache disk write error: {str(e)}")
+
+    async def get_or_fetch(self, namespace, params, fetch, cacheable=bool, fallback_on=None):
+        """
+        Serve `params` from the cache, or await `fetch()` and store its result.
+        `cacheable(result)` decides whether a fresh result is stored (e.g. skip errors).
+        When `fetch()` raises an exception accepted by `fallback_on(exc)`, an expired entry
+        at most TTL + stale_ttl + fallback_ttl old is served instead (e.g. upstream outage).
+        """
+        if not self.enabled:
+            return await fetch()
+
+        key = self.make_key(namespace, params)
+        ttl = self.ttl_for(namespace)
+        cached = await self.get(key)
+        if cached is not None:
+            value, age, tier = cached
+            if age < ttl:
+                self._count(namespace, tier)
+                return value
+            if age < ttl + self.stale_ttl:
+                self._count(namespace, "stale_hits")
+                self._schedule_refresh(key, fetch, cacheable)
+                return value
+
+        self._count(namespace, "misses")
+        try:
+            value = await fetch()
+        except Exception as e:
+            if (cached is not None and fallback_on is not None and fallback_on(e)
+                    and cached[1] < ttl + self.stale_ttl + self.fallback_ttl):
+                logger.warning(f"Serving {cached[1]:.0f}s old {namespace} result after fetch error: {str(e)}")
+                self._count(namespace, "fallback_hits")
+                return cached[0]
+            raise
+        if cacheable(value):
+            await self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key, fetch, cacheable):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                value = await fetch()
+                if cacheable(value):
+                    await self.set(key, value)
+            except Exception as e:
+                logger.warning(f"Background cache refresh failed: {str(e)}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(refresh())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def clear(self):
+        """Drop all entries from both tiers and reset counters."""
+        self._memory.clear()
+        self.stats = {}
+        if self.path and os.path.exists(self.path):
+            with self._db_lock:
+                db = self._connect()
+                db.execute(f"DELETE FROM {self.table}")
+                db.commit()
@@ -1,24 +1,158 @@
 import os
+import copy
+import time
 import asyncio
+import inspect
 import logging
-from apify_client import ApifyClientAsync
+import importlib
 from fastapi import HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
-from serpapi import GoogleSearch
-from crewai import Agent, Task, Crew, Process, LLM
+from typing import TYPE_CHECKING, List, Optional
+from typing_extensions import NotRequired, TypedDict
+from contextvars import ContextVar
 from datetime import datetime
 from functools import lru_cache
 import re
 import json
+import httpx
+from cache import TTLCache
+from singleflight import SingleFlight, coalesce
+from resilience import CircuitBreaker, CircuitOpen
+from executors import llm_executor, search_executor
+from metrics import timed
+from trip_plan_parser import TripPlanStreamParser
+from ranking import order_flights, order_hotels
+
+if TYPE_CHECKING:
+    from apify_client import ApifyClientAsync
 
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
 SERP_API_KEY = os.getenv("SERP_API_KEY")
 APIFY_API_KEY = os.getenv("APIFY_API_KEY")
 
+# Return flight lookups (one SerpAPI call per departure_token)
+RETURN_FLIGHT_CONCURRENCY = int(os.getenv("RETURN_FLIGHT_CONCURRENCY", "4"))
+RETURN_FLIGHT_TIMEOUT = float(os.getenv("RETURN_FLIGHT_TIMEOUT", "20"))
+
+# Max concurrent per-location hotel searches within one request, per HOTEL_PROVIDER
+HOTEL_SEARCH_CONCURRENCY = {
+    "booking": int(os.getenv("HOTEL_SEARCH_CONCURRENCY_BOOKING", "2")),
+    "google": int(os.getenv("HOTEL_SEARCH_CONCURRENCY_GOOGLE", "4")),
+    "hedged": int(os.getenv("HOTEL_SEARCH_CONCURRENCY_HEDGED", "2")),
+}
+
+# HOTEL_PROVIDER=hedged: query HOTEL_HEDGE_PRIMARY first and the other provider only if the primary
+# has not answered within HOTEL_HEDGE_DELAY seconds (or failed). "first" returns the first non-empty
+# result; "merge" waits up to HOTEL_HEDGE_MERGE_WINDOW more seconds for the other one and dedupes both
+HOTEL_HEDGE_PRIMARY = os.getenv("HOTEL_HEDGE_PRIMARY", "booking").lower()
+HOTEL_HEDGE_DELAY = float(os.getenv("HOTEL_HEDGE_DELAY", "8"))
+HOTEL_HEDGE_STRATEGY = os.getenv("HOTEL_HEDGE_STRATEGY", "first").lower()
+HOTEL_HEDGE_MERGE_WINDOW = float(os.getenv("HOTEL_HEDGE_MERGE_WINDOW", "3"))
+
+# Upper bound (seconds) on each upstream call, so a hung SerpAPI/Apify/LLM call cannot hold a worker.
+# Shared calls finish (or fail) within these even when the request waiting on them gave up earlier
+SERPAPI_TIMEOUT = float(os.getenv("SERPAPI_TIMEOUT", "30"))
+APIFY_TIMEOUT = float(os.getenv("APIFY_TIMEOUT", "180"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+# Retries of timed-out / failed upstream calls (jittered exponential backoff, see resilience.py).
+# Apify runs are not retried after a timeout: the retry would wait APIFY_TIMEOUT again
+SERPAPI_RETRIES = int(os.getenv("SERPAPI_RETRIES", "2"))
+APIFY_RETRIES = int(os.getenv("APIFY_RETRIES", "1"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "1"))
+
+# Shared SerpAPI HTTP connection pool, and the largest response body read (bytes)
+SERPAPI_URL = os.getenv("SERPAPI_URL", "https://serpapi.com/search")
+SERPAPI_MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS", "50"))
+SERPAPI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SERPAPI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+SERPAPI_KEEPALIVE_EXPIRY = float(os.getenv("SERPAPI_KEEPALIVE_EXPIRY", "60"))
+SERPAPI_MAX_RESPONSE_BYTES = int(os.getenv("SERPAPI_MAX_RESPONSE_BYTES", str(16 * 1024 * 1024)))
+
+# Shared Apify HTTP connection pool
+APIFY_MAX_CONNECTIONS = int(os.getenv("APIFY_MAX_CONNECTIONS", "20"))
+APIFY_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("APIFY_MAX_KEEPALIVE_CONNECTIONS", "10"))
+APIFY_KEEPALIVE_EXPIRY = float(os.getenv("APIFY_KEEPALIVE_EXPIRY", "60"))
+
+# Search result cache (SerpAPI + Apify), TTLs in seconds
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", os.path.join(".cache", "search_cache.sqlite3"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", "300"))
+# Extra seconds an expired result is still served when its upstream is failing or its circuit is open
+SEARCH_CACHE_FALLBACK_TTL = int(os.getenv("SEARCH_CACHE_FALLBACK_TTL", "3600"))
+SEARCH_CACHE_TTLS = {
+    "google_flights": int(os.getenv("SEARCH_CACHE_TTL_GOOGLE_FLIGHTS", "900")),
+    "google_hotels": int(os.getenv("SEARCH_CACHE_TTL_GOOGLE_HOTELS", "1800")),
+    "booking": int(os.getenv("SEARCH_CACHE_TTL_BOOKING", "1800")),
+}
+
+# LLM response cache (recommendations, itinerary, trip planning)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_cache.sqlite3"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))
+LLM_CACHE_MAX_DISK_ENTRIES = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "5000"))
+
+LLM_MODEL = "gemini/gemini-2.0-flash"
+# "crew": build a CrewAI Agent/Task/Crew per call; "direct": send the same prompt straight to the LLM
+LLM_EXECUTION_MODE = os.getenv("LLM_EXECUTION_MODE", "crew").lower()
+# At startup, import crewai/apify_client/pdfkit and build the LLM and Apify client in the
+# background, so the first requests do not pay for it (false = on first use)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+# Flight/hotel data in AI prompts: "markdown" (emoji blocks) or "compact" (one table row per option)
+PROMPT_FORMAT = os.getenv("PROMPT_FORMAT", "markdown").lower()
+# Approximate token budget per flight/hotel list in a prompt; 0 = no limit. Best-scored options are kept first
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "0"))
+# Keep at most this many departures, returns per departure and hotels in a prompt; 0 = no limit
+PROMPT_MAX_OPTIONS = int(os.getenv("PROMPT_MAX_OPTIONS", "0"))
+
+# Stream the trip planner's output so searches can start before the day plan is written.
+# Streaming needs the direct LLM path, so it only applies with LLM_EXECUTION_MODE=direct
+TRIP_PLAN_STREAMING = (
+    os.getenv("TRIP_PLAN_STREAMING", "true").lower() == "true" and LLM_EXECUTION_MODE == "direct"
+)
+
+# /batch_search/: trips accepted per batch, and flight/hotel searches running at once across the whole batch
+BATCH_MAX_TRIPS = int(os.getenv("BATCH_MAX_TRIPS", "50"))
+BATCH_SEARCH_CONCURRENCY = int(os.getenv("BATCH_SEARCH_CONCURRENCY", "4"))
+
 # Initialize Logger
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and SerpAPI URLs carry the api_key
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+# ==============================================
+# 💤 Deferred Imports
+# ==============================================
+# crewai and apify_client take seconds to import: the functions using them import them locally,
+# after load_dependency() has imported them on a pool thread (or the startup warm-up has)
+HEAVY_DEPENDENCIES = ("crewai", "apify_client")
+_imported = set()
+
+
+def import_dependency(name: str):
+    """Import module `name` (blocking: run it off the event loop)."""
+    if name in _imported:
+        return
+    start = time.perf_counter()
+    importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    if elapsed > 0.1:
+        logger.info(f"Imported {name} in {elapsed:.2f}s")
+    _imported.add(name)
+
+
+async def load_dependency(executor, name: str):
+    """Import module `name` on `executor` unless done already, so the event loop never waits on it."""
+    if name not in _imported:
+        await executor.run(import_dependency, name)
+
+
+def preload_dependencies():
+    """Import every heavy dependency now (blocking: run it off the event loop)."""
+    for name in HEAVY_DEPENDENCIES:
+        import_dependency(name)
 
 
 # ==============================================
@@ -27,12 +161,57 @@ logger = logging.getLogger(__name__)
 @lru_cache(maxsize=1)
 def initialize_llm():
     """Initialize and cache the LLM instance to avoid repeated initializations."""
+    from crewai import LLM
+
     return LLM(
-        model="gemini/gemini-2.0-flash",
+        model=LLM_MODEL,
         provider="google",
-        api_key=GEMINI_API_KEY
+        api_key=GEMINI_API_KEY,
+        timeout=LLM_TIMEOUT
     )
 
+
+async def load_llm():
+    """
+    The cached LLM instance. Until crewai has been imported (see the startup warm-up),
+    the import runs on the LLM pool so it does not stall the event loop for seconds.
+    """
+    await load_dependency(llm_executor, "crewai")
+    return initialize_llm()
+
+# ==============================================
+# 🗄️ LLM Response Cache
+# ==============================================
+llm_cache = TTLCache(
+    path=LLM_CACHE_PATH or None,
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    default_ttl=LLM_CACHE_TTL,
+    enabled=LLM_CACHE_ENABLED,
+    table="llm_cache",
+    max_disk_entries=LLM_CACHE_MAX_DISK_ENTRIES,
+    executor=search_executor
+)
+
+# Set to True for the current request to skip the LLM cache (e.g. "Cache-Control: no-cache")
+llm_cache_bypass: ContextVar[bool] = ContextVar("llm_cache_bypass", default=False)
+
+
+async def cached_llm_call(namespace, agent_config: dict, description: str, run, use_cache=True):
+    """
+    Serve an LLM answer from the prompt-hash cache, keyed by model + agent config +
+    full task description, or await `run()` and store its result.
+    Only successful results are cached; exceptions from `run()` propagate.
+    """
+    async def timed_run():
+        with timed(f"llm_{namespace}"):
+            return await run()
+
+    if not use_cache or llm_cache_bypass.get():
+        return await timed_run()
+    params = {"model": LLM_MODEL, **agent_config, "description": description}
+    return await llm_cache.get_or_fetch(namespace, params, timed_run)
+
+
 # ==============================================
 # 📝 Pydantic Models
 # ==============================================
@@ -76,6 +255,42 @@ class LayoverInfo(BaseModel):
     overnight: Optional[bool] = False
 
 
+# Return flights are typed with TypedDicts instead of models: validation checks them
+# the same way, but they stay plain dicts, so a search with hundreds of return
+# options does not build a model instance per option and leg
+# (see benchmarks/bench_payload_decoding.py).
+class FlightLegDict(TypedDict):
+    departure_airport: str
+    departure_time: str
+    arrival_airport: str
+    arrival_time: str
+    airline: str
+    airline_logo: str
+    travel_class: str
+    flight_number: str
+    duration: int
+
+
+class LayoverDict(TypedDict):
+    airport: str
+    airport_id: str
+    duration: int
+    overnight: NotRequired[Optional[bool]]
+
+
+class ReturnFlightInfo(TypedDict):
+    airline: str
+    price: int
+    duration: int
+    stops: str
+    departure: str
+    arrival: str
+    travel_class: str
+    airline_logo: NotRequired[str]
+    legs: NotRequired[List[FlightLegDict]]
+    layovers: NotRequired[List[LayoverDict]]
+
+
 class FlightInfo(BaseModel):
     airline: str
     price: int
@@ -88,7 +303,7 @@ class FlightInfo(BaseModel):
     airline_logo: str
     legs: list[FlightLeg] = []
     layovers: list[LayoverInfo] = []
-    return_flights: Optional[list] = []
+    return_flights: Optional[list[ReturnFlightInfo]] = []
 
 
 class HotelInfo(BaseModel):
@@ -111,6 +326,8 @@ class AIResponse(BaseModel):
     ai_flight_recommendation: str = ""
     ai_hotel_recommendations: Optional[List[str]] = []
     itinerary: str = ""
+    # Stages cut off by the request deadline; their parts of the response are empty or placeholders
+    timed_out_stages: List[str] = []
 
 class PlanTripRequest(BaseModel):
     source_city: str
@@ -127,14 +344,158 @@ class PlanTripResponse(BaseModel):
     hotel_areas: list
     day_plan: list
 
+class TripSearchRequest(BaseModel):
+    flight_request: FlightRequest
+    hotel_request: Optional[List[HotelRequest]] = None
+    special_instructions: Optional[str] = None
+    day_plan: Optional[list] = None
+
+class BatchSearchRequest(BaseModel):
+    trips: List[TripSearchRequest]
+
+class FareCalendarRequest(BaseModel):
+    origin: str
+    destination: str
+    outbound_date: str
+    return_date: str
+    outbound_flex_days: int = 3
+    return_flex_days: int = 3
+
+class FareCell(BaseModel):
+    outbound_date: str
+    return_date: str
+    price: Optional[int] = None
+    airline: str = ""
+    duration: int = 0
+    stops: str = ""
+    cached: bool = False
+    error: Optional[str] = None
+    timed_out: bool = False  # not searched before the request deadline
+
+class FareCalendar(BaseModel):
+    origin: str
+    destination: str
+    outbound_dates: List[str]
+    return_dates: List[str]
+    prices: List[List[Optional[int]]] = []  # [outbound date][return date]; None = no fare or return before outbound
+    cheapest: Optional[FareCell] = None
+    cells: List[FareCell] = []
+    timed_out_stages: List[str] = []
+
+
+# ==============================================
+# 🗄️ Search Result Cache
+# ==============================================
+search_cache = TTLCache(
+    path=SEARCH_CACHE_PATH or None,
+    max_entries=SEARCH_CACHE_MAX_ENTRIES,
+    ttls=SEARCH_CACHE_TTLS,
+    stale_ttl=SEARCH_CACHE_STALE_TTL,
+    fallback_ttl=SEARCH_CACHE_FALLBACK_TTL,
+    enabled=SEARCH_CACHE_ENABLED,
+    table="search_cache",
+    executor=search_executor
+)
+
+# Identical concurrent searches share one upstream call
+search_singleflight = SingleFlight()
+
+# One breaker per upstream: while open, calls fail fast instead of each waiting for the failure
+serpapi_breaker = CircuitBreaker("serpapi")
+apify_breaker = CircuitBreaker("apify")
+llm_breaker = CircuitBreaker("llm")
+
+
+def upstream_failed(exc: Exception) -> bool:
+    """Search errors caused by the upstream (5xx, timeout, open circuit); these fall back to expired cache entries."""
+    return isinstance(exc, HTTPException) and exc.status_code >= 500
+
 
 # ==============================================
 # 🛫 Fetch Data from SerpAPI
 # ==============================================
 async def run_google_search(params):
-    """Generic function to run SerpAPI searches asynchronously."""
+    """Generic function to run SerpAPI searches asynchronously (served from the search cache when fresh)."""
+    return await search_cache.get_or_fetch(
+        params.get("engine", "google"),
+        params,
+        lambda: _fetch_google_search(params),
+        cacheable=lambda result: isinstance(result, dict) and "error" not in result,
+        fallback_on=upstream_failed
+    )
+
+
+_serpapi_client: Optional[httpx.AsyncClient] = None
+
+
+class ResponseTooLarge(ValueError):
+    """A SerpAPI response body exceeded SERPAPI_MAX_RESPONSE_BYTES."""
+
+
+def create_serpapi_client(transport=None) -> httpx.AsyncClient:
+    """AsyncClient for the SerpAPI JSON endpoint with the configured keep-alive/pool limits."""
+    return httpx.AsyncClient(
+        timeout=SERPAPI_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=SERPAPI_MAX_CONNECTIONS,
+            max_keepalive_connections=SERPAPI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=SERPAPI_KEEPALIVE_EXPIRY
+        ),
+        transport=transport
+    )
+
+
+def get_serpapi_client() -> httpx.AsyncClient:
+    """Return the application-scoped SerpAPI client, creating it on first use."""
+    global _serpapi_client
+    if _serpapi_client is None:
+        _serpapi_client = create_serpapi_client()
+    return _serpapi_client
+
+
+async def close_serpapi_client():
+    """Close the pooled connections of the application-scoped SerpAPI client."""
+    global _serpapi_client
+    if _serpapi_client is not None:
+        await _serpapi_client.aclose()
+        _serpapi_client = None
+
+
+async def _google_search(params):
+    """
+    GET the SerpAPI JSON endpoint on the shared pool (what GoogleSearch(params).get_dict()
+    does, without a thread). Error answers such as an invalid key come back as {"error": ...}
+    like before; 429 and 5xx responses raise httpx.HTTPStatusError (retried by the breaker,
+    after their Retry-After), bodies over SERPAPI_MAX_RESPONSE_BYTES raise ResponseTooLarge.
+    """
+    async with get_serpapi_client().stream("GET", SERPAPI_URL, params={**params, "output": "json"}) as response:
+        if response.status_code == 429 or response.status_code >= 500:
+            response.raise_for_status()
+        declared = int(response.headers.get("content-length") or 0)
+        if declared > SERPAPI_MAX_RESPONSE_BYTES:
+            raise ResponseTooLarge(f"SerpAPI response of {declared} bytes exceeds {SERPAPI_MAX_RESPONSE_BYTES}")
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) > SERPAPI_MAX_RESPONSE_BYTES:
+                raise ResponseTooLarge(f"SerpAPI response exceeds {SERPAPI_MAX_RESPONSE_BYTES} bytes")
+    return json.loads(body)
+
+
+async def _fetch_google_search(params):
     try:
-        return await asyncio.to_thread(lambda: GoogleSearch(params).get_dict())
+        with timed(f"serpapi_{params.get('engine', 'google')}"):
+            return await serpapi_breaker.call(
+                lambda: asyncio.wait_for(_google_search(params), timeout=SERPAPI_TIMEOUT),
+                retries=SERPAPI_RETRIES
+            )
+    except CircuitOpen as e:
+        # Failing fast: no stack trace per rejected call during an outage
+        logger.warning(f"SerpAPI search skipped: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Search API error: {str(e)}")
+    except asyncio.TimeoutError:
+        logger.error(f"SerpAPI search timed out after {SERPAPI_TIMEOUT:g}s")
+        raise HTTPException(status_code=504, detail="Search API timed out")
     except Exception as e:
         logger.exception(f"SerpAPI search error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Search API error: {str(e)}")
@@ -143,36 +504,203 @@ async def run_google_search(params):
 # ==============================================
 # 🏨 Fetch Hotels from Booking.com
 # ==============================================
+_apify_client: Optional["ApifyClientAsync"] = None
+
+
+async def create_apify_client(api_key=None, api_url=None):
+    """
+    Create an ApifyClientAsync whose HTTP pool uses the configured keep-alive/pool limits.
+    The httpx clients it builds by default are closed: the async one is replaced by the
+    pooled client and the sync one is never used by the async client.
+    """
+    await load_dependency(search_executor, "apify_client")
+    from apify_client import ApifyClientAsync
+
+    kwargs = {"api_url": api_url} if api_url else {}
+    apify_client = ApifyClientAsync(api_key or APIFY_API_KEY, **kwargs)
+    http_client = apify_client.http_client
+    if hasattr(http_client, "httpx_client"):
+        http_client.httpx_client.close()
+    if hasattr(http_client, "httpx_async_client"):
+        default_client = http_client.httpx_async_client
+        http_client.httpx_async_client = httpx.AsyncClient(
+            headers=default_client.headers,
+            follow_redirects=True,
+            timeout=default_client.timeout,
+            limits=httpx.Limits(
+                max_connections=APIFY_MAX_CONNECTIONS,
+                max_keepalive_connections=APIFY_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=APIFY_KEEPALIVE_EXPIRY
+            )
+        )
+        await default_client.aclose()
+    return apify_client
+
+
+async def _close_http_client(apify_client):
+    http_client = apify_client.http_client
+    if hasattr(http_client, "httpx_async_client"):
+        await http_client.httpx_async_client.aclose()
+
+
+async def get_apify_client():
+    """Return the application-scoped Apify client, creating it on first use."""
+    global _apify_client
+    if _apify_client is None:
+        apify_client = await create_apify_client()
+        if _apify_client is None:
+            _apify_client = apify_client
+        else:
+            # Another request created it while this one was closing the default clients
+            await _close_http_client(apify_client)
+    return _apify_client
+
+
+async def close_apify_client():
+    """Close the pooled connections of the application-scoped Apify client."""
+    global _apify_client
+    if _apify_client is not None:
+        apify_client, _apify_client = _apify_client, None
+        await _close_http_client(apify_client)
+
+
 async def run_apify_booking_search(params):
+    """Run the Booking.com Apify actor (served from the search cache when fresh)."""
+    return await search_cache.get_or_fetch(
+        "booking", params, lambda: _fetch_apify_booking_search(params), fallback_on=upstream_failed
+    )
+
+
+async def _fetch_apify_booking_search(params, apify_client=None):
     if not APIFY_API_KEY:
         logger.error("APIFY_API_KEY environment variable is not set.")
         raise HTTPException(status_code=422, detail="APIFY API key is not configured.")
     try:
-        apify_client = ApifyClientAsync(APIFY_API_KEY)
+        apify_client = apify_client or await get_apify_client()
+
+        async def run_actor():
+            # Start an Actor and wait for it to finish.
+            actor_client = apify_client.actor('voyager/fast-booking-scraper')
+            # Newer clients stream the run's log over an extra connection and linger on a status watcher; we use neither
+            call_kwargs = {"logger": None} if "logger" in inspect.signature(actor_client.call).parameters else {}
+            # timeout_secs also aborts the run on Apify's side, so a stuck run stops costing money
+            call_result = await asyncio.wait_for(
+                actor_client.call(run_input=params, timeout_secs=int(APIFY_TIMEOUT), **call_kwargs),
+                timeout=APIFY_TIMEOUT
+            )
 
-        # Start an Actor and wait for it to finish.
-        actor_client = apify_client.actor('voyager/fast-booking-scraper')
-        call_result = await actor_client.call(run_input=params)
+            if call_result is None:
+                logger.error(f"Actor run failed. Params: {params}")
+                print('Actor run failed.')
+                return []
 
-        if call_result is None:
-            logger.error(f"Actor run failed. Params: {params}")
-            print('Actor run failed.')
-            return []
+            # Fetch results from the Actor run's default dataset.
+            dataset_client = apify_client.dataset(call_result['defaultDatasetId'])
+            list_items_result = await dataset_client.list_items()
+            return list_items_result.items
 
-        # Fetch results from the Actor run's default dataset.
-        dataset_client = apify_client.dataset(call_result['defaultDatasetId'])
-        list_items_result = await dataset_client.list_items()
-        return list_items_result.items
+        with timed("apify_booking"):
+            return await apify_breaker.call(
+                run_actor, retries=APIFY_RETRIES, retry_on=lambda e: not isinstance(e, asyncio.TimeoutError)
+            )
+    except CircuitOpen as e:
+        logger.warning(f"Apify actor run skipped: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Apify Client error: {str(e)}")
+    except asyncio.TimeoutError:
+        logger.error(f"Apify actor run timed out after {APIFY_TIMEOUT:g}s. Params: {params}")
+        raise HTTPException(status_code=504, detail="Apify actor run timed out")
     except Exception as e:
         logger.exception(f"Apify Client error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Apify Client error: {str(e)}")
 
 
-async def search_flights(flight_request: FlightRequest):
-    """Fetch real-time flight details from Google Flights using SerpAPI."""
-    logger.info(f"Searching flights: {flight_request.origin} to {flight_request.destination}")
+# Raw payloads are decoded in one pass: every nested object is read once, and the
+# decoded values are validated once, when the FlightInfo/HotelInfo is built.
+def _decode_airport(endpoint):
+    """("Name (ID)", time) of a raw SerpAPI departure_airport / arrival_airport object."""
+    endpoint = endpoint or {}
+    return f"{endpoint.get('name', 'Unknown')} ({endpoint.get('id', '???')})", endpoint.get("time", "N/A")
+
+
+def _decode_leg(leg) -> dict:
+    departure_airport, departure_time = _decode_airport(leg.get("departure_airport"))
+    arrival_airport, arrival_time = _decode_airport(leg.get("arrival_airport"))
+    return {
+        "departure_airport": departure_airport,
+        "departure_time": departure_time,
+        "arrival_airport": arrival_airport,
+        "arrival_time": arrival_time,
+        "airline": leg.get("airline", "Unknown Airline"),
+        "airline_logo": leg.get("airline_logo", ""),
+        "travel_class": leg.get("travel_class", "Economy"),
+        "flight_number": leg.get("flight_number", ""),
+        "duration": int(leg.get("duration", 0))
+    }
 
-    params = {
+
+def _decode_option(option) -> dict:
+    """Fields shared by departure and return options of a raw SerpAPI flight option."""
+    legs = [_decode_leg(leg) for leg in option["flights"]]
+    first_leg, last_leg = legs[0], legs[-1]
+    return {
+        "airline": first_leg["airline"],
+        "price": int(option.get("price", 0)),
+        "duration": int(option.get("total_duration", 0)),
+        "stops": "Nonstop" if len(legs) == 1 else f"{len(legs) - 1} stop(s)",
+        "departure": f"{first_leg['departure_airport']} at {first_leg['departure_time']}",
+        "arrival": f"{last_leg['arrival_airport']} at {last_leg['arrival_time']}",
+        "travel_class": first_leg["travel_class"],
+        "airline_logo": first_leg["airline_logo"],
+        "legs": legs,
+        "layovers": [
+            {
+                "airport": lay.get("name", ""),
+                "airport_id": lay.get("id", ""),
+                "duration": int(lay.get("duration", 0)),
+                "overnight": lay.get("overnight", False)
+            } for lay in option.get("layovers", [])
+        ]
+    }
+
+
+def build_return_flight(ret_flight) -> ReturnFlightInfo:
+    """Decode one raw SerpAPI return-flight option; it is validated with the FlightInfo it is attached to."""
+    return _decode_option(ret_flight)
+
+
+def build_flight_info(flight, return_date, return_flights) -> FlightInfo:
+    """Decode one raw SerpAPI departure option (plus its decoded return flights) into a FlightInfo."""
+    decoded = _decode_option(flight)
+    decoded["return_date"] = return_date
+    decoded["return_flights"] = return_flights  # Attach return flights here
+    return FlightInfo.model_validate(decoded)
+
+
+def decode_google_hotel(hotel) -> HotelInfo:
+    """Decode one raw SerpAPI google_hotels property into a HotelInfo."""
+    return HotelInfo(
+        name=hotel.get("name", "Unknown Hotel"),
+        price=float((hotel.get("rate_per_night") or {}).get("extracted_lowest", 0.0)),
+        rating=float(hotel.get("overall_rating", 0.0)),
+        location=hotel.get("location", "N/A"),
+        link=hotel.get("link", "N/A")
+    )
+
+
+def decode_booking_hotel(hotel, nights) -> HotelInfo:
+    """Decode one raw Apify Booking.com result into a per-night HotelInfo."""
+    return HotelInfo(
+        name=hotel.get("name", "Unknown Hotel"),
+        price=round(float(hotel.get("price", 0.0)) / nights),
+        rating=float(hotel.get("rating", 0.0)),
+        location=hotel.get("address", "N/A"),
+        link=hotel.get("url", "N/A")
+    )
+
+
+def flight_search_params(flight_request: FlightRequest) -> dict:
+    """SerpAPI google_flights params of a round-trip search (also its search cache key)."""
+    return {
         "api_key": SERP_API_KEY,
         "engine": "google_flights",
         "hl": "en",
@@ -184,7 +712,36 @@ async def search_flights(flight_request: FlightRequest):
         "currency": "INR"
     }
 
-    search_results = await run_google_search(params)
+
+async def fetch_return_flights(flight_request: FlightRequest, departure_token, semaphore: asyncio.Semaphore):
+    """Fetch the return flight options for one departure using its departure_token."""
+    return_flights = []
+    if not departure_token:
+        return return_flights
+
+    return_params = {**flight_search_params(flight_request), "departure_token": departure_token}
+    try:
+        async with semaphore:
+            return_results = await asyncio.wait_for(run_google_search(return_params), timeout=RETURN_FLIGHT_TIMEOUT)
+        return_top_flights = return_results.get("best_flights", [])
+        if not return_top_flights:
+            return_top_flights = return_results.get("other_flights", [])
+            return_top_flights = return_top_flights[:min(3, len(return_top_flights))]  # Limit to 3 other flights
+        for ret_flight in return_top_flights:
+            return_flights.append(build_return_flight(ret_flight))
+    except asyncio.TimeoutError:
+        logger.warning(f"Return flight search timed out after {RETURN_FLIGHT_TIMEOUT}s")
+    except Exception as e:
+        logger.warning(f"Error fetching return flights: {str(e)}")
+    return return_flights
+
+
+@coalesce(search_singleflight)
+async def search_flights(flight_request: FlightRequest):
+    """Fetch real-time flight details from Google Flights using SerpAPI."""
+    logger.info(f"Searching flights: {flight_request.origin} to {flight_request.destination}")
+
+    search_results = await run_google_search(flight_search_params(flight_request))
 
     if "error" in search_results:
         logger.error(f"Flight search error: {search_results['error']}")
@@ -195,116 +752,24 @@ async def search_flights(flight_request: FlightRequest):
         logger.warning("No flights found in search results")
         return []
 
+    best_flights = [flight for flight in best_flights if flight.get("flights")]
+
+    # --- Fetch return flights for every departure concurrently (order preserved by gather) ---
+    semaphore = asyncio.Semaphore(RETURN_FLIGHT_CONCURRENCY)
+    return_flights_per_departure = await asyncio.gather(*(
+        fetch_return_flights(flight_request, flight.get("departure_token"), semaphore)
+        for flight in best_flights
+    ))
+
     formatted_flights = []
-    for flight in best_flights:
-        if not flight.get("flights") or len(flight["flights"]) == 0:
-            continue
-
-        # Build legs (departure)
-        legs = []
-        for leg in flight["flights"]:
-            legs.append({
-                "departure_airport": f"{leg.get('departure_airport', {}).get('name', 'Unknown')} ({leg.get('departure_airport', {}).get('id', '???')})",
-                "departure_time": leg.get('departure_airport', {}).get('time', 'N/A'),
-                "arrival_airport": f"{leg.get('arrival_airport', {}).get('name', 'Unknown')} ({leg.get('arrival_airport', {}).get('id', '???')})",
-                "arrival_time": leg.get('arrival_airport', {}).get('time', 'N/A'),
-                "airline": leg.get("airline", "Unknown Airline"),
-                "airline_logo": leg.get("airline_logo", ""),
-                "travel_class": leg.get("travel_class", "Economy"),
-                "flight_number": leg.get("flight_number", ""),
-                "duration": int(leg.get("duration", 0))
-            })
-
-        # Build layovers (departure)
-        layovers = []
-        for lay in flight.get("layovers", []):
-            layovers.append({
-                "airport": lay.get("name", ""),
-                "airport_id": lay.get("id", ""),
-                "duration": int(lay.get("duration", 0)),
-                "overnight": lay.get("overnight", False)
-            })
-
-        first_leg = flight["flights"][0]
-        last_leg = flight["flights"][-1]
-
-        # --- Fetch return flights using departure_token ---
-        return_flights = []
-        departure_token = flight.get("departure_token")
-        if departure_token:
-            return_params = {
-                "api_key": SERP_API_KEY,
-                "engine": "google_flights",
-                "hl": "en",
-                "gl": "in",
-                "departure_id": flight_request.origin.strip().upper(),
-                "arrival_id": flight_request.destination.strip().upper(),
-                "outbound_date": flight_request.outbound_date,
-                "return_date": flight_request.return_date,
-                "currency": "INR",
-                "departure_token": departure_token
-            }
-            try:
-                return_results = await run_google_search(return_params)
-                return_top_flights = return_results.get("best_flights", [])
-                if not return_top_flights:
-                    return_top_flights = return_results.get("other_flights", [])
-                    return_top_flights = return_top_flights[:min(3, len(return_top_flights))]  # Limit to 3 other flights
-                for ret_flight in return_top_flights:
-                    ret_legs = []
-                    for leg in ret_flight["flights"]:
-                        ret_legs.append({
-                            "departure_airport": f"{leg.get('departure_airport', {}).get('name', 'Unknown')} ({leg.get('departure_airport', {}).get('id', '???')})",
-                            "departure_time": leg.get('departure_airport', {}).get('time', 'N/A'),
-                            "arrival_airport": f"{leg.get('arrival_airport', {}).get('name', 'Unknown')} ({leg.get('arrival_airport', {}).get('id', '???')})",
-                            "arrival_time": leg.get('arrival_airport', {}).get('time', 'N/A'),
-                            "airline": leg.get("airline", "Unknown Airline"),
-                            "airline_logo": leg.get("airline_logo", ""),
-                            "travel_class": leg.get("travel_class", "Economy"),
-                            "flight_number": leg.get("flight_number", ""),
-                            "duration": int(leg.get("duration", 0))
-                        })
-                    return_flights.append({
-                        "airline": ret_flight["flights"][0].get("airline", "Unknown Airline"),
-                        "price": int(ret_flight.get("price", 0)),
-                        "duration": int(ret_flight.get("total_duration", 0)),
-                        "stops": "Nonstop" if len(ret_flight["flights"]) == 1 else f"{len(ret_flight['flights']) - 1} stop(s)",
-                        "departure": f"{ret_flight['flights'][0].get('departure_airport', {}).get('name', 'Unknown')} ({ret_flight['flights'][0].get('departure_airport', {}).get('id', '???')}) at {ret_flight['flights'][0].get('departure_airport', {}).get('time', 'N/A')}",
-                        "arrival": f"{ret_flight['flights'][-1].get('arrival_airport', {}).get('name', 'Unknown')} ({ret_flight['flights'][-1].get('arrival_airport', {}).get('id', '???')}) at {ret_flight['flights'][-1].get('arrival_airport', {}).get('time', 'N/A')}",
-                        "travel_class": ret_flight["flights"][0].get("travel_class", "Economy"),
-                        "airline_logo": ret_flight["flights"][0].get("airline_logo", ""),
-                        "legs": ret_legs,
-                        "layovers": [
-                            {
-                                "airport": lay.get("name", ""),
-                                "airport_id": lay.get("id", ""),
-                                "duration": int(lay.get("duration", 0)),
-                                "overnight": lay.get("overnight", False)
-                            } for lay in ret_flight.get("layovers", [])
-                        ]
-                    })
-            except Exception as e:
-                logger.warning(f"Error fetching return flights: {str(e)}")
-
-        formatted_flights.append(FlightInfo(
-            airline=first_leg.get("airline", "Unknown Airline"),
-            price=int(flight.get("price", 0)),
-            duration=int(flight.get("total_duration", 0)),
-            stops="Nonstop" if len(flight["flights"]) == 1 else f"{len(flight['flights']) - 1} stop(s)",
-            departure=f"{first_leg.get('departure_airport', {}).get('name', 'Unknown')} ({first_leg.get('departure_airport', {}).get('id', '???')}) at {first_leg.get('departure_airport', {}).get('time', 'N/A')}",
-            arrival=f"{last_leg.get('arrival_airport', {}).get('name', 'Unknown')} ({last_leg.get('arrival_airport', {}).get('id', '???')}) at {last_leg.get('arrival_airport', {}).get('time', 'N/A')}",
-            travel_class=first_leg.get("travel_class", "Economy"),
-            return_date=flight_request.return_date,
-            airline_logo=first_leg.get("airline_logo", ""),
-            legs=legs,
-            layovers=layovers,
-            return_flights=return_flights  # Attach return flights here
-        ))
+    for flight, return_flights in zip(best_flights, return_flights_per_departure):
+        formatted_flights.append(build_flight_info(flight, flight_request.return_date, return_flights))
 
     logger.info(f"Found {len(formatted_flights)} flights")
     return formatted_flights
 
 
+@coalesce(search_singleflight)
 async def search_google_hotels(hotel_request: HotelRequest):
     """Fetch hotel information from SerpAPI."""
     logger.info(f"Searching hotels for: {hotel_request.location}")
@@ -337,13 +802,7 @@ async def search_google_hotels(hotel_request: HotelRequest):
     formatted_hotels = []
     for hotel in hotel_properties:
         try:
-            formatted_hotels.append(HotelInfo(
-                name=hotel.get("name", "Unknown Hotel"),
-                price=float(hotel.get("rate_per_night", {}).get("extracted_lowest", 0.0)),
-                rating=float(hotel.get("overall_rating", 0.0)),
-                location=hotel.get("location", "N/A"),
-                link=hotel.get("link", "N/A")
-            ))
+            formatted_hotels.append(decode_google_hotel(hotel))
         except Exception as e:
             logger.warning(f"Error formatting hotel data: {str(e)}")
             # Continue with next hotel rather than failing completely
@@ -352,6 +811,25 @@ async def search_google_hotels(hotel_request: HotelRequest):
     return formatted_hotels
 
 
+def merge_booking_hotels(result_lists, nights):
+    """Combine Booking.com result lists, dedupe by hotel name + address and convert to per-night HotelInfo."""
+    seen = set()
+    formatted_hotels = []
+    for hotels in result_lists:
+        for hotel in hotels:
+            key = (hotel.get("name", ""), hotel.get("address", ""))
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                formatted_hotels.append(decode_booking_hotel(hotel, nights))
+            except Exception as e:
+                logger.warning(f"Error formatting hotel data: {str(e)}")
+                # Continue with next hotel rather than failing completely
+    return formatted_hotels
+
+
+@coalesce(search_singleflight)
 async def search_booking_hotels(hotel_request: HotelRequest):
     """Fetch hotel information from Apify - Booking.com for both Hostels and all property types."""
     logger.info(f"Searching hotels for: {hotel_request.location}")
@@ -396,76 +874,236 @@ async def search_booking_hotels(hotel_request: HotelRequest):
     hotel_results_hostels = results[0] if not isinstance(results[0], Exception) else []
     hotel_results_all = results[1] if not isinstance(results[1], Exception) else []
 
-    # Combine and deduplicate by hotel name + address
-    combined_hotels = hotel_results_hostels + hotel_results_all
-    seen = set()
-    unique_hotels = []
-    for hotel in combined_hotels:
-        key = (hotel.get("name", ""), hotel.get("address", ""))
-        if key not in seen:
-            seen.add(key)
-            unique_hotels.append(hotel)
-
-    if not unique_hotels:
+    formatted_hotels = merge_booking_hotels([hotel_results_hostels, hotel_results_all], date_diff.days)
+    if not formatted_hotels:
         logger.warning("No hotels found in search results")
         return []
 
-    formatted_hotels = []
-    for hotel in unique_hotels:
-        try:
-            formatted_hotels.append(HotelInfo(
-                name=hotel.get("name", "Unknown Hotel"),
-                price=round(float(hotel.get("price", 0.0)) / date_diff.days),
-                rating=float(hotel.get("rating", 0.0)),
-                location=hotel.get("address", "N/A"),
-                link=hotel.get("url", "N/A")
-            ))
-        except Exception as e:
-            logger.warning(f"Error formatting hotel data: {str(e)}")
-            # Continue with next hotel rather than failing completely
-
     logger.info(f"Found {len(formatted_hotels)} hotels (combined Hostels + All)")
     return formatted_hotels
 
 
+# Hedged searches: how often the secondary provider was started, won, or was merged in
+hotel_hedge_stats = {"searches": 0, "hedged": 0, "secondary_wins": 0, "merged": 0}
+
+
+def _hotels_of(task: asyncio.Task):
+    """Hotels of a finished provider search, or None for an error, no results or an exception."""
+    if task.cancelled() or task.exception() is not None:
+        return None
+    hotels = task.result()
+    return hotels if isinstance(hotels, list) and hotels else None
+
+
+def merge_hotel_results(result_lists):
+    """Concatenate provider results in order, dropping hotels already listed under the same name."""
+    seen = set()
+    merged = []
+    for hotels in result_lists:
+        for hotel in hotels:
+            key = " ".join(hotel.name.casefold().split())
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(hotel)
+    return merged
+
+
+@coalesce(search_singleflight)
+async def search_hedged_hotels(hotel_request: HotelRequest):
+    """
+    Hedged hotel search across Booking.com and Google Hotels. The primary provider
+    (HOTEL_HEDGE_PRIMARY) starts right away; the secondary starts only when the primary
+    has not returned hotels within HOTEL_HEDGE_DELAY seconds, so fast requests cost one
+    provider call. The first non-empty result wins ("first"), or the other provider gets
+    HOTEL_HEDGE_MERGE_WINDOW more seconds and both are merged ("merge").
+    When both fail, the primary's result (or exception) is returned as-is.
+    The losing provider call keeps running in the background and fills the search cache.
+    """
+    providers = {"booking": search_booking_hotels, "google": search_google_hotels}
+    primary = HOTEL_HEDGE_PRIMARY if HOTEL_HEDGE_PRIMARY in providers else "booking"
+    secondary = "google" if primary == "booking" else "booking"
+    hotel_hedge_stats["searches"] += 1
+
+    primary_task = asyncio.create_task(providers[primary](hotel_request))
+    tasks = {primary_task: primary}
+    pending = {primary_task}
+    winner = None
+    try:
+        while pending and winner is None:
+            hedging = len(tasks) > 1
+            done, pending = await asyncio.wait(
+                pending, timeout=None if hedging else HOTEL_HEDGE_DELAY, return_when=asyncio.FIRST_COMPLETED
+            )
+            winner = next((task for task in tasks if task in done and _hotels_of(task)), None)
+            if winner is None and not hedging:
+                # Primary too slow or empty: start the secondary
+                reason = "failed" if done else f"no answer after {HOTEL_HEDGE_DELAY:g}s"
+                logger.info(f"Hotel search hedging to {secondary} for {hotel_request.location}: {primary} {reason}")
+                hotel_hedge_stats["hedged"] += 1
+                secondary_task = asyncio.create_task(providers[secondary](hotel_request))
+                tasks[secondary_task] = secondary
+                pending.add(secondary_task)
+
+        if winner is None:
+            return primary_task.result()
+        if winner is not primary_task:
+            hotel_hedge_stats["secondary_wins"] += 1
+
+        results = [_hotels_of(winner)]
+        if HOTEL_HEDGE_STRATEGY == "merge" and len(tasks) > 1:
+            if pending:
+                await asyncio.wait(pending, timeout=HOTEL_HEDGE_MERGE_WINDOW)
+            results += [_hotels_of(task) for task in tasks if task is not winner and task.done()]
+            results = [hotels for hotels in results if hotels]
+            if len(results) > 1:
+                hotel_hedge_stats["merged"] += 1
+        hotels = merge_hotel_results(results)
+        logger.info(f"Hedged hotel search for {hotel_request.location}: {len(hotels)} hotels, first from {tasks[winner]}")
+        return hotels
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
 # ==============================================
 # 🔄 Format Data for AI
 # ==============================================
-def format_travel_data(data_type, data):
-    """Generic formatter for both flight and hotel data."""
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _compact_cell(value) -> str:
+    return str(value).replace("|", "/").replace("\n", " ")
+
+
+def _compact_endpoint(endpoint: str) -> str:
+    """'Indira Gandhi International Airport (DEL) at 2025-01-10 08:00' -> 'DEL 2025-01-10 08:00'."""
+    match = re.search(r"\((\w{3})\) at (.+)$", endpoint or "")
+    return f"{match.group(1)} {match.group(2)}" if match else _compact_cell(endpoint)
+
+
+def _compact_stops(stops: str) -> str:
+    match = re.match(r"\s*(\d+)", stops or "")
+    return match.group(1) if match else "0"
+
+
+def _flight_block(i, flight, return_indices, style):
+    if style == "compact":
+        rows = [
+            f"{i + 1}|{_compact_cell(flight.airline)}|{flight.price}|{flight.duration}|{_compact_stops(flight.stops)}|"
+            f"{_compact_endpoint(flight.departure)}|{_compact_endpoint(flight.arrival)}|{_compact_cell(flight.travel_class)}"
+        ]
+        for j in return_indices:
+            ret = flight.return_flights[j]
+            rows.append(
+                f"R{j + 1}|{_compact_cell(ret['airline'])}|{ret['price']}|{ret['duration']}|{_compact_stops(ret['stops'])}|"
+                f"{_compact_endpoint(ret['departure'])}|{_compact_endpoint(ret['arrival'])}|{_compact_cell(ret['travel_class'])}"
+            )
+        return "\n".join(rows) + "\n"
+
+    parts = [(
+        f"**Departure Flight {i + 1}:**\n"
+        f"✈️ **Airline:** {flight.airline}\n"
+        f"💰 **Price:** ₹{flight.price}\n"
+        f"⏱️ **Duration:** {flight.duration}\n"
+        f"🛑 **Stops:** {flight.stops}\n"
+        f"🕔 **Departure:** {flight.departure}\n"
+        f"🕖 **Arrival:** {flight.arrival}\n"
+        f"💺 **Class:** {flight.travel_class}\n"
+    )]
+    # List return flights for this departure
+    for j in return_indices:
+        ret = flight.return_flights[j]
+        parts.append(
+            f"\n  ↩️ **Return Flight {j + 1}:**\n"
+            f"  ✈️ **Airline:** {ret['airline']}\n"
+            f"  💰 **Price:** ₹{ret['price']}\n"
+            f"  ⏱️ **Duration:** {ret['duration']}\n"
+            f"  🛑 **Stops:** {ret['stops']}\n"
+            f"  🕔 **Departure:** {ret['departure']}\n"
+            f"  🕖 **Arrival:** {ret['arrival']}\n"
+            f"  💺 **Class:** {ret['travel_class']}\n"
+        )
+    parts.append("\n")
+    return "".join(parts)
+
+
+def _hotel_block(i, hotel, check_in, check_out, location, style, with_dates):
+    if style == "compact":
+        price = int(hotel.price) if float(hotel.price).is_integer() else hotel.price
+        row = f"{i + 1}|{_compact_cell(hotel.name)}|{price}|{hotel.rating}|{_compact_cell(location)}"
+        if with_dates:
+            row += f"|{check_in}|{check_out}"
+        return row + "\n"
+    return (
+        f"**Hotel {i + 1}:**\n"
+        f"🏨 **Name:** {hotel.name}\n"
+        f"💰 **Price:** ₹{hotel.price}\n"
+        f"⭐ **Rating:** {hotel.rating}\n"
+        f"📍 **Location:** {location}\n"
+        f"🗓️ **Check-in:** {check_in}\n"
+        f"🗓️ **Check-out:** {check_out}\n"
+        f"🔗 **More Info:** [Link]({hotel.link})\n\n"
+    )
+
+
+def _within_budget(header, blocks, order, token_budget):
+    """Indices of the best-first `order` that fit the token budget (always at least one), in original order."""
+    kept = []
+    used = estimate_tokens(header)
+    for idx in order:
+        cost = estimate_tokens(blocks[idx])
+        if kept and token_budget and used + cost > token_budget:
+            break
+        kept.append(idx)
+        used += cost
+    return sorted(kept)
+
+
+def _join_blocks(header, blocks):
+    """header + blocks without trailing whitespace; only the last block is stripped, so a large prompt is copied once."""
+    blocks[-1] = blocks[-1].rstrip()
+    return "".join([header, *blocks])
+
+
+def format_travel_data(data_type, data, style=None, token_budget=None, max_options=None):
+    """
+    Generic formatter for both flight and hotel data.
+    - style: "markdown" or "compact" (default PROMPT_FORMAT)
+    - token_budget / max_options (default PROMPT_TOKEN_BUDGET / PROMPT_MAX_OPTIONS, 0 = no limit):
+      keep only the best-scored options (see ranking.py). Options keep their original
+      numbers, so recommendation indices still refer to positions in `data`.
+    """
     if not data:
         return f"No {data_type} available."
 
+    style = style or PROMPT_FORMAT
+    token_budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    max_options = PROMPT_MAX_OPTIONS if max_options is None else max_options
+    trimmed = bool(token_budget or max_options)
+
     if data_type == "flights":
-        formatted_text = "✈️ **Available round-trip flight options**:\n\n"
-        for i, flight in enumerate(data):
-            formatted_text += (
-                f"**Departure Flight {i + 1}:**\n"
-                f"✈️ **Airline:** {flight.airline}\n"
-                f"💰 **Price:** ₹{flight.price}\n"
-                f"⏱️ **Duration:** {flight.duration}\n"
-                f"🛑 **Stops:** {flight.stops}\n"
-                f"🕔 **Departure:** {flight.departure}\n"
-                f"🕖 **Arrival:** {flight.arrival}\n"
-                f"💺 **Class:** {flight.travel_class}\n"
+        if style == "compact":
+            header = (
+                "Round-trip flight options. Rows numbered N are Departure Flight N; the RN rows below a departure "
+                "are its Return Flight N options. Price in INR (a return price is the round-trip total), duration in minutes.\n"
+                "#|airline|price|duration|stops|departure|arrival|class\n"
             )
-            # List return flights for this departure
-            if flight.return_flights:
-                for j, ret in enumerate(flight.return_flights):
-                    formatted_text += (
-                        f"\n  ↩️ **Return Flight {j + 1}:**\n"
-                        f"  ✈️ **Airline:** {ret['airline']}\n"
-                        f"  💰 **Price:** ₹{ret['price']}\n"
-                        f"  ⏱️ **Duration:** {ret['duration']}\n"
-                        f"  🛑 **Stops:** {ret['stops']}\n"
-                        f"  🕔 **Departure:** {ret['departure']}\n"
-                        f"  🕖 **Arrival:** {ret['arrival']}\n"
-                        f"  💺 **Class:** {ret['travel_class']}\n"
-                    )
-            formatted_text += "\n"
+        else:
+            header = "✈️ **Available round-trip flight options**:\n\n"
+        if not trimmed:
+            return _join_blocks(header, [
+                _flight_block(i, flight, range(len(flight.return_flights or [])), style) for i, flight in enumerate(data)
+            ])
+        order = order_flights(data)
+        returns = {i: (js[:max_options] if max_options else js) for i, js in order}
+        order = [i for i, _ in order][:max_options or None]
+        blocks = {i: _flight_block(i, data[i], sorted(returns[i]), style) for i in order}
     elif data_type == "hotels":
-        formatted_text = "🏨 **Available Hotel Options**:\n\n"
-        for i, item in enumerate(data):
+        items = []
+        for item in data:
             # Support both old and new format for backward compatibility
             if isinstance(item, dict) and "hotel" in item:
                 hotel = item["hotel"]
@@ -475,29 +1113,128 @@ def format_travel_data(data_type, data):
             else:
                 hotel = item
                 check_in = check_out = location = "N/A"
-            formatted_text += (
-                f"**Hotel {i + 1}:**\n"
-                f"🏨 **Name:** {hotel.name}\n"
-                f"💰 **Price:** ₹{hotel.price}\n"
-                f"⭐ **Rating:** {hotel.rating}\n"
-                f"📍 **Location:** {hotel.location if location == 'N/A' else location}\n"
-                f"🗓️ **Check-in:** {check_in}\n"
-                f"🗓️ **Check-out:** {check_out}\n"
-                f"🔗 **More Info:** [Link]({hotel.link})\n\n"
+            items.append((hotel, check_in, check_out, hotel.location if location == "N/A" else location))
+        with_dates = any(check_in != "N/A" for _, check_in, _, _ in items)
+        if style == "compact":
+            header = (
+                "Hotel options; row N is Hotel N. Price per night in INR.\n"
+                f"#|name|price|rating|location{'|check-in|check-out' if with_dates else ''}\n"
             )
+        else:
+            header = "🏨 **Available Hotel Options**:\n\n"
+        if not trimmed:
+            return _join_blocks(header, [_hotel_block(i, *item, style, with_dates) for i, item in enumerate(items)])
+        order = order_hotels([hotel for hotel, _, _, _ in items])[:max_options or None]
+        blocks = {i: _hotel_block(i, *items[i], style, with_dates) for i in order}
     else:
         return "Invalid data type."
 
-    return formatted_text.strip()
+    kept = _within_budget(header, blocks, order, token_budget)
+    return _join_blocks(header, [blocks[i] for i in kept])
 
 
 # ==============================================
 # 🧠 AI Analysis Functions
 # ==============================================
-async def get_ai_recommendation(data_type, formatted_data):
-    """Unified function for getting AI recommendations for both flights and hotels."""
+def build_llm_messages(agent_config: dict, description: str):
+    """Chat messages for the direct LLM path: the same role, goal, backstory and task the Crew would send."""
+    return [
+        {
+            "role": "system",
+            "content": f"You are {agent_config['role']}. {agent_config['backstory']}\nYour personal goal is: {agent_config['goal']}"
+        },
+        {
+            "role": "user",
+            "content": f"{description}\n\nThis is the expected criteria for your final answer: {agent_config['expected_output']}"
+        }
+    ]
+
+
+async def run_llm_task(agent_config: dict, description: str, default="No result available."):
+    """Run a single-agent LLM task through a CrewAI Crew, or directly against the LLM when LLM_EXECUTION_MODE=direct."""
+    llm = await load_llm()
+    # A timed-out call keeps its pool thread until the LLM returns, so timeouts are not retried
+    retry_on = lambda e: not isinstance(e, asyncio.TimeoutError)
+    if LLM_EXECUTION_MODE == "direct":
+        messages = build_llm_messages(agent_config, description)
+        return await llm_breaker.call(
+            lambda: asyncio.wait_for(llm_executor.run(llm.call, messages), timeout=LLM_TIMEOUT),
+            retries=LLM_RETRIES, retry_on=retry_on
+        )
+
+    def kickoff():
+        from crewai import Agent, Crew, Process, Task
+
+        # A fresh crew per attempt: a failed kickoff can leave its agent and task half-run
+        agent = Agent(
+            role=agent_config["role"],
+            goal=agent_config["goal"],
+            backstory=agent_config["backstory"],
+            llm=llm,
+            verbose=False
+        )
+
+        task = Task(
+            description=description,
+            agent=agent,
+            expected_output=agent_config["expected_output"]
+        )
+
+        crew = Crew(
+            agents=[agent],
+            tasks=[task],
+            process=Process.sequential,
+            verbose=False
+        )
+        return crew.kickoff()
+
+    # Run the CrewAI task on the LLM pool, apart from search I/O
+    crew_results = await llm_breaker.call(
+        lambda: asyncio.wait_for(llm_executor.run(kickoff), timeout=LLM_TIMEOUT),
+        retries=LLM_RETRIES, retry_on=retry_on
+    )
+
+    # Handle different possible return types from CrewAI
+    if hasattr(crew_results, 'outputs') and crew_results.outputs:
+        return crew_results.outputs[0]
+    elif hasattr(crew_results, 'get'):
+        return crew_results.get(agent_config["role"], default)
+    else:
+        return str(crew_results)
+
+
+async def stream_llm_task(agent_config: dict, description: str, on_chunk):
+    """
+    Run a single-agent LLM task on the direct path, streaming the answer: `on_chunk(text)`
+    is called on the event loop for each chunk. Returns the full answer. Falls back to
+    run_llm_task (one chunk with the whole answer) when the LLM cannot stream.
+    """
+    llm = await load_llm()
+    if not hasattr(llm, "stream_events"):
+        result = await run_llm_task(agent_config, description)
+        on_chunk(str(result))
+        return result
+
+    loop = asyncio.get_running_loop()
+
+    def consume():
+        with llm.stream_events(build_llm_messages(agent_config, description)) as session:
+            for frame in session.llm:
+                if frame.content:
+                    loop.call_soon_threadsafe(on_chunk, frame.content)
+        return session.result
+
+    # Not retried: chunks of a failed attempt have already been handed to on_chunk
+    return await llm_breaker.call(lambda: asyncio.wait_for(llm_executor.run(consume), timeout=LLM_TIMEOUT))
+
+
+async def get_ai_recommendation(data_type, formatted_data, use_cache=True, selected=None):
+    """
+    Unified function for getting AI recommendations for both flights and hotels.
+    `selected` (e.g. "Hotel 2") names an option already picked by the scoring engine;
+    the AI then explains that choice instead of making its own.
+    """
     logger.info(f"Getting {data_type} analysis from AI")
-    llm_model = initialize_llm()
 
     # Configure agent based on data type
     if data_type == "flights":
@@ -557,45 +1294,33 @@ async def get_ai_recommendation(data_type, formatted_data):
     else:
         raise ValueError("Invalid data type for AI recommendation")
 
-    # Create the agent and task
-    analyze_agent = Agent(
-        role=role,
-        goal=goal,
-        backstory=backstory,
-        llm=llm_model,
-        verbose=False
-    )
-
-    analyze_task = Task(
-        description=f"{description}\n\nData to analyze:\n{formatted_data}",
-        agent=analyze_agent,
-        expected_output=f"A structured recommendation explaining the best {data_type} choice based on the analysis of provided details."
-    )
-
-    analyst_crew = Crew(
-        agents=[analyze_agent],
-        tasks=[analyze_task],
-        process=Process.sequential,
-        verbose=False
-    )
+    agent_config = {
+        "role": role,
+        "goal": goal,
+        "backstory": backstory,
+        "expected_output": f"A structured recommendation explaining the best {data_type} choice based on the analysis of provided details."
+    }
+    task_description = f"{description}\n\nData to analyze:\n{formatted_data}"
+    if selected:
+        task_description += (
+            f"\n\nThe options have already been ranked and the selected option is {selected}. "
+            f"Recommend exactly this option and explain why it is the best choice."
+        )
 
     try:
-        # Run the CrewAI analysis in a thread pool
-        crew_results = await asyncio.to_thread(analyst_crew.kickoff)
-
-        # Handle different possible return types from CrewAI
-        if hasattr(crew_results, 'outputs') and crew_results.outputs:
-            return crew_results.outputs[0]
-        elif hasattr(crew_results, 'get'):
-            return crew_results.get(role, f"No {data_type} recommendation available.")
-        else:
-            return str(crew_results)
+        return await cached_llm_call(
+            f"{data_type}_recommendation",
+            agent_config,
+            task_description,
+            lambda: run_llm_task(agent_config, task_description, default=f"No {data_type} recommendation available."),
+            use_cache=use_cache
+        )
     except Exception as e:
         logger.exception(f"Error in AI {data_type} analysis: {str(e)}")
         return f"Unable to generate {data_type} recommendation due to an error."
 
 
-async def generate_itinerary(destination, flights_text, hotels_text, check_in_date, check_out_date, special_instructions=None, day_plan=None):
+async def generate_itinerary(destination, flights_text, hotels_text, check_in_date, check_out_date, special_instructions=None, day_plan=None, use_cache=True):
     """Generate a detailed travel itinerary based on flight and hotel information."""
     try:
         # Convert the string dates to datetime objects
@@ -603,15 +1328,12 @@ async def generate_itinerary(destination, flights_text, hotels_text, check_in_da
         check_out = datetime.strptime(check_out_date, "%Y-%m-%d")
         days = (check_out - check_in).days
 
-        llm_model = initialize_llm()
-
-        analyze_agent = Agent(
-            role="AI Travel Planner",
-            goal="Create a detailed itinerary for the user based on flight and hotel information",
-            backstory="AI travel expert generating a day-by-day itinerary including flight details, hotel stays, and must-visit locations in the destination.",
-            llm=llm_model,
-            verbose=False
-        )
+        agent_config = {
+            "role": "AI Travel Planner",
+            "goal": "Create a detailed itinerary for the user based on flight and hotel information",
+            "backstory": "AI travel expert generating a day-by-day itinerary including flight details, hotel stays, and must-visit locations in the destination.",
+            "expected_output": "A well-structured, visually appealing itinerary in markdown format, including flight, hotel, day-wise breakdown with emojis, headers, and bullet points, and the Estimated Trip Costs table."
+        }
 
         day_plan_section = ""
         if day_plan:
@@ -621,8 +1343,7 @@ async def generate_itinerary(destination, flights_text, hotels_text, check_in_da
                 "Incorporate these activities and areas into the itinerary as much as possible.\n"
             )
 
-        analyze_task = Task(
-            description=f"""
+        description = f"""
             Based on the following details, create a {days}-day itinerary for the user:
 
             **Flight Details**:
@@ -657,49 +1378,38 @@ async def generate_itinerary(destination, flights_text, hotels_text, check_in_da
             - Use bullet points for listing activities
             - Include estimated timings for each activity
             - Format the itinerary to be visually appealing and easy to read
-            """,
-            agent=analyze_agent,
-            expected_output="A well-structured, visually appealing itinerary in markdown format, including flight, hotel, day-wise breakdown with emojis, headers, and bullet points, and the Estimated Trip Costs table."
-        )
-
-        itinerary_planner_crew = Crew(
-            agents=[analyze_agent],
-            tasks=[analyze_task],
-            process=Process.sequential,
-            verbose=False
+            """
+
+        return await cached_llm_call(
+            "itinerary",
+            agent_config,
+            description,
+            lambda: run_llm_task(agent_config, description, default="No itinerary available."),
+            use_cache=use_cache
         )
-
-        crew_results = await asyncio.to_thread(itinerary_planner_crew.kickoff)
-
-        # Handle different possible return types from CrewAI
-        if hasattr(crew_results, 'outputs') and crew_results.outputs:
-            return crew_results.outputs[0]
-        elif hasattr(crew_results, 'get'):
-            return crew_results.get("AI Travel Planner", "No itinerary available.")
-        else:
-            return str(crew_results)
     except Exception as e:
         logger.exception(f"Error generating itinerary: {str(e)}")
         raise
 
 
-async def plan_trip_agent(req: PlanTripRequest):
+async def plan_trip_agent(req: PlanTripRequest, use_cache=True, on_partial=None):
     """
     AI agent takes city names, dates, and instructions, and returns:
     - IATA codes for airports
     - Dates
     - Hotel areas with check-in/out
     - Day-wise plan
+    With `on_partial`, the answer is streamed and `on_partial(kind, value)` is called as soon as
+    the flight fields ("flight") or a hotel_areas entry ("hotel_area") are complete
+    (see TripPlanStreamParser). Not called when the plan comes from the cache.
     """
     # --- Prompt LLM agent ---
-    llm = initialize_llm()
-    agent = Agent(
-        role="AI Travel Planner",
-        goal="Given source/destination cities and dates, suggest IATA codes, hotel areas, and a day-wise plan.",
-        backstory="Expert travel planner with knowledge of airports and city neighborhoods.",
-        llm=llm,
-        verbose=False
-    )
+    agent_config = {
+        "role": "AI Travel Planner",
+        "goal": "Given source/destination cities and dates, suggest IATA codes, hotel areas, and a day-wise plan.",
+        "backstory": "Expert travel planner with knowledge of airports and city neighborhoods.",
+        "expected_output": "A single JSON object as described above."
+    }
     prompt = f"""
     Given this trip request:
     - Source city: {req.source_city}
@@ -728,28 +1438,32 @@ async def plan_trip_agent(req: PlanTripRequest):
          ]
        }}
     """
-    task = Task(
-        description=prompt,
-        agent=agent,
-        expected_output="A single JSON object as described above."
-    )
-    crew = Crew(
-        agents=[agent],
-        tasks=[task],
-        process=Process.sequential,
-        verbose=False
-    )
-    result = await asyncio.to_thread(crew.kickoff)
 
-    # Parse JSON from LLM output
-    match = re.search(r"\{[\s\S]+\}", str(result))
-    if not match:
-        raise HTTPException(status_code=500, detail="AI did not return valid JSON.")
-    try:
-        trip_json = json.loads(match.group(0))
-    except Exception:
-        raise HTTPException(status_code=500, detail="Could not parse AI JSON output.")
-    return trip_json
+    async def run_planner():
+        if on_partial is not None:
+            parser = TripPlanStreamParser()
+
+            def on_chunk(chunk):
+                for kind, value in parser.feed(chunk):
+                    on_partial(kind, value)
+
+            result = await stream_llm_task(agent_config, prompt, on_chunk)
+        else:
+            result = await run_llm_task(agent_config, prompt)
+
+        # Parse JSON from LLM output
+        match = re.search(r"\{[\s\S]+\}", str(result))
+        if not match:
+            raise HTTPException(status_code=500, detail="AI did not return valid JSON.")
+        try:
+            return json.loads(match.group(0))
+        except Exception:
+            raise HTTPException(status_code=500, detail="Could not parse AI JSON output.")
+
+    # Only parsed plans are cached; unparseable output raises and is retried next time
+    trip_json = await cached_llm_call("trip_plan", agent_config, prompt, run_planner, use_cache=use_cache)
+    # Callers mutate the plan (e.g. sort hotel_areas), so never hand out the cached object itself
+    return copy.deepcopy(trip_json)
 
 
 # After getting the itinerary string from the LLM
@@ -795,6 +1509,10 @@ def format_selected_travel_data(data_type, data):
             f"- Arrival: {flight.arrival}\n"
             f"- Class: {flight.travel_class}\n"
         )
+        if not flight.return_flights:
+            # e.g. the return lookup failed or timed out: the departure alone is still usable
+            text += f"\n↩️ **Return Flight**: not available\nPrice:  ₹{flight.price}\n"
+            return text.strip()
         ret = flight.return_flights[0]
         text += (
             f"\n↩️ **Selected Return Flight**\n"
@@ -0,0 +1,79 @@
+import os
+import time
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Time budget (seconds) of one API request, shared by all its stages; 0 = no deadline.
+# Clients can ask for a shorter one with the X-Request-Deadline header
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "90"))
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A pipeline stage did not finish before the request deadline."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"{stage} timed out")
+        self.stage = stage
+
+
+# ==============================================
+# ⏳ Per-request Deadline
+# ==============================================
+# Absolute time.monotonic() deadline of the current request, and the stages cut off by it.
+# Tasks created by the request inherit both; the stage list is shared, so they all report into it
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+_timed_out: ContextVar[Optional[List[str]]] = ContextVar("timed_out_stages", default=None)
+
+
+def request_budget(header: Optional[str]) -> float:
+    """Budget of a request: REQUEST_DEADLINE, or the shorter X-Request-Deadline value (invalid values are ignored)."""
+    try:
+        requested = float(header) if header else 0.0
+    except ValueError:
+        requested = 0.0
+    if requested <= 0:
+        return REQUEST_DEADLINE
+    return min(requested, REQUEST_DEADLINE) if REQUEST_DEADLINE > 0 else requested
+
+
+def start_deadline(seconds: Optional[float]):
+    """Give the current request (and tasks it creates) `seconds` from now; 0 or None = no deadline."""
+    _deadline.set(time.monotonic() + seconds if seconds and seconds > 0 else None)
+    _timed_out.set([])
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (negative once passed), or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timed_out_stages() -> List[str]:
+    """Stages of the current request that were cut off by its deadline, in the order they timed out."""
+    return list(_timed_out.get() or [])
+
+
+async def within_deadline(stage: str, awaitable):
+    """
+    Await `awaitable` until the current deadline. When it runs out, the awaitable is
+    cancelled, `stage` is recorded as timed out and DeadlineExceeded is raised.
+    Without a deadline this is a plain await.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout=max(left, 0))
+    except asyncio.TimeoutError:
+        if remaining() > 0:
+            # A timeout of the stage itself (e.g. an upstream call limit), not the deadline
+            raise
+        stages = _timed_out.get()
+        if stages is not None and stage not in stages:
+            stages.append(stage)
+        logger.warning(f"{stage} cut off by the request deadline")
+        raise DeadlineExceeded(stage) from None
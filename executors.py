@@ -0,0 +1,147 @@
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from metrics import executor_wait
+
+logger = logging.getLogger(__name__)
+
+# Blocking work runs on one sized thread pool per workload instead of the loop's shared default
+# executor, so a burst of LLM calls cannot starve searches. Each pool admits new requests while
+# fewer than *_MAX_QUEUE tasks wait for a thread (0 = unbounded)
+SEARCH_EXECUTOR_WORKERS = int(os.getenv("SEARCH_EXECUTOR_WORKERS", "8"))
+SEARCH_EXECUTOR_MAX_QUEUE = int(os.getenv("SEARCH_EXECUTOR_MAX_QUEUE", "64"))
+LLM_EXECUTOR_WORKERS = int(os.getenv("LLM_EXECUTOR_WORKERS", "8"))
+LLM_EXECUTOR_MAX_QUEUE = int(os.getenv("LLM_EXECUTOR_MAX_QUEUE", "32"))
+PDF_EXECUTOR_MAX_QUEUE = int(os.getenv("PDF_EXECUTOR_MAX_QUEUE", "8"))
+# Upper bound (seconds) of the Retry-After sent with a 503 from a full pool
+EXECUTOR_MAX_RETRY_AFTER = int(os.getenv("EXECUTOR_MAX_RETRY_AFTER", "60"))
+
+
+class ExecutorSaturated(Exception):
+    """Raised when a request arrives while a pool's queue is at its max length."""
+
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} workers are busy, retry in {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# ==============================================
+# 🧵 Workload-isolated Thread Pools
+# ==============================================
+class WorkloadExecutor:
+    """
+    Named, fixed-size thread pool for one kind of blocking work.
+    - `run()` awaits a call on a pool thread, in a copy of the caller's context (like asyncio.to_thread)
+    - Queue depth (tasks waiting for a thread) and running tasks are tracked; the time each
+      task waited is observed in the executor_wait histogram
+    - `check_admission()` raises ExecutorSaturated while `max_queue` tasks are waiting; work
+      of requests already admitted always queues, so it is never dropped halfway
+    Counters are updated from pool threads, hence the lock; the pool itself is not bound to
+    an event loop, so one instance serves every loop of the process.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int = 0):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.queued = 0
+        self.running = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        # Moving average of task run time, for Retry-After estimates
+        self._avg_run_seconds = 1.0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self.stats = {"submitted": 0, "completed": 0, "rejected": 0}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-worker")
+        return self._executor
+
+    def saturated(self) -> bool:
+        return 0 < self.max_queue <= self.queued
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has likely drained, at least 1."""
+        estimate = math.ceil((self.queued + 1) / max(self.workers, 1) * self._avg_run_seconds)
+        return max(1, min(estimate, EXECUTOR_MAX_RETRY_AFTER))
+
+    def check_admission(self):
+        """Raise ExecutorSaturated if the queue is full, instead of letting a new request wait in it."""
+        if self.saturated():
+            self.stats["rejected"] += 1
+            logger.warning(f"{self.name} executor saturated ({self.queued} queued), rejecting request")
+            raise ExecutorSaturated(self.name, self.retry_after())
+
+    def _run_task(self, submitted_at: float, context: contextvars.Context, fn: Callable, args):
+        started = time.perf_counter()
+        waited = started - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+        executor_wait.observe(waited, executor=self.name)
+        try:
+            return context.run(fn, *args)
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.stats["completed"] += 1
+                self._avg_run_seconds = 0.8 * self._avg_run_seconds + 0.2 * (time.perf_counter() - started)
+
+    def _forget_cancelled(self, future):
+        # Cancelled before a thread picked it up: it never left the queue
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    async def run(self, fn: Callable, *args):
+        """Await `fn(*args)` on this pool. Cancelling the await drops the call if it has not started yet."""
+        with self._lock:
+            self.queued += 1
+            self.stats["submitted"] += 1
+        try:
+            future = self.executor.submit(
+                self._run_task, time.perf_counter(), contextvars.copy_context(), fn, args
+            )
+        except BaseException:
+            with self._lock:
+                self.queued -= 1
+            raise
+        future.add_done_callback(self._forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def get_stats(self):
+        with self._lock:
+            started = self.stats["completed"] + self.running
+            return {
+                **self.stats,
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "avg_wait_seconds": round(self._total_wait / started, 4) if started else 0.0,
+                "max_wait_seconds": round(self._max_wait, 4)
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Search I/O that still blocks (the SQLite tier of the search and LLM caches); SerpAPI and Apify calls are async
+search_executor = WorkloadExecutor("search", SEARCH_EXECUTOR_WORKERS, SEARCH_EXECUTOR_MAX_QUEUE)
+# CrewAI kickoffs and direct LLM calls, which hold a thread for the whole completion
+llm_executor = WorkloadExecutor("llm", LLM_EXECUTOR_WORKERS, LLM_EXECUTOR_MAX_QUEUE)
@@ -0,0 +1,167 @@
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from deadline import DeadlineExceeded, timed_out_stages, within_deadline
+from common import (
+    FareCalendar,
+    FareCalendarRequest,
+    FareCell,
+    FlightRequest,
+    flight_search_params,
+    run_google_search,
+    search_cache
+)
+
+logger = logging.getLogger(__name__)
+
+# Largest ± window around each date; a calendar has up to (2N + 1)^2 cells, one SerpAPI query each unless cached
+FARE_CALENDAR_MAX_FLEX_DAYS = int(os.getenv("FARE_CALENDAR_MAX_FLEX_DAYS", "3"))
+# Cells fetched at the same time per calendar
+FARE_CALENDAR_CONCURRENCY = int(os.getenv("FARE_CALENDAR_CONCURRENCY", "4"))
+
+
+# ==============================================
+# 📅 Flexible-date Fare Calendar
+# ==============================================
+def _date_window(date: str, flex_days: int, field: str) -> List[str]:
+    try:
+        center = datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {field}, expected YYYY-MM-DD")
+    return [(center + timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(-flex_days, flex_days + 1)]
+
+
+def calendar_dates(req: FareCalendarRequest) -> Tuple[List[str], List[str]]:
+    """Outbound and return dates of the calendar; raises HTTPException(400) for invalid dates or windows."""
+    for field, flex_days in (("outbound_flex_days", req.outbound_flex_days), ("return_flex_days", req.return_flex_days)):
+        if not 0 <= flex_days <= FARE_CALENDAR_MAX_FLEX_DAYS:
+            raise HTTPException(status_code=400, detail=f"{field} must be between 0 and {FARE_CALENDAR_MAX_FLEX_DAYS}")
+    return (
+        _date_window(req.outbound_date, req.outbound_flex_days, "outbound_date"),
+        _date_window(req.return_date, req.return_flex_days, "return_date")
+    )
+
+
+def cheapest_fare(outbound_date: str, return_date: str, search_results, cached=False) -> FareCell:
+    """Cheapest round-trip option of one google_flights result as a calendar cell."""
+    cell = FareCell(outbound_date=outbound_date, return_date=return_date, cached=cached)
+    if not isinstance(search_results, dict):
+        cell.error = "Search failed"
+        return cell
+    if "error" in search_results:
+        cell.error = str(search_results["error"])
+        return cell
+    options = [
+        option for option in search_results.get("best_flights", []) + search_results.get("other_flights", [])
+        if option.get("price") and option.get("flights")
+    ]
+    if not options:
+        cell.error = "No flights found"
+        return cell
+    best = min(options, key=lambda option: option["price"])
+    legs = best["flights"]
+    cell.price = int(best["price"])
+    cell.airline = legs[0].get("airline", "Unknown Airline")
+    cell.duration = int(best.get("total_duration", 0))
+    cell.stops = "Nonstop" if len(legs) == 1 else f"{len(legs) - 1} stop(s)"
+    return cell
+
+
+async def _cached_results(params: dict):
+    """Fresh search-cache entry for `params`, or None (never fetches)."""
+    if not search_cache.enabled:
+        return None
+    cached = await search_cache.get(search_cache.make_key("google_flights", params))
+    if cached is None:
+        return None
+    value, age, _ = cached
+    return value if age < search_cache.ttl_for("google_flights") else None
+
+
+async def fill_fare_calendar(req: FareCalendarRequest) -> AsyncIterator[FareCell]:
+    """
+    Yield the calendar cells as they are filled, without any LLM call:
+    1. every cell already in the search cache, cheapest first
+    2. the other cells as their google_flights searches finish, at most
+       FARE_CALENDAR_CONCURRENCY at a time, dates nearest the requested ones started first
+    Searches go through the shared search cache, so cells fetched here are reused by
+    later calendars and by /search_flights/ for the same route and dates (and vice versa).
+    Cells whose return date is before the outbound date are skipped. Cells not searched
+    before the request deadline (including those still queued) come back with `timed_out`.
+    """
+    outbound_dates, return_dates = calendar_dates(req)
+    pending = []
+    cached_cells = []
+    for i, outbound_date in enumerate(outbound_dates):
+        for j, return_date in enumerate(return_dates):
+            if return_date < outbound_date:
+                continue
+            params = flight_search_params(FlightRequest(
+                origin=req.origin, destination=req.destination, outbound_date=outbound_date, return_date=return_date
+            ))
+            cached = await _cached_results(params)
+            if cached is not None:
+                cached_cells.append(cheapest_fare(outbound_date, return_date, cached, cached=True))
+            else:
+                # Days away from the requested dates
+                distance = abs(i - req.outbound_flex_days) + abs(j - req.return_flex_days)
+                pending.append((distance, outbound_date, return_date, params))
+
+    for cell in sorted(cached_cells, key=lambda cell: (cell.price is None, cell.price or 0)):
+        yield cell
+
+    semaphore = asyncio.Semaphore(FARE_CALENDAR_CONCURRENCY)
+
+    async def search(params):
+        async with semaphore:
+            return await run_google_search(params)
+
+    async def fetch(outbound_date, return_date, params):
+        try:
+            results = await within_deadline("fare_calendar_search", search(params))
+        except DeadlineExceeded:
+            return FareCell(outbound_date=outbound_date, return_date=return_date, error="Timed out", timed_out=True)
+        except HTTPException as e:
+            return FareCell(outbound_date=outbound_date, return_date=return_date, error=str(e.detail))
+        except Exception as e:
+            logger.warning(f"Fare calendar search failed for {outbound_date} / {return_date}: {str(e)}")
+            return FareCell(outbound_date=outbound_date, return_date=return_date, error=str(e))
+        return cheapest_fare(outbound_date, return_date, results)
+
+    # Tasks queue on the semaphore in creation order, so the nearest dates are searched first
+    pending.sort(key=lambda item: item[0])
+    tasks = [asyncio.create_task(fetch(*item[1:])) for item in pending]
+    try:
+        for next_cell in asyncio.as_completed(tasks):
+            yield await next_cell
+    finally:
+        # The consumer stopped early (e.g. client disconnected): drop the searches still queued
+        for task in tasks:
+            task.cancel()
+
+
+def build_fare_calendar(req: FareCalendarRequest, cells: List[FareCell]) -> FareCalendar:
+    """Price matrix [outbound date][return date] of the filled cells plus the cheapest cell."""
+    outbound_dates, return_dates = calendar_dates(req)
+    prices: List[List[Optional[int]]] = [[None] * len(return_dates) for _ in outbound_dates]
+    outbound_index = {date: i for i, date in enumerate(outbound_dates)}
+    return_index = {date: j for j, date in enumerate(return_dates)}
+    for cell in cells:
+        prices[outbound_index[cell.outbound_date]][return_index[cell.return_date]] = cell.price
+    priced = [cell for cell in cells if cell.price is not None]
+    cells = sorted(cells, key=lambda cell: (cell.outbound_date, cell.return_date))
+    return FareCalendar(
+        origin=req.origin.strip().upper(),
+        destination=req.destination.strip().upper(),
+        outbound_dates=outbound_dates,
+        return_dates=return_dates,
+        prices=prices,
+        cheapest=min(priced, key=lambda cell: (cell.price, cell.outbound_date, cell.return_date)) if priced else None,
+        cells=cells,
+        timed_out_stages=timed_out_stages()
+    )
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import contextvars
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pipelines run concurrently by the job workers
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Submissions waiting for a worker; beyond this new jobs are rejected
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "20"))
+# Seconds a finished job (and its result) can still be fetched
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+# Suggested client back-off (seconds) when the queue is full or a result is not ready yet
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "5"))
+# Time budget (seconds) of one job's pipeline, like REQUEST_DEADLINE for synchronous requests; 0 = none
+JOB_DEADLINE = float(os.getenv("JOB_DEADLINE", "600"))
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at JOB_QUEUE_MAX_SIZE."""
+
+
+class Job:
+    """State of one submitted pipeline run: status, stage events so far, result or error."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.events = []
+        self.result = None
+        self.error: Optional[dict] = None
+
+    @property
+    def finished(self):
+        return self.status in ("succeeded", "failed")
+
+    def record_event(self, event: str, data: dict):
+        """Event sink for the pipeline: keeps each completed stage as a partial result."""
+        self.events.append({"event": event, "data": data})
+
+    def to_dict(self, since: int = 0):
+        result = self.result.model_dump() if hasattr(self.result, "model_dump") else self.result
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "events": self.events[since:],
+            "next_event": len(self.events),
+            "result": result,
+            "error": self.error
+        }
+
+
+# ==============================================
+# 🧵 Background Job Queue
+# ==============================================
+class JobQueue:
+    """
+    Bounded in-process queue for long-running pipelines.
+    - A fixed number of worker tasks run jobs in submission order
+    - Submissions beyond `max_queued` waiting jobs raise JobQueueFull
+    - Finished jobs are kept for `result_ttl` seconds, then forgotten
+    Jobs run in a copy of the submitter's context, so per-request settings
+    (e.g. the LLM cache opt-out) carry over.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_queued=JOB_QUEUE_MAX_SIZE, result_ttl=JOB_RESULT_TTL):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self.stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    def start(self):
+        """Start the worker tasks on the running event loop (no-op if they already run on it)."""
+        if self._worker_tasks and self._worker_tasks[0].get_loop() is asyncio.get_running_loop():
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers; running jobs are cancelled and queued jobs are dropped."""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    def submit(self, kind: str, run: Callable[[Job], Awaitable]) -> Job:
+        """Queue `run(job)` and return the job immediately. Raises JobQueueFull when the queue is full."""
+        self.start()
+        self._purge()
+        job = Job(kind)
+        try:
+            self._queue.put_nowait((job, run, contextvars.copy_context()))
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs waiting), try again later")
+        self._jobs[job.id] = job
+        self.stats["submitted"] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    def get_stats(self):
+        running = sum(1 for job in self._jobs.values() if job.status == "running")
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": running,
+            "retained": len(self._jobs),
+            "workers": len(self._worker_tasks)
+        }
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job, run, context = await self._queue.get()
+            try:
+                # Each job gets its own task in the submitter's context so context vars never leak between jobs
+                await loop.create_task(self._run(job, run), context=context)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job, run: Callable[[Job], Awaitable]):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = await run(job)
+            job.status = "succeeded"
+            self.stats["succeeded"] += 1
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = {"status_code": 503, "detail": "Job cancelled (server shutting down)"}
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            job.status = "failed"
+            job.error = {"status_code": getattr(e, "status_code", 500), "detail": getattr(e, "detail", str(e))}
+            self.stats["failed"] += 1
+        finally:
+            job.finished_at = time.time()
+
+
+job_queue = JobQueue()
@@ -0,0 +1,146 @@
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds; external calls range from cached (ms) to LLM/actor runs (tens of seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+# ==============================================
+# 📊 Latency Histograms (Prometheus text format)
+# ==============================================
+class Histogram:
+    """
+    Minimal cumulative histogram with labels, rendered in the Prometheus text
+    exposition format. Safe to observe from worker threads.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (non-cumulative), then sum and count
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += seconds
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    @staticmethod
+    def _format_labels(pairs):
+        if not pairs:
+            return ""
+        escaped = []
+        for name, value in pairs:
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            escaped.append(f'{name}="{value}"')
+        return "{" + ",".join(escaped) + "}"
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, [list(counts), total, count]) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{self._format_labels(labels + [('le', repr(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{self._format_labels(labels + [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{self._format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+stage_latency = Histogram(
+    "travel_planner_stage_duration_seconds",
+    "Duration of external calls (SerpAPI, Apify, LLM, PDF render) and endpoint stages.",
+    labelnames=("stage",)
+)
+
+request_latency = Histogram(
+    "travel_planner_http_request_duration_seconds",
+    "Duration of HTTP requests by route.",
+    labelnames=("method", "path", "status")
+)
+
+
+executor_wait = Histogram(
+    "travel_planner_executor_wait_seconds",
+    "Time blocking tasks waited for a thread of their workload pool (search, llm, pdf).",
+    labelnames=("executor",)
+)
+
+
+def render_metrics() -> str:
+    """All histograms in Prometheus text exposition format."""
+    return "".join(h.render() for h in (stage_latency, request_latency, executor_wait))
+
+
+# ==============================================
+# ⏱️ Per-request Stage Timings (Server-Timing)
+# ==============================================
+# stage -> (total seconds, count) for the current request; tasks spawned by the
+# request share the same dict. When unset, only the histograms are updated.
+_request_timings: ContextVar[Optional[Dict[str, Tuple[float, int]]]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> Dict[str, Tuple[float, int]]:
+    """Start collecting stage timings for the current request and return the collecting dict."""
+    timings: Dict[str, Tuple[float, int]] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(stage: str, seconds: float):
+    """Observe one stage duration in the histogram and in the current request's timings."""
+    stage_latency.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        total, count = timings.get(stage, (0.0, 0))
+        timings[stage] = (total + seconds, count + 1)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block (sync or async code) as `stage`, including when it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def server_timing_header(timings: Dict[str, Tuple[float, int]], total: Optional[float] = None) -> str:
+    """
+    Format timings as a Server-Timing header value. Durations of stages that ran
+    more than once in the request (e.g. one hotel search per location) are summed.
+    """
+    entries = []
+    for stage, (seconds, count) in timings.items():
+        entry = f"{stage};dur={seconds * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    if total is not None:
+        entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
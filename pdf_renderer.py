@@ -0,0 +1,142 @@
+import os
+import re
+import html
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from functools import lru_cache
+
+from executors import PDF_EXECUTOR_MAX_QUEUE, WorkloadExecutor
+from singleflight import SingleFlight
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Max concurrent wkhtmltopdf renders (each one is a child process)
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))
+# Rendered PDFs kept in memory, keyed by hash of markdown + title
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "64"))
+WKHTMLTOPDF_PATH = os.getenv("WKHTMLTOPDF_PATH", os.path.join(BASE_DIR, 'wkhtmltox', 'wkhtmltopdf.exe'))
+# Local emoji font file, so rendering never waits on a remote stylesheet (not shipped: see README)
+PDF_EMOJI_FONT_PATH = os.getenv("PDF_EMOJI_FONT_PATH", os.path.join(BASE_DIR, 'fonts', 'NotoEmoji-Regular.ttf'))
+# Stylesheet fetched by wkhtmltopdf only while the font file is missing; empty = never fetch
+PDF_EMOJI_FONT_URL = os.getenv("PDF_EMOJI_FONT_URL", "https://fonts.googleapis.com/css2?family=Noto+Emoji:wght@400")
+
+EMOJI_PATTERN = re.compile(
+    r'([\U0001F300-\U0001FAFF\U00002600-\U000026FF\U00002700-\U000027BF\U0001F1E6-\U0001F1FF])'
+)
+
+
+@lru_cache(maxsize=1)
+def wkhtmltopdf_configuration():
+    """Resolve the wkhtmltopdf binary once instead of on every request."""
+    import pdfkit
+
+    return pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
+
+
+def emoji_font_face():
+    """@font-face rule for the emoji font: a locally installed one, else the PDF_EMOJI_FONT_PATH file."""
+    sources = ["local('Noto Emoji')"]
+    if os.path.exists(PDF_EMOJI_FONT_PATH):
+        sources.append(f"url('file://{PDF_EMOJI_FONT_PATH.replace(os.sep, '/')}')")
+    return f"@font-face {{ font-family: 'Noto Emoji'; src: {', '.join(sources)}; }}"
+
+
+def emoji_font_link():
+    """<link> to the remote emoji stylesheet when the font file is missing, so emoji still render."""
+    if os.path.exists(PDF_EMOJI_FONT_PATH) or not PDF_EMOJI_FONT_URL:
+        return ""
+    return f'<link href="{html.escape(PDF_EMOJI_FONT_URL)}" rel="stylesheet">'
+
+
+def build_itinerary_html(markdown_text: str, title: str) -> str:
+    """Convert itinerary markdown to the full HTML document handed to wkhtmltopdf."""
+    import markdown as md
+
+    html_content = md.markdown(markdown_text, extensions=["extra", "smarty"])
+    html_content = EMOJI_PATTERN.sub(r'<span class="emoji">\1</span>', html_content)
+    return f"""
+    <html>
+    <head>
+      <meta charset="utf-8">
+      <title>{html.escape(title)}</title>
+      {emoji_font_link()}
+      <style>
+        {emoji_font_face()}
+        body {{ background: #fff; color: #222; font-family: Arial, sans-serif; margin: 2em; }}
+        /* Only apply Noto Emoji to emoji characters */
+        .emoji {{ font-family: 'Noto Emoji', Arial, sans-serif !important; }}
+      </style>
+    </head>
+    <body>{html_content}</body>
+    </html>
+    """
+
+
+# ==============================================
+# 🖨️ PDF Renderer (bounded worker pool + cache)
+# ==============================================
+class PdfRenderer:
+    """
+    Renders itinerary markdown to PDF off the event loop.
+    - A fixed-size "pdf" workload pool bounds concurrent wkhtmltopdf processes
+    - Results are cached by hash of markdown + title
+    - Identical concurrent renders share one wkhtmltopdf run
+    """
+
+    def __init__(self, workers=PDF_RENDER_WORKERS, cache_entries=PDF_CACHE_MAX_ENTRIES):
+        self.workers = workers
+        self.cache_entries = cache_entries
+        self.executor = WorkloadExecutor("pdf", workers, PDF_EXECUTOR_MAX_QUEUE)
+        self._cache = OrderedDict()
+        self._singleflight = SingleFlight()
+        self.stats = {"renders": 0, "cache_hits": 0}
+
+    @staticmethod
+    def cache_key(markdown_text: str, title: str) -> str:
+        return hashlib.sha256(f"{title}\0{markdown_text}".encode("utf-8")).hexdigest()
+
+    def _render(self, markdown_text: str, title: str) -> bytes:
+        # pdfkit and markdown are only imported here, on the pdf pool (or by warm_up)
+        import pdfkit
+
+        html_full = build_itinerary_html(markdown_text, title)
+        options = {"enable-local-file-access": ""} if os.path.exists(PDF_EMOJI_FONT_PATH) else {}
+        return pdfkit.from_string(html_full, False, configuration=wkhtmltopdf_configuration(), options=options)
+
+    async def render(self, markdown_text: str, title: str) -> bytes:
+        key = self.cache_key(markdown_text, title)
+        pdf = self._cache.get(key)
+        if pdf is not None:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return pdf
+
+        async def run():
+            self.stats["renders"] += 1
+            with timed("pdf_render"):
+                return await self.executor.run(self._render, markdown_text, title)
+
+        pdf = await self._singleflight.do(key, run)
+        self._cache[key] = pdf
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_entries:
+            self._cache.popitem(last=False)
+        return pdf
+
+    async def warm_up(self):
+        """Start the worker threads and resolve wkhtmltopdf ahead of the first request."""
+        try:
+            await asyncio.gather(*(self.executor.run(wkhtmltopdf_configuration) for _ in range(self.workers)))
+        except Exception as e:
+            logger.warning(f"PDF renderer warm-up: {str(e)}")
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+
+pdf_renderer = PdfRenderer()
@@ -0,0 +1,216 @@
+import os
+import re
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLIGHT_WEIGHTS = {"price": 0.5, "duration": 0.25, "stops": 0.15, "layovers": 0.1}
+DEFAULT_HOTEL_WEIGHTS = {"price": 0.5, "rating": 0.5}
+
+
+def parse_weights(value: str, defaults: Dict[str, float]) -> Dict[str, float]:
+    """Parse "price=0.6,rating=0.4" into a weight dict; unknown or malformed entries are ignored."""
+    weights = dict(defaults)
+    for part in (value or "").split(","):
+        name, _, raw = part.partition("=")
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in defaults:
+            logger.warning(f"Ignoring unknown ranking weight '{name}'")
+            continue
+        try:
+            weights[name] = float(raw)
+        except ValueError:
+            logger.warning(f"Ignoring invalid ranking weight '{part.strip()}'")
+    return weights
+
+
+# "llm": the AI recommendation picks the options; "score": the scoring engine below picks them
+RANKING_MODE = os.getenv("RANKING_MODE", "llm").lower()
+FLIGHT_SCORE_WEIGHTS = parse_weights(os.getenv("FLIGHT_SCORE_WEIGHTS", ""), DEFAULT_FLIGHT_WEIGHTS)
+HOTEL_SCORE_WEIGHTS = parse_weights(os.getenv("HOTEL_SCORE_WEIGHTS", ""), DEFAULT_HOTEL_WEIGHTS)
+# Drop flights/hotels that another option beats on every criterion before recommending/returning them
+PARETO_PRUNING = os.getenv("PARETO_PRUNING", "false").lower() == "true"
+
+
+# ==============================================
+# 🏅 Deterministic Option Scoring
+# ==============================================
+def _normalized(values: List[float], higher_is_better=False) -> List[float]:
+    """Min-max normalize to 0 (best) .. 1 (worst) within the candidate set."""
+    low, high = min(values), max(values)
+    if high == low:
+        return [0.0] * len(values)
+    if higher_is_better:
+        return [(high - v) / (high - low) for v in values]
+    return [(v - low) / (high - low) for v in values]
+
+
+def _known_or_worst(values: List[float], higher_is_better=False) -> List[float]:
+    """Providers report unknown prices/ratings as 0; rank those as the worst known value."""
+    known = [v for v in values if v > 0]
+    if not known:
+        return values
+    worst = min(known) if higher_is_better else max(known)
+    return [v if v > 0 else worst for v in values]
+
+
+def _stop_count(stops: str) -> int:
+    match = re.match(r"\s*(\d+)", stops or "")
+    return int(match.group(1)) if match else 0
+
+
+def _scores(criteria: Dict[str, List[float]], weights: Dict[str, float], higher_is_better=()) -> List[float]:
+    """Weighted sum of normalized criteria per candidate; lower is better."""
+    columns = {name: _normalized(values, name in higher_is_better) for name, values in criteria.items()}
+    count = len(next(iter(criteria.values())))
+    return [sum(weights.get(name, 0.0) * columns[name][i] for name in columns) for i in range(count)]
+
+
+def _flight_criteria(flights):
+    """
+    Criteria of every (departure_index, return_index) combination; departures without
+    returns use return index 0. Returns (candidates, {criterion: [value per candidate]}).
+    """
+    candidates = []
+    criteria = {"price": [], "duration": [], "stops": [], "layovers": []}
+    for i, flight in enumerate(flights):
+        layovers = sum(layover.duration for layover in flight.layovers)
+        for j, ret in enumerate(flight.return_flights or [None]):
+            ret = ret or {}
+            candidates.append((i, j))
+            criteria["price"].append(ret.get("price") or flight.price)
+            criteria["duration"].append(flight.duration + ret.get("duration", 0))
+            criteria["stops"].append(_stop_count(flight.stops) + _stop_count(ret.get("stops", "")))
+            criteria["layovers"].append(layovers + sum(lay.get("duration", 0) for lay in ret.get("layovers", [])))
+    if candidates:
+        criteria["price"] = _known_or_worst(criteria["price"])
+    return candidates, criteria
+
+
+def _flight_scores(flights, weights: Dict[str, float]) -> Dict[Tuple[int, int], float]:
+    """Score of every (departure_index, return_index) combination."""
+    candidates, criteria = _flight_criteria(flights)
+    if not candidates:
+        return {}
+    return dict(zip(candidates, _scores(criteria, weights)))
+
+
+def rank_flights(flights, weights: Dict[str, float] = None) -> Tuple[int, int]:
+    """
+    Pick the best departure + return combination from FlightInfo results by price
+    (the return option's round-trip price when known), total duration, stops and
+    layover time. Returns zero-based (departure_index, return_index), like
+    extract_recommended_flight_indices. Ties go to the earlier option.
+    """
+    scores = _flight_scores(flights, weights or FLIGHT_SCORE_WEIGHTS)
+    if not scores:
+        return 0, 0
+    return min(scores, key=lambda combination: (scores[combination], combination))
+
+
+def order_flights(flights, weights: Dict[str, float] = None) -> List[Tuple[int, List[int]]]:
+    """
+    Departures best-first (by their best combination), each with its return indices
+    best-first: [(departure_index, [return_index, ...]), ...].
+    """
+    scores = _flight_scores(flights, weights or FLIGHT_SCORE_WEIGHTS)
+    by_departure: Dict[int, List[Tuple[float, int]]] = {}
+    for (i, j), score in scores.items():
+        by_departure.setdefault(i, []).append((score, j))
+    ordered = sorted(by_departure.items(), key=lambda item: (min(item[1]), item[0]))
+    return [
+        (i, [j for _, j in sorted(returns)] if flights[i].return_flights else [])
+        for i, returns in ordered
+    ]
+
+
+def _hotel_scores(hotels, weights: Dict[str, float]) -> List[float]:
+    criteria = {
+        "price": _known_or_worst([hotel.price for hotel in hotels]),
+        "rating": _known_or_worst([hotel.rating for hotel in hotels], higher_is_better=True),
+    }
+    return _scores(criteria, weights, higher_is_better=("rating",))
+
+
+def rank_hotels(hotels, weights: Dict[str, float] = None) -> int:
+    """Pick the best HotelInfo by nightly price and rating. Returns a zero-based index, like extract_recommended_hotel_index."""
+    if not hotels:
+        return 0
+    scores = _hotel_scores(hotels, weights or HOTEL_SCORE_WEIGHTS)
+    return min(range(len(hotels)), key=lambda i: (scores[i], i))
+
+
+def order_hotels(hotels, weights: Dict[str, float] = None) -> List[int]:
+    """Hotel indices best-first."""
+    if not hotels:
+        return []
+    scores = _hotel_scores(hotels, weights or HOTEL_SCORE_WEIGHTS)
+    return sorted(range(len(hotels)), key=lambda i: (scores[i], i))
+
+
+# ==============================================
+# 🧹 Pareto-front Pruning
+# ==============================================
+def pareto_front(costs) -> np.ndarray:
+    """
+    Boolean mask of the non-dominated rows of a (candidates x criteria) cost matrix,
+    lower is better in every column. A row is dominated when another row is no worse
+    in every column and better in at least one; identical rows are all kept.
+
+    Rows are visited in lexicographic order: the first remaining row cannot be dominated
+    by any remaining row, so it is kept and everything it dominates is dropped in one
+    vectorized comparison. Cost is O(candidates x front size) instead of all pairs.
+    """
+    costs = np.asarray(costs, dtype=float)
+    keep = np.zeros(len(costs), dtype=bool)
+    if costs.ndim != 2 or len(costs) == 0:
+        return np.ones(len(costs), dtype=bool)
+    remaining = np.lexsort(costs.T[::-1])
+    while len(remaining):
+        best = costs[remaining[0]]
+        keep[remaining[0]] = True
+        rest = costs[remaining[1:]]
+        dominated = np.all(rest >= best, axis=1) & np.any(rest > best, axis=1)
+        remaining = remaining[1:][~dominated]
+    return keep
+
+
+def prune_flights(flights):
+    """
+    Keep only Pareto-optimal departure + return combinations by price, total duration
+    and stops. Departures without a surviving combination are dropped; the others keep
+    only their surviving return options, in their original order.
+    """
+    candidates, criteria = _flight_criteria(flights)
+    if len(candidates) < 2:
+        return list(flights)
+    keep = pareto_front(np.column_stack([criteria["price"], criteria["duration"], criteria["stops"]]))
+    kept_returns: Dict[int, List[int]] = {}
+    for (i, j), kept in zip(candidates, keep):
+        if kept:
+            kept_returns.setdefault(i, []).append(j)
+    pruned = []
+    for i, flight in enumerate(flights):
+        if i not in kept_returns:
+            continue
+        if flight.return_flights and len(kept_returns[i]) < len(flight.return_flights):
+            flight = flight.model_copy(update={"return_flights": [flight.return_flights[j] for j in kept_returns[i]]})
+        pruned.append(flight)
+    logger.debug(f"Pareto pruning kept {int(keep.sum())} of {len(candidates)} flight combinations")
+    return pruned
+
+
+def prune_hotels(hotels):
+    """Keep only Pareto-optimal hotels by nightly price and rating, in their original order."""
+    if len(hotels) < 2:
+        return list(hotels)
+    prices = _known_or_worst([hotel.price for hotel in hotels])
+    ratings = _known_or_worst([hotel.rating for hotel in hotels], higher_is_better=True)
+    keep = pareto_front(np.column_stack([prices, np.negative(ratings)]))
+    logger.debug(f"Pareto pruning kept {int(keep.sum())} of {len(hotels)} hotels")
+    return [hotel for hotel, kept in zip(hotels, keep) if kept]
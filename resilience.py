@@ -0,0 +1,162 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Consecutive transient failures that open a breaker, and seconds it stays open before a trial call
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+# Retry n waits a random time up to min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2^n) seconds ("full jitter")
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "5"))
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_transient(exc: BaseException) -> bool:
+    """
+    Failures worth retrying and counting against a breaker: timeouts, connection errors,
+    429 and 5xx responses. Other errors (bad key, bad request) mean the upstream is up.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, OSError, httpx.TransportError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None and isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+def retry_after_hint(exc: BaseException) -> Optional[float]:
+    """Seconds the upstream asked to wait in the Retry-After header of a 429/5xx response, if any."""
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    header = exc.response.headers.get("retry-after", "").strip()
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Seconds to wait before retry `attempt` (0-based): exponential backoff with full jitter."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+# ==============================================
+# 🔌 Circuit Breaker + Retries
+# ==============================================
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker:
+    - closed: calls go through; BREAKER_FAILURE_THRESHOLD consecutive transient failures open it
+    - open: calls fail fast with CircuitOpen for BREAKER_RESET_TIMEOUT seconds
+    - half-open: one trial call goes through; success closes the breaker, failure opens it again
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout if reset_timeout is not None else BREAKER_RESET_TIMEOUT
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0, "opened": 0}
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker lets a trial call through."""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def _before_call(self):
+        if self.state == "open":
+            if self.retry_after() > 0:
+                self.stats["rejected"] += 1
+                raise CircuitOpen(self.name, self.retry_after())
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial_running:
+                self.stats["rejected"] += 1
+                raise CircuitOpen(self.name, self.reset_timeout)
+            self._trial_running = True
+        self.stats["calls"] += 1
+
+    def _record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._trial_running = False
+
+    def _record_failure(self):
+        self.stats["failures"] += 1
+        self.failures += 1
+        self._trial_running = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.stats["opened"] += 1
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable], retries: int = 0,
+                   retry_on: Optional[Callable[[BaseException], bool]] = None):
+        """
+        Await `fn()` through the breaker, retrying transient failures up to `retries` times
+        with jittered exponential backoff. A response's Retry-After is waited out instead when
+        longer, and not retried at all when longer than RETRY_MAX_DELAY. `retry_on` can narrow
+        which transient failures are retried (all of them still count against the breaker).
+        Only pass idempotent calls.
+        Raises CircuitOpen without calling `fn` while the breaker is open.
+        """
+        for attempt in range(retries + 1):
+            self._before_call()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_transient(e):
+                    self._record_success()
+                    raise
+                self._record_failure()
+                hint = retry_after_hint(e) or 0.0
+                if attempt == retries or self.state == "open" or (retry_on and not retry_on(e)) or hint > RETRY_MAX_DELAY:
+                    raise
+                self.stats["retries"] += 1
+                delay = max(backoff_delay(attempt), hint)
+                logger.warning(f"{self.name} call failed ({type(e).__name__}: {e}), retry {attempt + 1}/{retries} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled: no verdict on the upstream, let the next call try
+                self._trial_running = False
+                raise
+            else:
+                self._record_success()
+                return result
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": round(self.retry_after(), 1) if self.state == "open" else 0
+        }
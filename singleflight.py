@@ -0,0 +1,97 @@
+import asyncio
+import functools
+import logging
+import contextvars
+from contextvars import ContextVar
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================
+# 🔀 Single-flight Request Coalescing
+# ==============================================
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: the first caller for a key starts the
+    upstream call, concurrent callers with the same key await the same future and
+    receive the same result (or exception). Results are shared, so callers must
+    treat them as read-only.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key, fn):
+        self.stats["calls"] += 1
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._forget, key))
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one waiter being cancelled does not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            # Mark the exception as retrieved in case every waiter was cancelled
+            future.exception()
+
+    def get_stats(self):
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+# Per-request map of coalesce key -> task started ahead of time by prefetch()
+_prefetched: ContextVar[Optional[dict]] = ContextVar("prefetched", default=None)
+
+
+def coalesce(group: SingleFlight):
+    """Decorator: coalesce concurrent calls of an async function taking a Pydantic request."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(request):
+            key = f"{func.__name__}:{request.model_dump_json()}"
+            prefetched = _prefetched.get()
+            if prefetched and key in prefetched:
+                return await asyncio.shield(prefetched[key])
+            return await group.do(key, lambda: func(request))
+        return wrapper
+    return decorator
+
+
+def start_prefetching() -> dict:
+    """
+    Let the current request (and tasks it creates) reuse calls started with prefetch().
+    Returns the map of prefetched tasks so the caller can cancel leftovers.
+    """
+    prefetched = {}
+    _prefetched.set(prefetched)
+    return prefetched
+
+
+def prefetch(func, request, semaphore: Optional[asyncio.Semaphore] = None) -> Optional[asyncio.Task]:
+    """
+    Start a @coalesce-decorated call now so a later identical call in this request
+    awaits its result instead of starting again. No-op outside start_prefetching().
+    """
+    prefetched = _prefetched.get()
+    if prefetched is None:
+        return None
+    key = f"{func.__name__}:{request.model_dump_json()}"
+    if key not in prefetched:
+        async def run():
+            if semaphore is None:
+                return await func(request)
+            async with semaphore:
+                return await func(request)
+
+        # The prefetch itself must not find its own entry
+        context = contextvars.copy_context()
+        context.run(_prefetched.set, None)
+        prefetched[key] = asyncio.get_running_loop().create_task(run(), context=context)
+    return prefetched[key]
@@ -4,10 +4,33 @@ import sys
 import os
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+import asyncio
+import json
+import time
 import unittest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
+import api_endpoints
 from api_endpoints import app
-from common import FlightRequest, HotelRequest, ItineraryRequest
+import common
+from cache import TTLCache
+from singleflight import SingleFlight, coalesce
+from common import AIResponse, FlightInfo, FlightRequest, HotelRequest, HotelInfo, ItineraryRequest
+
+
+def flight_info(airline="Air", price=1000, origin="DEL", destination="GOI", return_price=2000):
+    """Departure option with one return option (none when return_price is None)."""
+    return_flights = [] if return_price is None else [{
+        "airline": "Air", "price": return_price, "duration": 120, "stops": "Nonstop",
+        "departure": destination, "arrival": origin, "travel_class": "Economy"
+    }]
+    return FlightInfo(airline=airline, price=price, duration=120, stops="Nonstop", departure=origin, arrival=destination,
+                      travel_class="Economy", return_date="2024-07-05", airline_logo="", return_flights=return_flights)
+
+
+def hotel_info(location, name="Sea Inn", price=1000, rating=8.5):
+    return HotelInfo(name=name, price=price, rating=rating, location=location, link="")
+
 
 class TestBackendAPI(unittest.TestCase):
     @classmethod
@@ -226,5 +249,449 @@ class TestBackendAPI(unittest.TestCase):
         response = self.client.post("/search_hotels/", data="not a json", headers={"Content-Type": "application/json"})
         self.assertEqual(response.status_code, 422)
 
+    # --- PIPELINED HOTEL SEARCH ---
+
+    def test_search_hotels_pipelines_search_and_recommendation(self):
+        events = []
+
+        async def fake_search(req):
+            events.append(f"search start {req.location}")
+            await asyncio.sleep(0.01 if req.location == "Fast" else 0.1)
+            events.append(f"search end {req.location}")
+            return [hotel_info(req.location, name=f"{req.location} Inn")]
+
+        async def fake_recommendation(data_type, text):
+            events.append("recommendation")
+            return "Recommended Hotel: 1"
+
+        req = [
+            {"location": "Fast", "check_in_date": "2024-07-01", "check_out_date": "2024-07-03"},
+            {"location": "Slow", "check_in_date": "2024-07-03", "check_out_date": "2024-07-05"}
+        ]
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "search_booking_hotels", fake_search), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation):
+            response = self.client.post("/search_hotels/", json=req)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([g["location"] for g in body["hotels_grouped"]], ["Fast", "Slow"])
+        self.assertEqual(len(body["ai_hotel_recommendations"]), 2)
+        # Both searches run concurrently and the first recommendation starts before the slow search ends
+        self.assertEqual(events[:2], ["search start Fast", "search start Slow"])
+        self.assertLess(events.index("recommendation"), events.index("search end Slow"))
+
+    # --- STREAMING TRAVEL PLAN ---
+
+    def test_ai_travel_plan_stream_emits_stage_events(self):
+        trip_plan = {
+            "origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05",
+            "hotel_areas": [{"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}],
+            "day_plan": [{"date": "2024-07-02", "activities": ["Beach"]}]
+        }
+
+        async def fake_plan(req, **kwargs):
+            return trip_plan
+
+        async def fake_flights(req):
+            return [flight_info("TestAir", 5000)]
+
+        async def fake_hotels(req):
+            return [hotel_info(req.location, price=3000)]
+
+        async def fake_recommendation(data_type, text):
+            return "Recommended Departure Flight: 1" if data_type == "flights" else "Recommended Hotel: 1"
+
+        async def fake_itinerary(**kwargs):
+            return "# Goa"
+
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "plan_trip_agent", fake_plan), \
+                patch.object(api_endpoints, "search_flights", fake_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", fake_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            response = self.client.post("/ai_travel_plan/stream", json={
+                "source_city": "Delhi", "destination_city": "Goa", "from_date": "2024-07-01", "return_date": "2024-07-05"
+            })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = [line[len("event: "):] for line in response.text.splitlines() if line.startswith("event: ")]
+        self.assertEqual(events[0], "trip_plan")
+        self.assertEqual(events[-2:], ["itinerary", "done"])
+        self.assertEqual(
+            sorted(events[1:-2]),
+            ["flight_recommendation", "flights", "hotel_recommendation", "hotels"]
+        )
+
+    # --- LLM CACHE OPT-OUT ---
+
+    def test_generate_itinerary_cache_control_no_cache_bypasses_llm_cache(self):
+        kickoffs = []
+
+        class FakeCrew:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def kickoff(self):
+                kickoffs.append(1)
+                return "# Itinerary"
+
+        req = {
+            "destination": "Mumbai",
+            "check_in_date": "2024-07-01",
+            "check_out_date": "2024-07-05",
+            "flights": "Flight details here",
+            "hotels": "Hotel details here"
+        }
+        with patch.object(common, "llm_cache", TTLCache(path=None, default_ttl=60)), \
+                patch("crewai.Agent", lambda **kwargs: None), \
+                patch("crewai.Task", lambda **kwargs: None), \
+                patch("crewai.Crew", FakeCrew), \
+                patch.object(common, "initialize_llm", lambda: None):
+            self.assertEqual(self.client.post("/generate_itinerary/", json=req).status_code, 200)
+            self.assertEqual(self.client.post("/generate_itinerary/", json=req).status_code, 200)
+            self.assertEqual(len(kickoffs), 1)
+            response = self.client.post("/generate_itinerary/", json=req, headers={"Cache-Control": "no-cache"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(kickoffs), 2)
+
+    # --- METRICS ---
+
+    def test_server_timing_header_and_metrics_endpoint(self):
+        async def fake_search(req):
+            return [hotel_info(req.location)]
+
+        async def fake_recommendation(data_type, text):
+            return "Recommended Hotel: 1"
+
+        req = [
+            {"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-03"},
+            {"location": "Panaji", "check_in_date": "2024-07-03", "check_out_date": "2024-07-05"}
+        ]
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "search_booking_hotels", fake_search), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation):
+            response = self.client.post("/search_hotels/", json=req)
+
+        self.assertEqual(response.status_code, 200)
+        server_timing = response.headers["server-timing"]
+        self.assertIn('hotel_search;dur=', server_timing)
+        self.assertIn('desc="2 calls"', server_timing)
+        self.assertIn('total;dur=', server_timing)
+
+        metrics = self.client.get("/metrics")
+        self.assertEqual(metrics.status_code, 200)
+        self.assertTrue(metrics.headers["content-type"].startswith("text/plain"))
+        self.assertIn('travel_planner_stage_duration_seconds_count{stage="hotel_search"}', metrics.text)
+        self.assertIn('path="/search_hotels/"', metrics.text)
+
+    def test_ai_travel_plan_starts_searches_before_plan_finishes(self):
+        events = []
+        trip_plan = {
+            "origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05",
+            "hotel_areas": [{"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}],
+            "day_plan": [{"date": "2024-07-02", "activities": ["Beach"]}]
+        }
+
+        async def fake_plan(req, on_partial=None, **kwargs):
+            on_partial("flight", {k: trip_plan[k] for k in ("origin", "destination", "outbound_date", "return_date")})
+            on_partial("hotel_area", trip_plan["hotel_areas"][0])
+            await asyncio.sleep(0.05)  # the day plan is still being written
+            events.append("plan done")
+            return trip_plan
+
+        group = SingleFlight()
+
+        @coalesce(group)
+        async def search_flights(req):
+            events.append("flight search")
+            return [flight_info()]
+
+        @coalesce(group)
+        async def search_booking_hotels(req):
+            events.append("hotel search")
+            return [hotel_info(req.location)]
+
+        async def fake_recommendation(data_type, text):
+            return "Recommended Hotel: 1"
+
+        async def fake_itinerary(**kwargs):
+            return "# Trip"
+
+        req = {"source_city": "Delhi", "destination_city": "Goa", "from_date": "2024-07-01", "return_date": "2024-07-05"}
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "TRIP_PLAN_STREAMING", True), \
+                patch.object(api_endpoints, "plan_trip_agent", fake_plan), \
+                patch.object(api_endpoints, "search_flights", search_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", search_booking_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            response = self.client.post("/ai_travel_plan/", json=req)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["itinerary"], "# Trip")
+        # Each search ran once, before the plan finished, and was reused by the pipeline
+        self.assertEqual(sorted(events[:2]), ["flight search", "hotel search"])
+        self.assertEqual(events[2:], ["plan done"])
+
+    def test_complete_search_score_mode_runs_itinerary_with_recommendations(self):
+        events = []
+        itinerary_started = asyncio.Event()
+
+        async def fake_flights(req):
+            return [flight_info(f"Air {price}", price, return_price=price * 2) for price in (9000, 4000)]
+
+        async def fake_hotels(req):
+            return [hotel_info(req.location, name="Pricey Inn", price=9000, rating=8.0),
+                    hotel_info(req.location, price=2000, rating=9.0)]
+
+        async def fake_recommendation(data_type, text, selected=None):
+            events.append(f"{data_type} recommendation for {selected}")
+            # Only finishes once the itinerary has started, so both must run in parallel
+            await asyncio.wait_for(itinerary_started.wait(), 1)
+            return f"Recommended: {selected}"
+
+        async def fake_itinerary(**kwargs):
+            itinerary_started.set()
+            events.append("itinerary")
+            return f"{kwargs['flights_text']}\n{kwargs['hotels_text']}"
+
+        req = {
+            "flight_request": {"origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05"},
+            "hotel_request": [{"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}]
+        }
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "RANKING_MODE", "score"), \
+                patch.object(api_endpoints, "search_flights", fake_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", fake_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            response = self.client.post("/complete_search/", json=req)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertIn("Air 4000", body["itinerary"])
+        self.assertIn("Sea Inn", body["itinerary"])
+        self.assertEqual(body["ai_flight_recommendation"], "Recommended: Departure Flight 2 with Return Flight 1")
+        self.assertEqual(body["ai_hotel_recommendations"], ["Recommended: Hotel 2"])
+        self.assertIn("itinerary", events)
+
+    # --- DEADLINE ---
+
+    def partial_search(self, flight_delay=0.0, recommendation_delay=0.0):
+        async def fake_flights(req):
+            await asyncio.sleep(flight_delay)
+            return [flight_info(price=4000, return_price=None)]
+
+        async def fake_hotels(req):
+            return [hotel_info(req.location, price=2000, rating=9.0)]
+
+        async def fake_recommendation(data_type, text):
+            await asyncio.sleep(recommendation_delay if data_type == "hotels" else 0)
+            return f"{data_type} recommendation"
+
+        async def fake_itinerary(**kwargs):
+            return "itinerary"
+
+        req = {"flight_request": {"origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05"}}
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "search_flights", fake_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", fake_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            start = time.perf_counter()
+            response = self.client.post("/complete_search/", json=req, headers={"X-Request-Deadline": "0.3"})
+            return response, time.perf_counter() - start
+
+    def test_complete_search_returns_finished_stages_when_the_deadline_runs_out(self):
+        response, elapsed = self.partial_search(recommendation_delay=5)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, 2)
+        body = response.json()
+        self.assertEqual([f["airline"] for f in body["flights"]], ["Air"])
+        self.assertEqual([h["name"] for h in body["hotels"]], ["Sea Inn"])
+        self.assertEqual(body["ai_flight_recommendation"], "flights recommendation")
+        self.assertEqual(body["ai_hotel_recommendations"], ["Hotel recommendation timed out."])
+        self.assertEqual(body["itinerary"], "")
+        self.assertEqual(body["timed_out_stages"], ["hotel_recommendation", "itinerary"])
+
+    def test_complete_search_with_timed_out_flight_search_keeps_hotels(self):
+        response, elapsed = self.partial_search(flight_delay=5)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(elapsed, 2)
+        body = response.json()
+        self.assertEqual(body["flights"], [])
+        self.assertEqual(body["ai_flight_recommendation"], "Could not retrieve flights.")
+        self.assertEqual(body["ai_hotel_recommendations"], ["hotels recommendation"])
+        self.assertEqual(body["timed_out_stages"], ["flight_search"])
+
+    def test_selected_flight_without_return_options_still_formats(self):
+        response, _ = self.partial_search()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["itinerary"], "itinerary")
+        self.assertEqual(response.json()["timed_out_stages"], [])
+
+    # --- BATCH QUOTES ---
+
+    def test_batch_search_runs_shared_searches_once_and_streams_each_trip(self):
+        calls = []
+        running = 0
+        max_running = 0
+        group = SingleFlight()
+
+        async def track(name):
+            nonlocal running, max_running
+            calls.append(name)
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+        @coalesce(group)
+        async def search_flights(req):
+            await track(f"flights {req.origin}")
+            return [flight_info(f"Air {req.origin}", origin=req.origin, destination=req.destination)]
+
+        @coalesce(group)
+        async def search_booking_hotels(req):
+            await track(f"hotels {req.location}")
+            return [hotel_info(req.location, name=f"{req.location} Inn")]
+
+        async def fake_recommendation(data_type, text):
+            return "Recommended Departure Flight: 1" if data_type == "flights" else "Recommended Hotel: 1"
+
+        async def fake_itinerary(**kwargs):
+            return kwargs["hotels_text"]
+
+        def trip(origin, hotels=None):
+            return {
+                "flight_request": {"origin": origin, "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05"},
+                "hotel_request": hotels
+            }
+
+        calangute = [{"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}]
+        trips = [trip("DEL"), trip("DEL"), trip("DEL", calangute), trip("BOM")]
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "BATCH_SEARCH_CONCURRENCY", 2), \
+                patch.object(api_endpoints, "search_flights", search_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", search_booking_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            response = self.client.post("/batch_search/", json={"trips": trips})
+
+        self.assertEqual(response.status_code, 200)
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        self.assertEqual(events[0], ("batch", {"trips": 4, "flight_searches": 2, "hotel_searches": 2}))
+        self.assertEqual(events[-1], ("done", {"trips": 4, "succeeded": 4, "partial": 0, "failed": 0}))
+        results = {data["index"]: data["result"] for event, data in events[1:-1] if event == "trip"}
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        self.assertEqual(results[3]["flights"][0]["airline"], "Air BOM")
+        self.assertIn("Calangute Inn", results[2]["itinerary"])
+        self.assertIn("GOI Inn", results[3]["itinerary"])
+        # Each distinct search ran once, never more than BATCH_SEARCH_CONCURRENCY at a time
+        self.assertEqual(sorted(calls), ["flights BOM", "flights DEL", "hotels Calangute", "hotels GOI"])
+        self.assertEqual(max_running, 2)
+
+    def test_batch_trip_deadline_starts_after_its_queued_searches(self):
+        group = SingleFlight()
+
+        @coalesce(group)
+        async def search_flights(req):
+            await asyncio.sleep(0.15)
+            return [flight_info(f"Air {req.origin}", origin=req.origin, destination=req.destination)]
+
+        @coalesce(group)
+        async def search_booking_hotels(req):
+            await asyncio.sleep(0.15)
+            return [hotel_info(req.location, name=f"{req.location} Inn")]
+
+        async def fake_recommendation(data_type, text):
+            if "Slow Inn" in text:
+                await asyncio.sleep(5)
+            return "Recommended Departure Flight: 1" if data_type == "flights" else "Recommended Hotel: 1"
+
+        async def fake_itinerary(**kwargs):
+            return "itinerary"
+
+        def trip(origin, location):
+            return {
+                "flight_request": {"origin": origin, "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05"},
+                "hotel_request": [{"location": location, "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}]
+            }
+
+        # One search at a time: the last trip's searches finish well after one trip's budget
+        trips = [trip("DEL", "Candolim"), trip("BOM", "Baga"), trip("BLR", "Slow")]
+        with patch.dict(os.environ, {"HOTEL_PROVIDER": "booking"}), \
+                patch.object(api_endpoints, "BATCH_SEARCH_CONCURRENCY", 1), \
+                patch.object(api_endpoints, "REQUEST_DEADLINE", 0.4), \
+                patch.object(api_endpoints, "search_flights", search_flights), \
+                patch.object(api_endpoints, "search_booking_hotels", search_booking_hotels), \
+                patch.object(api_endpoints, "get_ai_recommendation", fake_recommendation), \
+                patch.object(api_endpoints, "generate_itinerary", fake_itinerary):
+            response = self.client.post("/batch_search/", json={"trips": trips})
+
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        results = {data["index"]: data["result"] for event, data in events if event == "trip"}
+        self.assertEqual(results[1]["flights"][0]["airline"], "Air BOM")
+        self.assertEqual(results[1]["timed_out_stages"], [])
+        self.assertEqual(results[2]["flights"][0]["airline"], "Air BLR")
+        self.assertEqual(results[2]["timed_out_stages"], ["hotel_recommendation", "itinerary"])
+        self.assertEqual(events[-1], ("done", {"trips": 3, "succeeded": 2, "partial": 1, "failed": 0}))
+
+    def test_batch_search_rejects_empty_and_oversized_batches(self):
+        self.assertEqual(self.client.post("/batch_search/", json={"trips": []}).status_code, 400)
+        trip = {"flight_request": {"origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05"}}
+        with patch.object(api_endpoints, "BATCH_MAX_TRIPS", 1):
+            self.assertEqual(self.client.post("/batch_search/", json={"trips": [trip, trip]}).status_code, 400)
+
+    # --- BACKGROUND JOBS ---
+
+    def test_ai_travel_plan_job_returns_partial_events_and_result(self):
+        release = asyncio.Event()
+
+        async def fake_plan(req):
+            api_endpoints.emit_event("trip_plan", {"destination": "GOI"})
+            await release.wait()
+            return AIResponse(itinerary="# Goa")
+
+        req = {"source_city": "Delhi", "destination_city": "Goa", "from_date": "2024-07-01", "return_date": "2024-07-05"}
+        with patch.object(api_endpoints, "ai_travel_plan", fake_plan), TestClient(app) as client:
+            submitted = client.post("/jobs/ai_travel_plan/", json=req)
+            self.assertEqual(submitted.status_code, 202)
+            job_id = submitted.json()["job_id"]
+
+            for _ in range(100):
+                status = client.get(f"/jobs/{job_id}").json()
+                if status["events"]:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(status["status"], "running")
+            self.assertEqual(status["events"], [{"event": "trip_plan", "data": {"destination": "GOI"}}])
+            pending = client.get(f"/jobs/{job_id}/result")
+            self.assertEqual(pending.status_code, 202)
+            self.assertIn("retry-after", pending.headers)
+
+            client.portal.call(release.set)
+            for _ in range(100):
+                result = client.get(f"/jobs/{job_id}/result")
+                if result.status_code == 200:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(result.json()["itinerary"], "# Goa")
+
+        self.assertEqual(self.client.get("/jobs/unknown").status_code, 404)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import tempfile
+import time
+import unittest
+
+from cache import TTLCache
+
+
+class TestTTLCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cache.sqlite3")
+        self.calls = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    async def fetch(self):
+        self.calls += 1
+        return {"result": self.calls}
+
+    def test_memory_hit_ignores_api_key(self):
+        cache = TTLCache(path=self.path, ttls={"google_flights": 60})
+
+        async def run():
+            first = await cache.get_or_fetch("google_flights", {"q": "DEL", "api_key": "a"}, self.fetch)
+            second = await cache.get_or_fetch("google_flights", {"api_key": "b", "q": "DEL"}, self.fetch)
+            return first, second
+
+        first, second = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+        stats = cache.get_stats()["namespaces"]["google_flights"]
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["memory_hits"], 1)
+
+    def test_disk_tier_survives_new_instance(self):
+        asyncio.run(TTLCache(path=self.path).get_or_fetch("booking", {"search": "Goa"}, self.fetch))
+        cache = TTLCache(path=self.path)
+        value = asyncio.run(cache.get_or_fetch("booking", {"search": "Goa"}, self.fetch))
+        self.assertEqual(value, {"result": 1})
+        self.assertEqual(cache.get_stats()["totals"]["disk_hits"], 1)
+
+    def test_stale_while_revalidate(self):
+        cache = TTLCache(path=None, ttls={"google_hotels": 1}, stale_ttl=60)
+
+        async def run():
+            await cache.get_or_fetch("google_hotels", {"q": "Goa"}, self.fetch)
+            key = cache.make_key("google_hotels", {"q": "Goa"})
+            value, _ = cache._memory[key]
+            cache._memory[key] = (value, time.time() - 5)
+            stale = await cache.get_or_fetch("google_hotels", {"q": "Goa"}, self.fetch)
+            await asyncio.gather(*cache._background_tasks)
+            fresh = await cache.get_or_fetch("google_hotels", {"q": "Goa"}, self.fetch)
+            return stale, fresh
+
+        stale, fresh = asyncio.run(run())
+        self.assertEqual(stale, {"result": 1})
+        self.assertEqual(fresh, {"result": 2})
+        self.assertEqual(cache.get_stats()["totals"]["stale_hits"], 1)
+
+    def test_expired_entry_is_served_when_fetch_fails(self):
+        cache = TTLCache(path=None, ttls={"booking": 1}, fallback_ttl=60)
+
+        async def outage():
+            raise RuntimeError("upstream down")
+
+        async def run():
+            await cache.get_or_fetch("booking", {"search": "Goa"}, self.fetch)
+            key = cache.make_key("booking", {"search": "Goa"})
+            value, _ = cache._memory[key]
+            cache._memory[key] = (value, time.time() - 30)
+            fallback = await cache.get_or_fetch("booking", {"search": "Goa"}, outage, fallback_on=lambda e: True)
+            with self.assertRaises(RuntimeError):
+                await cache.get_or_fetch("booking", {"search": "Goa"}, outage)
+            cache._memory[key] = (value, time.time() - 120)
+            with self.assertRaises(RuntimeError):
+                await cache.get_or_fetch("booking", {"search": "Goa"}, outage, fallback_on=lambda e: True)
+            return fallback
+
+        self.assertEqual(asyncio.run(run()), {"result": 1})
+        self.assertEqual(cache.get_stats()["totals"]["fallback_hits"], 1)
+
+    def test_lru_bound_and_uncacheable_results(self):
+        cache = TTLCache(path=None, max_entries=2)
+
+        async def run():
+            for q in ("a", "b", "c"):
+                await cache.get_or_fetch("google_flights", {"q": q}, self.fetch)
+            await cache.get_or_fetch("google_flights", {"q": "err"}, self.fetch, cacheable=lambda r: False)
+
+        asyncio.run(run())
+        self.assertEqual(len(cache._memory), 2)
+        self.assertNotIn(cache.make_key("google_flights", {"q": "a"}), cache._memory)
+        self.assertNotIn(cache.make_key("google_flights", {"q": "err"}), cache._memory)
+
+
+if __name__ == '__main__':
+    unittest.main()
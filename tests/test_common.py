@@ -0,0 +1,540 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+import common
+from resilience import is_transient
+from cache import TTLCache
+from common import FlightInfo, FlightRequest, HotelInfo, PlanTripRequest
+
+
+def make_leg(airline="TestAir", dep="DEL", arr="BOM"):
+    return {
+        "departure_airport": {"name": f"{dep} Airport", "id": dep, "time": "2024-07-01 08:00"},
+        "arrival_airport": {"name": f"{arr} Airport", "id": arr, "time": "2024-07-01 10:00"},
+        "airline": airline,
+        "airline_logo": "",
+        "travel_class": "Economy",
+        "flight_number": "TA 101",
+        "duration": 120
+    }
+
+
+FLIGHT_REQUEST = FlightRequest(origin="DEL", destination="BOM", outbound_date="2024-07-01", return_date="2024-07-10")
+
+
+class TestSearchFlights(unittest.TestCase):
+    def test_return_flights_fetched_concurrently_in_order(self):
+        departures = [
+            {"flights": [make_leg(f"Dep{i}")], "price": 1000 + i, "total_duration": 120, "departure_token": f"tok{i}"}
+            for i in range(4)
+        ]
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_search(params):
+            nonlocal in_flight, max_in_flight
+            token = params.get("departure_token")
+            if not token:
+                return {"best_flights": departures}
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Finish in reverse order to check ordering is preserved
+            await asyncio.sleep(0.01 * (4 - int(token[3:])))
+            in_flight -= 1
+            return {"best_flights": [{"flights": [make_leg(f"Ret-{token}", "BOM", "DEL")], "price": 5000, "total_duration": 130}]}
+
+        with patch.object(common, "run_google_search", fake_search), \
+                patch.object(common, "RETURN_FLIGHT_CONCURRENCY", 2):
+            flights = asyncio.run(common.search_flights(FLIGHT_REQUEST))
+
+        self.assertEqual([f.airline for f in flights], ["Dep0", "Dep1", "Dep2", "Dep3"])
+        self.assertEqual([f.return_flights[0]["airline"] for f in flights], ["Ret-tok0", "Ret-tok1", "Ret-tok2", "Ret-tok3"])
+        self.assertEqual(max_in_flight, 2)
+
+    def test_return_flight_timeout_keeps_departure(self):
+        departures = [{"flights": [make_leg()], "price": 1000, "total_duration": 120, "departure_token": "slow"}]
+
+        async def fake_search(params):
+            if params.get("departure_token"):
+                await asyncio.sleep(1)
+            return {"best_flights": departures}
+
+        with patch.object(common, "run_google_search", fake_search), \
+                patch.object(common, "RETURN_FLIGHT_TIMEOUT", 0.05):
+            flights = asyncio.run(common.search_flights(FLIGHT_REQUEST))
+
+        self.assertEqual(len(flights), 1)
+        self.assertEqual(flights[0].return_flights, [])
+
+    def test_decoded_flights_are_typed_and_match_validated_models(self):
+        raw = {
+            "flights": [make_leg(dep="DEL", arr="BOM"), {"airline": "Hop", "duration": "55"}],
+            "layovers": [{"name": "BOM Airport", "id": "BOM", "duration": 90}],
+            "price": 6500,
+            "total_duration": 265
+        }
+        ret = common.build_return_flight({"flights": [make_leg("Back", "BOM", "DEL")], "price": 9000, "total_duration": 130})
+        flight = common.build_flight_info(raw, "2024-07-10", [ret])
+
+        self.assertEqual(flight.stops, "1 stop(s)")
+        self.assertEqual(flight.departure, "DEL Airport (DEL) at 2024-07-01 08:00")
+        self.assertEqual(flight.arrival, "Unknown (???) at N/A")
+        self.assertEqual(flight.legs[1].duration, 55)
+        self.assertEqual(flight.layovers[0].overnight, False)
+        self.assertEqual(flight.return_flights[0]["departure"], "BOM Airport (BOM) at 2024-07-01 08:00")
+        self.assertEqual(flight.return_flights[0]["legs"][0]["flight_number"], "TA 101")
+        # Return flights are validated against ReturnFlightInfo
+        with self.assertRaises(ValueError):
+            common.build_flight_info(raw, "2024-07-10", [{"airline": "Back", "price": "n/a"}])
+
+
+class TestUpstreamFailures(unittest.TestCase):
+    PARAMS = {"engine": "google_flights", "departure_id": "DEL", "arrival_id": "BOM"}
+
+    def test_open_circuit_fails_fast_and_serves_expired_results(self):
+        calls = []
+
+        async def outage(params):
+            calls.append(params)
+            raise ConnectionError("connection refused")
+
+        cache = TTLCache(path=None, ttls={"google_flights": 1}, fallback_ttl=600)
+
+        async def run():
+            key = cache.make_key("google_flights", self.PARAMS)
+            await cache.set(key, {"best_flights": ["cached"]})
+            value, stored_at = cache._memory[key]
+            cache._memory[key] = (value, stored_at - 60)
+            # The failing call opens the breaker; its caller still gets the expired result
+            first = await common.run_google_search(self.PARAMS)
+            # Open breaker: no upstream call at all, same fallback
+            second = await common.run_google_search(self.PARAMS)
+            with self.assertRaises(common.HTTPException) as error:
+                await common.run_google_search({**self.PARAMS, "arrival_id": "GOI"})
+            return first, second, error.exception
+
+        with patch.object(common, "search_cache", cache), \
+                patch.object(common, "serpapi_breaker", common.CircuitBreaker("serpapi", failure_threshold=1)), \
+                patch.object(common, "_google_search", outage):
+            first, second, error = asyncio.run(run())
+
+        self.assertEqual(first, {"best_flights": ["cached"]})
+        self.assertEqual(second, first)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(error.status_code, 500)
+        self.assertIn("circuit open", error.detail)
+
+
+class TestBookingHotels(unittest.TestCase):
+    def test_merge_dedupes_across_lists_and_converts_per_night(self):
+        hostels = [{"name": "Sea Inn", "address": "Calangute", "price": 3000, "rating": 8.5, "url": "u1"}]
+        everything = [
+            {"name": "Sea Inn", "address": "Calangute", "price": 3300, "rating": 8.5, "url": "u1"},
+            {"name": "Hill Inn", "address": "Panaji", "price": "bad", "rating": 9.0, "url": "u2"},
+            {"name": "Palm Inn", "address": "Baga", "price": 4500, "rating": 8.0, "url": "u3"},
+        ]
+        hotels = common.merge_booking_hotels([hostels, everything], 3)
+        self.assertEqual([(h.name, h.price) for h in hotels], [("Sea Inn", 1000), ("Palm Inn", 1500)])
+
+
+def fake_provider(delay, result, calls):
+    async def search(hotel_request):
+        calls.append(hotel_request.location)
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return search
+
+
+class TestHedgedHotelSearch(unittest.TestCase):
+    REQUEST = common.HotelRequest(location="Goa", check_in_date="2024-07-01", check_out_date="2024-07-05")
+
+    def search(self, booking, google, strategy="first"):
+        self.calls = {"booking": [], "google": []}
+        with patch.object(common, "search_booking_hotels", fake_provider(*booking, self.calls["booking"])), \
+                patch.object(common, "search_google_hotels", fake_provider(*google, self.calls["google"])), \
+                patch.object(common, "HOTEL_HEDGE_PRIMARY", "booking"), \
+                patch.object(common, "HOTEL_HEDGE_DELAY", 0.05), \
+                patch.object(common, "HOTEL_HEDGE_STRATEGY", strategy), \
+                patch.object(common, "HOTEL_HEDGE_MERGE_WINDOW", 0.2):
+            return asyncio.run(common.search_hedged_hotels(self.REQUEST))
+
+    def hotels(self, *names):
+        return [HotelInfo(name=name, price=1000, rating=4.0, location="Goa", link="") for name in names]
+
+    def test_fast_primary_does_not_start_secondary(self):
+        hotels = self.search((0.01, self.hotels("Sea Inn")), (0.01, self.hotels("Hill Inn")))
+        self.assertEqual([h.name for h in hotels], ["Sea Inn"])
+        self.assertEqual(self.calls["google"], [])
+
+    def test_slow_primary_is_hedged_and_first_answer_wins(self):
+        hotels = self.search((1.0, self.hotels("Sea Inn")), (0.01, self.hotels("Hill Inn")))
+        self.assertEqual([h.name for h in hotels], ["Hill Inn"])
+        self.assertEqual(self.calls["google"], ["Goa"])
+
+    def test_failed_primary_starts_secondary_without_waiting_for_the_delay(self):
+        hotels = self.search((0.0, {"error": "actor failed"}), (0.01, self.hotels("Hill Inn")))
+        self.assertEqual([h.name for h in hotels], ["Hill Inn"])
+
+    def test_merge_dedupes_both_providers_within_the_window(self):
+        hotels = self.search(
+            (0.1, self.hotels("Sea Inn", "Palm Inn")), (0.01, self.hotels("Hill Inn", "sea  inn")), strategy="merge"
+        )
+        self.assertEqual([h.name for h in hotels], ["Hill Inn", "sea  inn", "Palm Inn"])
+
+    def test_merge_does_not_wait_past_the_window(self):
+        hotels = self.search((5.0, self.hotels("Sea Inn")), (0.01, self.hotels("Hill Inn")), strategy="merge")
+        self.assertEqual([h.name for h in hotels], ["Hill Inn"])
+
+    def test_both_failing_returns_the_primary_result(self):
+        hotels = self.search((0.0, {"error": "actor failed"}), (0.0, RuntimeError("serpapi down")))
+        self.assertEqual(hotels, {"error": "actor failed"})
+
+
+class TestPromptEncoding(unittest.TestCase):
+    def hotels(self):
+        return [
+            HotelInfo(name=f"Inn {i}", price=price, rating=rating, location="Goa", link="https://example.com")
+            for i, (price, rating) in enumerate([(5000, 7.0), (2000, 9.0), (4000, 8.0), (2500, 8.8)])
+        ]
+
+    def test_compact_table_is_smaller_and_keeps_numbering(self):
+        markdown = common.format_travel_data("hotels", self.hotels(), style="markdown", token_budget=0, max_options=0)
+        compact = common.format_travel_data("hotels", self.hotels(), style="compact", token_budget=0, max_options=0)
+        self.assertIn("2|Inn 1|2000|9.0|Goa", compact)
+        self.assertNotIn("example.com", compact)
+        self.assertLess(common.estimate_tokens(compact), common.estimate_tokens(markdown) / 2)
+
+    def test_top_k_keeps_best_scored_options_with_original_numbers(self):
+        text = common.format_travel_data("hotels", self.hotels(), style="markdown", token_budget=0, max_options=2)
+        self.assertIn("**Hotel 2:**", text)
+        self.assertIn("**Hotel 4:**", text)
+        self.assertNotIn("**Hotel 1:**", text)
+        # An AI answer about the trimmed list still maps to the right position in the full list
+        self.assertEqual(common.extract_recommended_hotel_index("Recommended Hotel: 4"), 3)
+
+    def test_token_budget_keeps_at_least_one_option(self):
+        flights = [
+            FlightInfo(airline=f"Air {i}", price=4000 + i, duration=120, stops="Nonstop",
+                       departure="Dabolim Airport (GOI) at 2024-07-01 08:00", arrival="Mumbai (BOM) at 2024-07-01 09:10",
+                       travel_class="Economy", return_date="2024-07-05", airline_logo="")
+            for i in range(20)
+        ]
+        text = common.format_travel_data("flights", flights, style="compact", token_budget=1, max_options=0)
+        self.assertEqual(text.splitlines()[-1], "1|Air 0|4000|120|0|GOI 2024-07-01 08:00|BOM 2024-07-01 09:10|Economy")
+        budgeted = common.format_travel_data("flights", flights, style="compact", token_budget=150, max_options=0)
+        self.assertLessEqual(common.estimate_tokens(budgeted), 150)
+
+
+class TestApifyClient(unittest.TestCase):
+    def test_shared_client_reused_until_closed(self):
+        async def run():
+            first = await common.get_apify_client()
+            second = await common.get_apify_client()
+            await common.close_apify_client()
+            third = await common.get_apify_client()
+            await common.close_apify_client()
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+        self.assertTrue(first.http_client.httpx_async_client.is_closed)
+
+    def test_default_http_clients_are_closed(self):
+        created = []
+        original = common.httpx.AsyncClient
+
+        def tracking_client(*args, **kwargs):
+            created.append(original(*args, **kwargs))
+            return created[-1]
+
+        async def run():
+            with patch("apify_client._http_client.httpx.AsyncClient", tracking_client):
+                client = await common.create_apify_client(api_key="token")
+            default_async = created[0]
+            pooled = client.http_client.httpx_async_client
+            closed = (client.http_client.httpx_client.is_closed, default_async.is_closed, pooled.is_closed)
+            await pooled.aclose()
+            return closed
+
+        self.assertEqual(asyncio.run(run()), (True, True, False))
+
+
+class TestSerpApiClient(unittest.TestCase):
+    PARAMS = {"engine": "google_flights", "departure_id": "DEL", "arrival_id": "BOM", "api_key": "key"}
+
+    def search(self, handler, params=None):
+        async def run():
+            try:
+                return await common._google_search(params or self.PARAMS)
+            finally:
+                await common.close_serpapi_client()
+
+        client = common.create_serpapi_client(transport=httpx.MockTransport(handler))
+        with patch.object(common, "_serpapi_client", client):
+            return asyncio.run(run())
+
+    def test_json_endpoint_is_queried_with_the_search_params(self):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json={"best_flights": [{"price": 4000}]})
+
+        self.assertEqual(self.search(handler), {"best_flights": [{"price": 4000}]})
+        self.assertEqual(str(requests[0].url.copy_with(query=None)), common.SERPAPI_URL)
+        self.assertEqual(dict(requests[0].url.params), {**self.PARAMS, "output": "json"})
+
+    def test_error_answers_are_returned_like_get_dict(self):
+        response = self.search(lambda request: httpx.Response(401, json={"error": "Invalid API key."}))
+        self.assertEqual(response, {"error": "Invalid API key."})
+
+    def test_server_errors_raise_transient_errors(self):
+        with self.assertRaises(httpx.HTTPStatusError) as error:
+            self.search(lambda request: httpx.Response(503, text="unavailable"))
+        self.assertTrue(is_transient(error.exception))
+
+    def test_rate_limited_search_is_retried_after_retry_after(self):
+        requests = []
+
+        def handler(request):
+            requests.append(time.perf_counter())
+            if len(requests) == 1:
+                return httpx.Response(429, headers={"Retry-After": "0.2"}, json={"error": "Too many requests"})
+            return httpx.Response(200, json={"best_flights": []})
+
+        async def run():
+            try:
+                return await common._fetch_google_search(self.PARAMS)
+            finally:
+                await common.close_serpapi_client()
+
+        client = common.create_serpapi_client(transport=httpx.MockTransport(handler))
+        with patch.object(common, "_serpapi_client", client), \
+                patch.object(common, "serpapi_breaker", common.CircuitBreaker("serpapi", failure_threshold=5)), \
+                patch.object(common, "SERPAPI_RETRIES", 1):
+            self.assertEqual(asyncio.run(run()), {"best_flights": []})
+        self.assertEqual(len(requests), 2)
+        self.assertGreaterEqual(requests[1] - requests[0], 0.2)
+
+    def test_oversized_responses_are_rejected(self):
+        body = json.dumps({"best_flights": ["x" * 1000]}).encode()
+        with patch.object(common, "SERPAPI_MAX_RESPONSE_BYTES", 100):
+            with self.assertRaises(common.ResponseTooLarge):
+                self.search(lambda request: httpx.Response(200, content=body))
+            # Without Content-Length the cap applies while reading
+            async def chunks():
+                yield body[:60]
+                yield body[60:]
+
+            with self.assertRaises(common.ResponseTooLarge):
+                self.search(lambda request: httpx.Response(200, content=chunks()))
+
+    def test_shared_client_reused_until_closed(self):
+        async def run():
+            first = common.get_serpapi_client()
+            second = common.get_serpapi_client()
+            await common.close_serpapi_client()
+            third = common.get_serpapi_client()
+            await common.close_serpapi_client()
+            return first, second, third
+
+        first, second, third = asyncio.run(run())
+        self.assertIs(first, second)
+        self.assertIsNot(first, third)
+
+
+class FakeCrew:
+    """Stands in for crewai.Crew; counts kickoffs and returns a canned answer."""
+    kickoffs = 0
+    answer = "Recommended Hotel: 1"
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def kickoff(self):
+        FakeCrew.kickoffs += 1
+        return FakeCrew.answer
+
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        FakeCrew.kickoffs = 0
+        FakeCrew.answer = "Recommended Hotel: 1"
+        self.patches = [
+            patch.object(common, "llm_cache", TTLCache(path=None, default_ttl=60)),
+            patch("crewai.Agent", lambda **kwargs: None),
+            patch("crewai.Task", lambda **kwargs: None),
+            patch("crewai.Crew", FakeCrew),
+            patch.object(common, "initialize_llm", lambda: None),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_identical_prompt_served_from_cache(self):
+        async def run():
+            first = await common.get_ai_recommendation("hotels", "Hotel 1: Sea Inn")
+            second = await common.get_ai_recommendation("hotels", "Hotel 1: Sea Inn")
+            other = await common.get_ai_recommendation("hotels", "Hotel 1: Hill Inn")
+            return first, second, other
+
+        first, second, _ = asyncio.run(run())
+        self.assertEqual(first, second)
+        self.assertEqual(FakeCrew.kickoffs, 2)
+
+    def test_opt_out_per_call_and_per_request(self):
+        async def run():
+            await common.get_ai_recommendation("hotels", "data")
+            await common.get_ai_recommendation("hotels", "data", use_cache=False)
+            common.llm_cache_bypass.set(True)
+            await common.get_ai_recommendation("hotels", "data")
+
+        asyncio.run(run())
+        self.assertEqual(FakeCrew.kickoffs, 3)
+
+    def test_trip_plan_cached_as_parsed_json_copy(self):
+        FakeCrew.answer = '```json\n{"origin": "DEL", "hotel_areas": [{"check_in_date": "2"}, {"check_in_date": "1"}]}\n```'
+        req = PlanTripRequest(source_city="Delhi", destination_city="Goa", from_date="2024-07-01", return_date="2024-07-05")
+
+        async def run():
+            first = await common.plan_trip_agent(req)
+            first["hotel_areas"].sort(key=lambda x: x["check_in_date"])
+            return await common.plan_trip_agent(req)
+
+        second = asyncio.run(run())
+        self.assertEqual(FakeCrew.kickoffs, 1)
+        self.assertEqual(second["hotel_areas"][0]["check_in_date"], "2")
+
+
+AGENT = {"role": "Analyst", "goal": "Pick one", "backstory": "Expert", "expected_output": "A pick"}
+
+
+class TestLLMRetries(unittest.TestCase):
+    def setUp(self):
+        self.crews = []
+        self.patches = [
+            patch.object(common, "llm_breaker", common.CircuitBreaker("llm", failure_threshold=5)),
+            patch.object(common, "LLM_RETRIES", 1),
+            patch("crewai.Agent", lambda **kwargs: None),
+            patch("crewai.Task", lambda **kwargs: None),
+            patch.object(common, "initialize_llm", lambda: None),
+            patch("resilience.backoff_delay", lambda attempt: 0),
+        ]
+        for p in self.patches:
+            p.start()
+        self.addCleanup(lambda: [p.stop() for p in self.patches])
+
+    def fake_crew(self, kickoff):
+        crews = self.crews
+
+        class Crew:
+            def __init__(self, **kwargs):
+                crews.append(self)
+
+            def kickoff(self):
+                return kickoff(len(crews))
+
+        return patch("crewai.Crew", Crew)
+
+    def test_failed_kickoff_retried_on_a_fresh_crew(self):
+        def kickoff(attempt):
+            if attempt == 1:
+                raise ConnectionError("reset")
+            return "Recommended Hotel: 1"
+
+        with self.fake_crew(kickoff):
+            result = asyncio.run(common.run_llm_task(AGENT, "data"))
+
+        self.assertEqual(result, "Recommended Hotel: 1")
+        self.assertEqual(len(self.crews), 2)
+        self.assertIsNot(self.crews[0], self.crews[1])
+
+    def test_timed_out_kickoff_not_retried(self):
+        def kickoff(attempt):
+            time.sleep(0.2)
+            return "late"
+
+        with self.fake_crew(kickoff), patch.object(common, "LLM_TIMEOUT", 0.05):
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(common.run_llm_task(AGENT, "data"))
+
+        self.assertEqual(len(self.crews), 1)
+
+
+class TestDirectLLMPath(unittest.TestCase):
+    def test_direct_mode_sends_agent_prompt_without_crew(self):
+        sent = []
+
+        class FakeLLM:
+            def call(self, messages):
+                sent.append(messages)
+                return "Recommended Hotel: 2"
+
+        def no_crew(*args, **kwargs):
+            raise AssertionError("Crew must not be built in direct mode")
+
+        with patch.object(common, "LLM_EXECUTION_MODE", "direct"), \
+                patch.object(common, "initialize_llm", lambda: FakeLLM()), \
+                patch("crewai.Crew", no_crew):
+            result = asyncio.run(common.get_ai_recommendation("hotels", "Hotel 1: Sea Inn", use_cache=False))
+
+        self.assertEqual(result, "Recommended Hotel: 2")
+        system, user = sent[0]
+        self.assertIn("AI Hotel Analyst", system["content"])
+        self.assertIn("Hotel 1: Sea Inn", user["content"])
+
+
+class TestStreamingTripPlan(unittest.TestCase):
+    def test_plan_parts_reported_while_streaming(self):
+        from crewai.llms.base_llm import BaseLLM
+
+        plan = (
+            '{"origin": "DEL", "destination": "GOI", "outbound_date": "2024-07-01", "return_date": "2024-07-05", '
+            '"hotel_areas": [{"location": "Calangute", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05"}], '
+            '"day_plan": [{"date": "2024-07-02", "activities": ["Beach"]}]}'
+        )
+
+        class StreamingLLM(BaseLLM):
+            def call(self, messages, *args, **kwargs):
+                for i in range(0, len(plan), 16):
+                    if self._effective_stream():
+                        self._emit_stream_chunk_event(plan[i:i + 16])
+                return plan
+
+            def supports_function_calling(self):
+                return False
+
+            def get_context_window_size(self):
+                return 100000
+
+        llm = StreamingLLM(model="streaming")
+        partial = []
+        req = PlanTripRequest(source_city="Delhi", destination_city="Goa", from_date="2024-07-01", return_date="2024-07-05")
+        with patch.object(common, "initialize_llm", lambda: llm):
+            trip = asyncio.run(common.plan_trip_agent(
+                req, use_cache=False, on_partial=lambda kind, value: partial.append(kind)
+            ))
+
+        self.assertEqual(partial, ["flight", "hotel_area"])
+        self.assertEqual(trip["day_plan"][0]["activities"], ["Beach"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import deadline
+from deadline import DeadlineExceeded, request_budget, start_deadline, timed_out_stages, within_deadline
+
+
+class TestDeadline(unittest.TestCase):
+    def test_without_deadline_stages_run_to_completion(self):
+        async def run():
+            start_deadline(0)
+            self.assertIsNone(deadline.remaining())
+            return await within_deadline("search", asyncio.sleep(0.01, result="done"))
+
+        self.assertEqual(asyncio.run(run()), "done")
+
+    def test_stages_share_one_budget_and_timeouts_are_recorded(self):
+        async def run():
+            start_deadline(0.1)
+            first = await within_deadline("search", asyncio.sleep(0.05, result="results"))
+            with self.assertRaises(DeadlineExceeded):
+                # Only what is left of the budget, not a fresh 0.1s
+                await within_deadline("recommendation", asyncio.sleep(0.08))
+            with self.assertRaises(DeadlineExceeded):
+                await within_deadline("itinerary", asyncio.sleep(0))
+            return first, timed_out_stages()
+
+        first, stages = asyncio.run(run())
+        self.assertEqual(first, "results")
+        self.assertEqual(stages, ["recommendation", "itinerary"])
+
+    def test_child_tasks_report_into_the_request(self):
+        async def stage():
+            await within_deadline("hotel_search", asyncio.sleep(1))
+
+        async def run():
+            start_deadline(0.05)
+            results = await asyncio.gather(asyncio.create_task(stage()), return_exceptions=True)
+            return results, timed_out_stages()
+
+        results, stages = asyncio.run(run())
+        self.assertIsInstance(results[0], DeadlineExceeded)
+        self.assertEqual(stages, ["hotel_search"])
+
+    def test_own_timeouts_of_a_stage_are_not_reported_as_deadline(self):
+        async def upstream_timeout():
+            raise asyncio.TimeoutError()
+
+        async def run():
+            start_deadline(10)
+            with self.assertRaises(asyncio.TimeoutError) as raised:
+                await within_deadline("search", upstream_timeout())
+            return raised.exception, timed_out_stages()
+
+        error, stages = asyncio.run(run())
+        self.assertNotIsInstance(error, DeadlineExceeded)
+        self.assertEqual(stages, [])
+
+    def test_request_budget_header_can_only_shorten_the_deadline(self):
+        with patch.object(deadline, "REQUEST_DEADLINE", 90.0):
+            self.assertEqual(request_budget(None), 90.0)
+            self.assertEqual(request_budget("5"), 5.0)
+            self.assertEqual(request_budget("500"), 90.0)
+            self.assertEqual(request_budget("soon"), 90.0)
+        with patch.object(deadline, "REQUEST_DEADLINE", 0.0):
+            self.assertEqual(request_budget("500"), 500.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import threading
+import time
+import unittest
+from contextvars import ContextVar
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+import executors
+from api_endpoints import app
+from executors import ExecutorSaturated, WorkloadExecutor
+from metrics import executor_wait, render_metrics
+
+request_id: ContextVar[str] = ContextVar("request_id", default="")
+
+
+class TestWorkloadExecutor(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkloadExecutor("test", workers=2, max_queue=3)
+        self.addCleanup(self.pool.shutdown)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def blocked(self, value=None):
+        self.release.wait(5)
+        return value
+
+    def test_runs_bounded_in_callers_context_and_tracks_waits(self):
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def work(i):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.02)
+            with lock:
+                active[0] -= 1
+            return request_id.get(), i
+
+        async def run():
+            request_id.set("req-1")
+            return await asyncio.gather(*(self.pool.run(work, i) for i in range(6)))
+
+        executor_wait.clear()
+        results = asyncio.run(run())
+
+        self.assertEqual(results, [("req-1", i) for i in range(6)])
+        self.assertEqual(active[1], 2)
+        stats = self.pool.get_stats()
+        self.assertEqual((stats["submitted"], stats["completed"], stats["queued"], stats["running"]), (6, 6, 0, 0))
+        self.assertGreater(stats["max_wait_seconds"], 0.01)
+        self.assertIn('travel_planner_executor_wait_seconds_count{executor="test"} 6', render_metrics())
+
+    def test_full_queue_rejects_new_requests_with_retry_after(self):
+        async def run():
+            tasks = [asyncio.ensure_future(self.pool.run(self.blocked, i)) for i in range(5)]
+            await asyncio.sleep(0.05)
+            stats = self.pool.get_stats()
+            with self.assertRaises(ExecutorSaturated) as raised:
+                self.pool.check_admission()
+            self.release.set()
+            return stats, raised.exception, await asyncio.gather(*tasks)
+
+        stats, error, results = asyncio.run(run())
+
+        self.assertEqual((stats["running"], stats["queued"]), (2, 3))
+        self.assertEqual(error.name, "test")
+        self.assertGreaterEqual(error.retry_after, 1)
+        self.assertEqual(results, list(range(5)))
+        self.assertEqual(self.pool.get_stats()["rejected"], 1)
+        # Drained: admitted again
+        self.pool.check_admission()
+
+    def test_cancelled_queued_call_leaves_the_queue_and_never_runs(self):
+        ran = []
+
+        async def run():
+            blockers = [asyncio.ensure_future(self.pool.run(self.blocked)) for _ in range(2)]
+            queued = asyncio.ensure_future(self.pool.run(ran.append, 1))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            await asyncio.sleep(0.01)
+            depth = self.pool.queued
+            self.release.set()
+            await asyncio.gather(*blockers)
+            return depth
+
+        self.assertEqual(asyncio.run(run()), 0)
+        self.assertEqual(ran, [])
+
+    def test_busy_llm_pool_does_not_delay_search_work(self):
+        llm = WorkloadExecutor("llm-test", workers=1)
+        search = WorkloadExecutor("search-test", workers=1)
+        self.addCleanup(llm.shutdown)
+        self.addCleanup(search.shutdown)
+
+        async def run():
+            kickoffs = [asyncio.ensure_future(llm.run(self.blocked)) for _ in range(4)]
+            start = time.perf_counter()
+            await search.run(time.sleep, 0.01)
+            elapsed = time.perf_counter() - start
+            self.release.set()
+            await asyncio.gather(*kickoffs)
+            return elapsed
+
+        self.assertLess(asyncio.run(run()), 1)
+
+
+class TestAdmissionControl(unittest.TestCase):
+    def test_saturated_pool_gets_fast_503_with_retry_after(self):
+        client = TestClient(app)
+        with patch.object(executors.llm_executor, "max_queue", 1), patch.object(executors.llm_executor, "queued", 1):
+            response = client.post("/generate_itinerary/", json={
+                "destination": "Goa", "check_in_date": "2024-07-01", "check_out_date": "2024-07-05",
+                "flights": "Flight", "hotels": "Hotel"
+            })
+            stats = client.get("/executors/").json()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers["retry-after"]), 1)
+        self.assertIn("llm workers are busy", response.json()["detail"])
+        self.assertEqual(set(stats), {"search", "llm", "pdf"})
+        self.assertEqual((stats["llm"]["queued"], stats["llm"]["max_queue"]), (1, 1))
+        self.assertGreaterEqual(stats["llm"]["rejected"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+import common
+import fare_calendar
+from deadline import start_deadline
+from api_endpoints import app
+from cache import TTLCache
+from common import FareCalendarRequest
+
+
+def option(price, airline="Air", legs=1):
+    return {"price": price, "total_duration": 120 * legs, "flights": [{"airline": airline}] * legs}
+
+
+def fake_results(params):
+    """Price depends on the dates; 2024-07-05 returns are the cheapest, 2024-07-06 has no flights."""
+    if params["return_date"] == "2024-07-06":
+        return {"error": "Google Flights hasn't returned any results for this query."}
+    day = int(params["outbound_date"][-2:]) * 100 + int(params["return_date"][-2:])
+    price = 5000 + day % 97 * 10 - (1000 if params["return_date"] == "2024-07-05" else 0)
+    return {"best_flights": [option(price + 500, "Direct", 1)], "other_flights": [option(price, "Cheap", 2)]}
+
+
+REQUEST = FareCalendarRequest(
+    origin="del", destination="goi", outbound_date="2024-07-01", return_date="2024-07-05",
+    outbound_flex_days=1, return_flex_days=1
+)
+
+
+class TestFareCalendar(unittest.TestCase):
+    def setUp(self):
+        self.fetched = []
+        cache = TTLCache(path=None, ttls={"google_flights": 60})
+
+        async def fetch(params):
+            self.fetched.append((params["outbound_date"], params["return_date"]))
+            await asyncio.sleep(0.001)
+            return fake_results(params)
+
+        patches = [
+            patch.object(common, "search_cache", cache),
+            patch.object(fare_calendar, "search_cache", cache),
+            patch.object(common, "_fetch_google_search", fetch),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def fill(self, req=REQUEST):
+        async def run():
+            return [cell async for cell in fare_calendar.fill_fare_calendar(req)]
+        return asyncio.run(run())
+
+    def test_matrix_and_cheapest_without_llm(self):
+        cells = self.fill()
+        calendar = fare_calendar.build_fare_calendar(REQUEST, cells)
+
+        self.assertEqual(calendar.outbound_dates, ["2024-06-30", "2024-07-01", "2024-07-02"])
+        self.assertEqual(calendar.return_dates, ["2024-07-04", "2024-07-05", "2024-07-06"])
+        self.assertEqual(len(self.fetched), 9)
+        # The requested dates are searched first
+        self.assertEqual(self.fetched[0], ("2024-07-01", "2024-07-05"))
+        self.assertIsNone(calendar.prices[0][2])
+        self.assertEqual(calendar.cells[2].error, "Google Flights hasn't returned any results for this query.")
+        self.assertEqual(calendar.cheapest.return_date, "2024-07-05")
+        self.assertEqual((calendar.cheapest.airline, calendar.cheapest.stops), ("Cheap", "1 stop(s)"))
+        self.assertEqual(calendar.cheapest.price, min(p for row in calendar.prices for p in row if p is not None))
+
+    def test_cached_cells_come_first_cheapest_first_and_are_not_refetched(self):
+        self.fill(REQUEST.model_copy(update={"outbound_flex_days": 0, "return_flex_days": 0}))
+        self.fetched.clear()
+
+        cells = self.fill()
+        self.assertTrue(cells[0].cached)
+        self.assertEqual((cells[0].outbound_date, cells[0].return_date), ("2024-07-01", "2024-07-05"))
+        self.assertEqual(sum(cell.cached for cell in cells), 1)
+        self.assertNotIn(("2024-07-01", "2024-07-05"), self.fetched)
+        self.assertEqual(len(self.fetched), 8)
+
+    def test_cells_not_searched_before_the_deadline_time_out(self):
+        async def slow_fetch(params):
+            self.fetched.append((params["outbound_date"], params["return_date"]))
+            await asyncio.sleep(0.05)
+            return fake_results(params)
+
+        async def run():
+            start_deadline(0.08)
+            cells = [cell async for cell in fare_calendar.fill_fare_calendar(REQUEST)]
+            return cells, fare_calendar.build_fare_calendar(REQUEST, cells)
+
+        with patch.object(common, "_fetch_google_search", slow_fetch), \
+                patch.object(fare_calendar, "FARE_CALENDAR_CONCURRENCY", 2):
+            cells, calendar = asyncio.run(run())
+
+        timed_out = [cell for cell in cells if cell.timed_out]
+        self.assertEqual(len(cells), 9)
+        # Two waves of 2 searches fit in the budget at most; queued cells are never searched
+        self.assertGreaterEqual(len(timed_out), 5)
+        self.assertLessEqual(len(self.fetched), 4)
+        self.assertTrue(all(cell.price is None and cell.error == "Timed out" for cell in timed_out))
+        self.assertEqual(calendar.timed_out_stages, ["fare_calendar_search"])
+
+    def test_invalid_windows_are_rejected(self):
+        client = TestClient(app)
+        body = REQUEST.model_dump()
+        with patch.object(fare_calendar, "FARE_CALENDAR_MAX_FLEX_DAYS", 2):
+            self.assertEqual(client.post("/fare_calendar/", json={**body, "outbound_flex_days": 3}).status_code, 400)
+        self.assertEqual(client.post("/fare_calendar/", json={**body, "return_date": "07/05/2024"}).status_code, 400)
+        self.assertEqual(client.post("/fare_calendar/stream", json={**body, "return_flex_days": -1}).status_code, 400)
+
+    def test_stream_endpoint_emits_cells_then_calendar(self):
+        response = TestClient(app).post("/fare_calendar/stream", json=REQUEST.model_dump())
+
+        self.assertEqual(response.status_code, 200)
+        events = [
+            (block.split("\n")[0][len("event: "):], json.loads(block.split("\n")[1][len("data: "):]))
+            for block in response.text.strip().split("\n\n")
+        ]
+        self.assertEqual([event for event, _ in events], ["cell"] * 9 + ["done"])
+        self.assertEqual(events[-1][1]["origin"], "DEL")
+        self.assertEqual(len(events[-1][1]["cells"]), 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import time
+import unittest
+
+from fastapi import HTTPException
+from jobs import JobQueue, JobQueueFull
+
+
+class TestJobQueue(unittest.TestCase):
+    def test_jobs_run_with_bounded_workers_and_record_events(self):
+        running = 0
+        max_running = 0
+
+        async def pipeline(job):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            job.record_event("flights", {"count": 1})
+            await asyncio.sleep(0.01)
+            running -= 1
+            return {"ok": True}
+
+        async def run():
+            queue = JobQueue(workers=2, max_queued=10, result_ttl=60)
+            jobs = [queue.submit("test", pipeline) for _ in range(5)]
+            while not all(job.finished for job in jobs):
+                await asyncio.sleep(0.005)
+            await queue.stop()
+            return jobs
+
+        jobs = asyncio.run(run())
+        self.assertEqual(max_running, 2)
+        self.assertEqual({job.status for job in jobs}, {"succeeded"})
+        self.assertEqual(jobs[0].to_dict()["events"], [{"event": "flights", "data": {"count": 1}}])
+        self.assertEqual(jobs[0].to_dict(since=1)["events"], [])
+        self.assertEqual(jobs[0].result, {"ok": True})
+
+    def test_full_queue_rejects_and_failed_job_keeps_status(self):
+        async def failing(job):
+            raise HTTPException(status_code=404, detail="No flights found")
+
+        async def run():
+            queue = JobQueue(workers=1, max_queued=1, result_ttl=60)
+            first = queue.submit("test", failing)
+            with self.assertRaises(JobQueueFull):
+                queue.submit("test", failing)
+            while not first.finished:
+                await asyncio.sleep(0.005)
+            await queue.stop()
+            return queue, first
+
+        queue, first = asyncio.run(run())
+        self.assertEqual(first.status, "failed")
+        self.assertEqual(first.error, {"status_code": 404, "detail": "No flights found"})
+        self.assertEqual(queue.get_stats()["rejected"], 1)
+
+    def test_finished_jobs_expire_after_ttl(self):
+        async def pipeline(job):
+            return "done"
+
+        async def run():
+            queue = JobQueue(workers=1, max_queued=5, result_ttl=60)
+            job = queue.submit("test", pipeline)
+            while not job.finished:
+                await asyncio.sleep(0.005)
+            await queue.stop()
+            return queue, job
+
+        queue, job = asyncio.run(run())
+        self.assertIs(queue.get(job.id), job)
+        job.finished_at = time.time() - 61
+        self.assertIsNone(queue.get(job.id))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import asyncio
+import subprocess
+import threading
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+import api_endpoints
+import common
+from api_endpoints import app
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HEAVY_MODULES = ["crewai", "apify_client", "pdfkit", "markdown"]
+
+
+class TestLazyImports(unittest.TestCase):
+    def test_importing_the_app_defers_heavy_dependencies(self):
+        code = f"import sys, json, api_endpoints; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+        self.assertEqual(output.returncode, 0, output.stderr)
+        self.assertEqual(json.loads(output.stdout.strip().splitlines()[-1]), [])
+
+    def test_dependencies_are_imported_on_the_given_pool_once(self):
+        calls = []
+
+        class Pool:
+            async def run(self, fn, *args):
+                calls.append(args)
+                return fn(*args)
+
+        async def run():
+            await common.load_dependency(Pool(), "json.decoder")
+            await common.load_dependency(Pool(), "json.decoder")
+
+        with patch.object(common, "_imported", set()):
+            asyncio.run(run())
+            self.assertIn("json.decoder", common._imported)
+        self.assertEqual(calls, [("json.decoder",)])
+
+
+class TestStartupWarmUp(unittest.TestCase):
+    def test_lifespan_warms_up_in_background(self):
+        release = threading.Event()
+        preloaded = threading.Event()
+        llm_loads = []
+
+        def preload():
+            release.wait(5)
+            preloaded.set()
+
+        async def load_llm():
+            llm_loads.append(1)
+
+        async def pdf_warm_up():
+            pass
+
+        with patch.object(api_endpoints, "STARTUP_WARMUP", True), \
+                patch.object(api_endpoints, "preload_dependencies", preload), \
+                patch.object(api_endpoints, "load_llm", load_llm), \
+                patch.object(api_endpoints.pdf_renderer, "warm_up", pdf_warm_up):
+            with TestClient(app) as client:
+                # Served while the warm-up is still importing
+                self.assertEqual(client.get("/executors/").status_code, 200)
+                self.assertFalse(preloaded.is_set())
+                release.set()
+                self.assertTrue(preloaded.wait(5))
+
+        self.assertEqual(llm_loads, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
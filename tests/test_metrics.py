@@ -0,0 +1,48 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import unittest
+
+import metrics
+from metrics import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+    def test_render_prometheus_cumulative_buckets(self):
+        histogram = Histogram("stage_seconds", "Stage latency.", labelnames=("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, stage="serpapi")
+        histogram.observe(0.5, stage="serpapi")
+        histogram.observe(3.0, stage="serpapi")
+
+        lines = histogram.render().splitlines()
+        self.assertEqual(lines[:2], ["# HELP stage_seconds Stage latency.", "# TYPE stage_seconds histogram"])
+        self.assertIn('stage_seconds_bucket{stage="serpapi",le="0.1"} 1', lines)
+        self.assertIn('stage_seconds_bucket{stage="serpapi",le="1.0"} 2', lines)
+        self.assertIn('stage_seconds_bucket{stage="serpapi",le="+Inf"} 3', lines)
+        self.assertIn('stage_seconds_count{stage="serpapi"} 3', lines)
+
+
+class TestRequestTimings(unittest.TestCase):
+    def test_timed_collects_stages_across_tasks(self):
+        async def stage(name):
+            with metrics.timed(name):
+                await asyncio.sleep(0.01)
+
+        async def run():
+            timings = metrics.start_request_timings()
+            await asyncio.gather(stage("hotel_search"), stage("hotel_search"), stage("itinerary"))
+            return timings
+
+        timings = asyncio.run(run())
+        self.assertEqual(timings["hotel_search"][1], 2)
+        self.assertEqual(timings["itinerary"][1], 1)
+        header = metrics.server_timing_header(timings, total=0.05)
+        self.assertRegex(header, r'^hotel_search;dur=\d+\.\d;desc="2 calls", itinerary;dur=\d+\.\d, total;dur=50\.0$')
+
+
+if __name__ == '__main__':
+    unittest.main()
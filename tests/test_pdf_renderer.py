@@ -0,0 +1,76 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import pdf_renderer
+from pdf_renderer import PdfRenderer, build_itinerary_html
+
+
+class TestPdfRenderer(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.renders = 0
+
+    def fake_from_string(self, html_full, output_path, configuration=None, options=None):
+        with self.lock:
+            self.renders += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return b"%PDF-" + html_full.encode("utf-8")[-16:]
+
+    def render_all(self, renderer, docs):
+        async def run():
+            return await asyncio.gather(*(renderer.render(markdown_text, title) for markdown_text, title in docs))
+
+        with patch("pdfkit.from_string", self.fake_from_string), \
+                patch.object(pdf_renderer, "wkhtmltopdf_configuration", lambda: None):
+            try:
+                return asyncio.run(run())
+            finally:
+                renderer.shutdown()
+
+    def test_html_has_no_remote_font_and_wraps_emoji(self):
+        with patch.object(pdf_renderer, "PDF_EMOJI_FONT_PATH", os.path.abspath(__file__)):
+            html_full = build_itinerary_html("# Day 1 🏖️", "Trip <Goa>")
+        self.assertNotIn("fonts.googleapis.com", html_full)
+        self.assertIn(f"url('file://{os.path.abspath(__file__)}')", html_full)
+        self.assertIn('<span class="emoji">🏖</span>', html_full)
+        self.assertIn("<title>Trip &lt;Goa&gt;</title>", html_full)
+
+    def test_missing_font_file_falls_back_to_remote_stylesheet(self):
+        with patch.object(pdf_renderer, "PDF_EMOJI_FONT_PATH", "/nonexistent/NotoEmoji-Regular.ttf"):
+            html_full = build_itinerary_html("# Day 1", "Trip")
+            with patch.object(pdf_renderer, "PDF_EMOJI_FONT_URL", ""):
+                offline = build_itinerary_html("# Day 1", "Trip")
+        self.assertIn('<link href="https://fonts.googleapis.com/css2?family=Noto+Emoji:wght@400" rel="stylesheet">', html_full)
+        self.assertNotIn("fonts.googleapis.com", offline)
+
+    def test_renders_are_bounded_cached_and_coalesced(self):
+        renderer = PdfRenderer(workers=2, cache_entries=8)
+        docs = [(f"# Day {i}", "Trip") for i in range(6)] + [("# Day 0", "Trip")] * 3
+        results = self.render_all(renderer, docs)
+        self.assertEqual(self.renders, 6)
+        self.assertEqual(self.max_active, 2)
+        self.assertEqual(results[0], results[-1])
+
+        again = self.render_all(renderer, [("# Day 1", "Trip")])
+        self.assertEqual(self.renders, 6)
+        self.assertEqual(again[0], results[1])
+        self.assertEqual(renderer.stats["cache_hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
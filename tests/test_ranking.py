@@ -0,0 +1,105 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import unittest
+
+from common import FlightInfo, HotelInfo, LayoverInfo
+import numpy as np
+
+from ranking import DEFAULT_FLIGHT_WEIGHTS, pareto_front, parse_weights, prune_flights, prune_hotels, rank_flights, rank_hotels
+
+
+def make_flight(price, duration, stops="Nonstop", layovers=(), returns=()):
+    return FlightInfo(
+        airline="Air", price=price, duration=duration, stops=stops, departure="DEL", arrival="GOI",
+        travel_class="Economy", return_date="2024-07-05", airline_logo="",
+        layovers=[LayoverInfo(airport="BOM", airport_id="BOM", duration=d) for d in layovers],
+        return_flights=[
+            {
+                "airline": "Air", "price": p, "duration": d, "stops": s, "departure": "GOI", "arrival": "DEL",
+                "travel_class": "Economy",
+                "layovers": [{"airport": "BOM", "airport_id": "BOM", "duration": 60}] if s != "Nonstop" else []
+            }
+            for p, d, s in returns
+        ]
+    )
+
+
+class TestRanking(unittest.TestCase):
+    def test_rank_flights_uses_round_trip_combination(self):
+        flights = [
+            make_flight(5000, 300, "1 stop(s)", layovers=[120], returns=[(12000, 150, "Nonstop")]),
+            make_flight(5500, 140, returns=[(15000, 320, "1 stop(s)"), (11000, 150, "Nonstop")]),
+        ]
+        self.assertEqual(rank_flights(flights), (1, 1))
+        # Price only: cheapest round trip wins
+        self.assertEqual(rank_flights(flights, {"price": 1.0}), (1, 1))
+        # Duration only: departure 1 with its shorter return
+        self.assertEqual(rank_flights(flights, {"duration": 1.0}), (1, 1))
+        self.assertEqual(rank_flights([]), (0, 0))
+
+    def test_rank_flights_without_returns_and_ties_are_deterministic(self):
+        flights = [make_flight(5000, 150), make_flight(5000, 150), make_flight(4000, 400, "2 stop(s)", layovers=[60, 60])]
+        self.assertEqual(rank_flights(flights), (0, 0))
+        self.assertEqual(rank_flights(flights, {"price": 1.0}), (2, 0))
+
+    def test_rank_hotels_unknown_values_rank_worst(self):
+        hotels = [
+            HotelInfo(name="Free?", price=0, rating=9.5, location="", link=""),
+            HotelInfo(name="Budget", price=2000, rating=7.0, location="", link=""),
+            HotelInfo(name="Value", price=2500, rating=9.0, location="", link=""),
+            HotelInfo(name="Unrated", price=1500, rating=0, location="", link=""),
+            HotelInfo(name="Luxury", price=5000, rating=9.2, location="", link=""),
+        ]
+        self.assertEqual(rank_hotels(hotels), 2)
+        self.assertEqual(rank_hotels(hotels, {"price": 1.0}), 3)
+        self.assertEqual(rank_hotels([]), 0)
+
+    def test_parse_weights(self):
+        weights = parse_weights("price=0.8, duration=0.2,bogus=1,stops=x", DEFAULT_FLIGHT_WEIGHTS)
+        self.assertEqual(weights, {"price": 0.8, "duration": 0.2, "stops": 0.15, "layovers": 0.1})
+
+
+class TestParetoPruning(unittest.TestCase):
+    def test_pareto_front(self):
+        costs = [[1, 5], [2, 2], [3, 3], [5, 1], [2, 2], [6, 6]]
+        self.assertEqual(pareto_front(costs).tolist(), [True, True, False, True, True, False])
+        self.assertEqual(pareto_front(np.empty((0, 2))).tolist(), [])
+
+    def test_pareto_front_matches_pairwise_check(self):
+        costs = np.random.default_rng(7).integers(0, 40, size=(1200, 3))
+        expected = [
+            not any((other <= row).all() and (other < row).any() for other in costs)
+            for row in costs[:200]
+        ]
+        self.assertEqual(pareto_front(costs)[:200].tolist(), expected)
+
+    def test_prune_hotels_keeps_order_and_treats_unknown_as_worst(self):
+        hotels = [
+            HotelInfo(name="Overpriced", price=6000, rating=8.0, location="", link=""),
+            HotelInfo(name="Budget", price=2000, rating=7.0, location="", link=""),
+            HotelInfo(name="Value", price=2500, rating=9.0, location="", link=""),
+            HotelInfo(name="Unrated", price=2200, rating=0, location="", link=""),
+            HotelInfo(name="Luxury", price=5000, rating=9.2, location="", link=""),
+        ]
+        self.assertEqual([h.name for h in prune_hotels(hotels)], ["Budget", "Value", "Luxury"])
+
+    def test_prune_flights_drops_dominated_combinations(self):
+        flights = [
+            make_flight(5000, 300, "1 stop(s)", returns=[(12000, 150, "Nonstop"), (13000, 200, "Nonstop")]),
+            make_flight(5500, 140, returns=[(15000, 320, "1 stop(s)"), (11000, 150, "Nonstop")]),
+            make_flight(9000, 1000),
+        ]
+        pruned = prune_flights(flights)
+        self.assertEqual(len(pruned), 2)
+        self.assertEqual(pruned[0].return_flights, [flights[1].return_flights[1]])
+        self.assertIs(pruned[1], flights[2])
+        # The input flights are not modified
+        self.assertEqual(len(flights[1].return_flights), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
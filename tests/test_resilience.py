@@ -0,0 +1,149 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import unittest
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import httpx
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpen, backoff_delay, is_transient, retry_after_hint
+
+
+def rate_limited(retry_after=None):
+    request = httpx.Request("GET", "https://serpapi.com/search")
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return httpx.HTTPStatusError("429", request=request, response=httpx.Response(429, headers=headers, request=request))
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyUpstream:
+    """Raises the queued errors in order, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(resilience, "RETRY_BASE_DELAY", 0.001)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transient_failures_are_retried(self):
+        breaker = CircuitBreaker("serpapi", failure_threshold=5)
+        upstream = FlakyUpstream(ConnectionError("reset"), asyncio.TimeoutError())
+
+        self.assertEqual(asyncio.run(breaker.call(upstream, retries=2)), "ok")
+        self.assertEqual(upstream.calls, 3)
+        self.assertEqual(breaker.get_stats()["retries"], 2)
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.failures, 0)
+
+    def test_client_errors_are_not_retried_or_counted(self):
+        breaker = CircuitBreaker("apify", failure_threshold=1)
+        upstream = FlakyUpstream(UpstreamError(401))
+
+        with self.assertRaises(UpstreamError):
+            asyncio.run(breaker.call(upstream, retries=3))
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(breaker.state, "closed")
+
+    def test_retry_on_narrows_retries(self):
+        breaker = CircuitBreaker("apify", failure_threshold=5)
+        upstream = FlakyUpstream(asyncio.TimeoutError())
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(breaker.call(upstream, retries=2, retry_on=lambda e: not isinstance(e, asyncio.TimeoutError)))
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(breaker.failures, 1)
+
+    def test_retry_after_longer_than_the_max_delay_is_not_retried(self):
+        breaker = CircuitBreaker("serpapi", failure_threshold=5)
+        upstream = FlakyUpstream(rate_limited("120"))
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(breaker.call(upstream, retries=2))
+        self.assertEqual(upstream.calls, 1)
+        self.assertEqual(breaker.failures, 1)
+
+    def test_open_breaker_fails_fast_then_lets_one_trial_through(self):
+        breaker = CircuitBreaker("llm", failure_threshold=2, reset_timeout=0.05)
+        upstream = FlakyUpstream(UpstreamError(503), UpstreamError(503))
+
+        async def run():
+            for _ in range(2):
+                with self.assertRaises(UpstreamError):
+                    await breaker.call(upstream)
+            self.assertEqual(breaker.state, "open")
+            with self.assertRaises(CircuitOpen) as rejected:
+                await breaker.call(upstream, retries=3)
+            self.assertGreater(rejected.exception.retry_after, 0)
+            self.assertEqual(upstream.calls, 2)
+
+            await asyncio.sleep(0.06)
+            return await breaker.call(upstream)
+
+        self.assertEqual(asyncio.run(run()), "ok")
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.get_stats()["rejected"], 1)
+
+    def test_failed_trial_reopens_and_concurrent_calls_are_rejected(self):
+        breaker = CircuitBreaker("llm", failure_threshold=1, reset_timeout=0.02)
+
+        async def slow_failure():
+            await asyncio.sleep(0.02)
+            raise UpstreamError(500)
+
+        async def run():
+            with self.assertRaises(UpstreamError):
+                await breaker.call(slow_failure)
+            await asyncio.sleep(0.03)
+            results = await asyncio.gather(breaker.call(slow_failure), breaker.call(slow_failure), return_exceptions=True)
+            return [type(result) for result in results]
+
+        self.assertEqual(asyncio.run(run()), [UpstreamError, CircuitOpen])
+        self.assertEqual(breaker.state, "open")
+
+    def test_backoff_is_jittered_and_capped(self):
+        with patch.object(resilience, "RETRY_BASE_DELAY", 1.0), patch.object(resilience, "RETRY_MAX_DELAY", 3.0):
+            delays = [backoff_delay(attempt) for attempt in range(6) for _ in range(20)]
+        self.assertTrue(all(0 <= delay <= 3.0 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+
+    def test_transient_classification(self):
+        self.assertTrue(is_transient(asyncio.TimeoutError()))
+        self.assertTrue(is_transient(UpstreamError(429)))
+        self.assertTrue(is_transient(UpstreamError(502)))
+        self.assertFalse(is_transient(UpstreamError(404)))
+        self.assertFalse(is_transient(ValueError("bad payload")))
+
+    def test_retry_after_hint_parses_seconds_and_dates(self):
+        later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        self.assertEqual(retry_after_hint(rate_limited("2")), 2.0)
+        self.assertAlmostEqual(retry_after_hint(rate_limited(later)), 30, delta=2)
+        self.assertIsNone(retry_after_hint(rate_limited()))
+        self.assertIsNone(retry_after_hint(rate_limited("soon")))
+        self.assertIsNone(retry_after_hint(UpstreamError(429)))
+
+
+if __name__ == '__main__':
+    unittest.main()
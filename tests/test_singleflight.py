@@ -0,0 +1,97 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import asyncio
+import unittest
+
+from common import HotelRequest
+from singleflight import SingleFlight, coalesce, prefetch, start_prefetching
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_identical_calls_share_one_upstream_call(self):
+        group = SingleFlight()
+        calls = []
+
+        @coalesce(group)
+        async def search(request):
+            calls.append(request.location)
+            await asyncio.sleep(0.01)
+            return [request.location]
+
+        async def run():
+            goa = HotelRequest(location="Goa", check_in_date="2024-07-01", check_out_date="2024-07-05")
+            pune = HotelRequest(location="Pune", check_in_date="2024-07-01", check_out_date="2024-07-05")
+            return await asyncio.gather(*([search(goa) for _ in range(5)] + [search(pune)]))
+
+        results = asyncio.run(run())
+        self.assertEqual(sorted(calls), ["Goa", "Pune"])
+        self.assertEqual(results[:5], [["Goa"]] * 5)
+        self.assertEqual(group.get_stats(), {"calls": 6, "coalesced": 4, "in_flight": 0})
+
+    def test_error_propagates_to_all_waiters_and_is_not_remembered(self):
+        group = SingleFlight()
+        attempts = 0
+
+        async def failing():
+            nonlocal attempts
+            attempts += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream down")
+
+        async def run():
+            results = await asyncio.gather(*(group.do("k", failing) for _ in range(3)), return_exceptions=True)
+            await asyncio.gather(group.do("k", failing), return_exceptions=True)
+            return results
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(r, ValueError) for r in results))
+        self.assertEqual(attempts, 2)
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        group = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        async def run():
+            first = asyncio.create_task(group.do("k", slow))
+            second = asyncio.create_task(group.do("k", slow))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(run()), "ok")
+
+    def test_prefetched_call_is_reused_within_the_request(self):
+        group = SingleFlight()
+        calls = []
+
+        @coalesce(group)
+        async def search(request):
+            calls.append(request.location)
+            await asyncio.sleep(0.01)
+            return [request.location]
+
+        goa = HotelRequest(location="Goa", check_in_date="2024-07-01", check_out_date="2024-07-05")
+
+        async def run():
+            prefetched = start_prefetching()
+            prefetch(search, goa)
+            # Let the prefetch finish before the "real" call, as when the plan streams ahead
+            await asyncio.sleep(0.05)
+            result = await search(goa)
+            return prefetched, result
+
+        prefetched, result = asyncio.run(run())
+        self.assertEqual(result, ["Goa"])
+        self.assertEqual(calls, ["Goa"])
+        self.assertEqual(len(prefetched), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import warnings
+warnings.filterwarnings("ignore")
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import json
+import unittest
+
+from trip_plan_parser import TripPlanStreamParser
+
+PLAN = {
+    "origin": "DEL",
+    "destination": "GOI",
+    "outbound_date": "2025-01-10",
+    "return_date": "2025-01-15",
+    "hotel_areas": [
+        {"location": "Calangute", "check_in_date": "2025-01-10", "check_out_date": "2025-01-13"},
+        {"location": "Panaji \"Old\" Town", "check_in_date": "2025-01-13", "check_out_date": "2025-01-15"}
+    ],
+    "day_plan": [
+        {"date": "2025-01-11", "activities": ["Beach {sunset}", "origin: market"], "origin": "ignored"}
+    ]
+}
+
+
+class TestTripPlanStreamParser(unittest.TestCase):
+    def test_parts_complete_before_the_day_plan_streams(self):
+        text = "```json\n" + json.dumps(PLAN, indent=2) + "\n```"
+        parser = TripPlanStreamParser()
+        seen = []
+        # One character at a time: the worst case for chunk boundaries
+        for i, ch in enumerate(text):
+            for kind, value in parser.feed(ch):
+                seen.append((kind, value, i))
+
+        self.assertEqual([kind for kind, _, _ in seen], ["flight", "hotel_area", "hotel_area"])
+        self.assertEqual(seen[0][1], {"origin": "DEL", "destination": "GOI", "outbound_date": "2025-01-10", "return_date": "2025-01-15"})
+        self.assertEqual(seen[2][1]["location"], 'Panaji "Old" Town')
+        day_plan_start = text.index('"day_plan"')
+        self.assertTrue(all(position < day_plan_start for _, _, position in seen))
+
+    def test_incomplete_or_invalid_parts_are_skipped(self):
+        parser = TripPlanStreamParser()
+        events = parser.feed('{"origin": "DEL", "destination": "GOI", "hotel_areas": [{"location": "Baga"}, ')
+        events += parser.feed('{"location": "Calangute", "check_in_date": "2025-01-10", "check_out_date": "2025-01-13"}]')
+        self.assertEqual(events, [("hotel_area", {"location": "Calangute", "check_in_date": "2025-01-10", "check_out_date": "2025-01-13"})])
+
+
+if __name__ == '__main__':
+    unittest.main()
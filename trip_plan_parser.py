@@ -0,0 +1,114 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Top-level fields needed to start the flight search
+FLIGHT_FIELDS = ("origin", "destination", "outbound_date", "return_date")
+# Fields a hotel_areas entry needs to start its hotel search
+HOTEL_AREA_FIELDS = ("location", "check_in_date", "check_out_date")
+
+
+# ==============================================
+# 🧩 Incremental Trip-Plan Parser
+# ==============================================
+class TripPlanStreamParser:
+    """
+    Parses the trip planner's JSON output while it is still streaming.
+
+    Feed text chunks as they arrive; `feed` returns the parts of the plan that
+    became complete with that chunk:
+    - ("flight", {"origin", "destination", "outbound_date", "return_date"}) once all four are known
+    - ("hotel_area", {"location", "check_in_date", "check_out_date"}) for each finished hotel_areas entry
+    Anything before the first "{" (e.g. a ```json fence) and after the root object is ignored.
+    The full output is still parsed normally once the call returns; this only lets
+    work start early.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.hotel_areas = []
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None            # current key of the root object
+        self._after_colon = False   # in the root object: next string is a value, not a key
+        self._element_start = None  # start of the hotel_areas entry being read
+        self._flight_sent = False
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            if self._finished:
+                break
+            ch = text[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._root_string(text[self._string_start:i + 1], completed)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if ch == "{" and self._depth == 3 and self._key == "hotel_areas":
+                    self._element_start = i
+            elif ch in "}]":
+                if ch == "}" and self._depth == 3 and self._element_start is not None:
+                    self._hotel_area(text[self._element_start:i + 1], completed)
+                    self._element_start = None
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finished = True
+            elif self._depth == 1:
+                if ch == ":":
+                    self._after_colon = True
+                elif ch == ",":
+                    self._after_colon = False
+                    self._key = None
+        self._pos = len(text)
+        return completed
+
+    def _root_string(self, literal, completed):
+        try:
+            value = json.loads(literal)
+        except ValueError:
+            return
+        if not self._after_colon:
+            self._key = value
+            return
+        if self._key in FLIGHT_FIELDS:
+            self.fields[self._key] = value
+            if not self._flight_sent and all(self.fields.get(f) for f in FLIGHT_FIELDS):
+                self._flight_sent = True
+                completed.append(("flight", {f: self.fields[f] for f in FLIGHT_FIELDS}))
+
+    def _hotel_area(self, literal, completed):
+        try:
+            area = json.loads(literal)
+        except ValueError:
+            logger.warning("Could not parse streamed hotel area, it will be searched after the plan completes")
+            return
+        if isinstance(area, dict) and all(isinstance(area.get(f), str) and area.get(f) for f in HOTEL_AREA_FIELDS):
+            self.hotel_areas.append(area)
+            completed.append(("hotel_area", {f: area[f] for f in HOTEL_AREA_FIELDS}))